@@ -176,6 +176,14 @@ public class GatewayConfig {
                         .filters(f -> f.setRequestHeader("X-Gateway-Source", "api-gateway"))
                         .uri(orchestrationServiceUrl))
 
+                // Streaming orchestration (server-sent events) - Direct to orchestration service
+                .route("orchestration_agent_stream", r -> r
+                        .path("/api/v1/agents/orchestrate/stream")
+                        .and()
+                        .method(HttpMethod.POST)
+                        .filters(f -> f.setRequestHeader("X-Gateway-Source", "api-gateway"))
+                        .uri(orchestrationServiceUrl))
+
                 // Orchestration health check
                 .route("orchestration_agent_health", r -> r
                         .path("/api/v1/agents/orchestrate/health")
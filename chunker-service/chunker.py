@@ -15,9 +15,15 @@ from transformers import AutoTokenizer, AutoModel
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Embeddings are tagged with "<model name>@<revision>" so stored vectors from different
+# models are never compared; bump the revision when the model weights or pooling change
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "DeepMount00/Anita")
+EMBEDDING_MODEL_REVISION = os.getenv("EMBEDDING_MODEL_REVISION", "v1")
+
 class ModelEmbeddings:
     def __init__(self):
-        self.model_name = "DeepMount00/Anita"
+        self.model_name = EMBEDDING_MODEL_NAME
+        self.model_id = f"{EMBEDDING_MODEL_NAME}@{EMBEDDING_MODEL_REVISION}"
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
         logger.info(f"Loading model: {self.model_name} on {self.device}")
@@ -65,7 +71,8 @@ class Embedder:
     def __init__(self):
         self.model_embedder = ModelEmbeddings()
         self.embedding_size = self.model_embedder.embedding_size
-        logger.info(f"Embedder initialized with embedding size: {self.embedding_size}")
+        self.model_id = self.model_embedder.model_id
+        logger.info(f"Embedder initialized with embedding size: {self.embedding_size} ({self.model_id})")
 
     def get_embedding(self, text: str) -> List[float]:
         embedding = self.model_embedder.embed_query(text)
@@ -252,7 +259,7 @@ async def chunk_file(file: UploadFile = File(...)):
         temp_path = tmp.name
     try:
         chunks = chunker_instance.chunk_text(temp_path)
-        return {"chunks": chunks}
+        return {"chunks": chunks, "model_id": chunker_instance.embedder.model_id}
     finally:
         os.remove(temp_path)
 
@@ -262,15 +269,29 @@ async def embed_query(req: Dict[str, str]):
     if not query_text:
         raise HTTPException(status_code=400, detail="Query text is missing.")
     try:
-        embedding = Chunker.get_instance().embedder.get_embedding(query_text)
-        return {"embedding": embedding}
+        embedder = Chunker.get_instance().embedder
+        embedding = embedder.get_embedding(query_text)
+        return {"embedding": embedding, "model_id": embedder.model_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get embedding: {str(e)}")
 
 
+@app.post("/embed")
+async def embed_texts(req: Dict[str, List[str]]):
+    """Embed a batch of texts (used to re-embed stored chunks after a model change)"""
+    texts = req.get("texts")
+    if not texts:
+        raise HTTPException(status_code=400, detail="Texts are missing.")
+    try:
+        embedder = Chunker.get_instance().embedder
+        return {"embeddings": embedder.get_embeddings(texts), "model_id": embedder.model_id}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get embeddings: {str(e)}")
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "model_id": chunker_instance.embedder.model_id}
 
 # 🔹 questa parte serve solo se lanci a mano con `python chunker.py`
 if __name__ == "__main__":
@@ -8,7 +8,8 @@ CREATE TABLE pdf_storage (
     doc_id TEXT NOT NULL,
     file_data BYTEA NOT NULL, -- Binary PDF data
     file_size BIGINT NOT NULL,
-    content_type TEXT DEFAULT 'application/pdf'
+    content_type TEXT DEFAULT 'application/pdf',
+    content_hash TEXT -- SHA-256 of file_data, used as the HTTP ETag
 );
 
 -- Table for document metadata and plain text content
@@ -18,7 +19,12 @@ CREATE TABLE project_documents (
     project_id TEXT NOT NULL,
     doc_id TEXT NOT NULL,
     title TEXT NOT NULL,
-    content TEXT -- Plain text extracted from PDF
+    content TEXT, -- Plain text extracted from PDF
+    content_preview TEXT, -- First 500 chars of content, so listings never read the full text
+    content_hash TEXT, -- SHA-256 of content, used as the HTTP ETag
+    content_encoding TEXT DEFAULT 'plain', -- plain, or zstd (text in content_zstd, content NULL)
+    content_zstd TEXT, -- Base64 zstd frame of the text when content_encoding = 'zstd'
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
 -- Indexes for better query performance
@@ -26,6 +32,69 @@ CREATE INDEX idx_pdf_storage_user_project ON pdf_storage(user_id, project_id);
 CREATE INDEX idx_pdf_storage_composite ON pdf_storage(user_id, project_id, doc_id);
 CREATE INDEX idx_project_documents_user_project ON project_documents(user_id, project_id);
 CREATE INDEX idx_project_documents_composite ON project_documents(user_id, project_id, doc_id);
+-- Keyset pagination of document listings sorted by title or upload time
+CREATE INDEX idx_project_documents_title ON project_documents(user_id, project_id, title, doc_id);
+CREATE INDEX idx_project_documents_created ON project_documents(user_id, project_id, created_at, doc_id);
+
+-- Per-project aggregates, maintained by triggers on upload/delete so project listings
+-- never scan the user's documents
+CREATE TABLE project_summaries (
+    user_id UUID NOT NULL REFERENCES auth.users(id),
+    project_id TEXT NOT NULL,
+    document_count INTEGER NOT NULL DEFAULT 0,
+    total_bytes BIGINT NOT NULL DEFAULT 0,
+    last_updated TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, project_id)
+);
+
+CREATE OR REPLACE FUNCTION bump_project_summary(p_user_id UUID, p_project_id TEXT,
+                                                p_documents INTEGER, p_bytes BIGINT)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO project_summaries (user_id, project_id, document_count, total_bytes, last_updated)
+    VALUES (p_user_id, p_project_id, GREATEST(p_documents, 0), GREATEST(p_bytes, 0), NOW())
+    ON CONFLICT (user_id, project_id) DO UPDATE SET
+        document_count = GREATEST(project_summaries.document_count + p_documents, 0),
+        total_bytes = GREATEST(project_summaries.total_bytes + p_bytes, 0),
+        last_updated = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION project_documents_summary_trigger() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_project_summary(NEW.user_id, NEW.project_id, 1, 0);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM bump_project_summary(OLD.user_id, OLD.project_id, -1, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION pdf_storage_summary_trigger() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_project_summary(NEW.user_id, NEW.project_id, 0, NEW.file_size);
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM bump_project_summary(NEW.user_id, NEW.project_id, 0, NEW.file_size - OLD.file_size);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM bump_project_summary(OLD.user_id, OLD.project_id, 0, -OLD.file_size);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER project_documents_summary AFTER INSERT OR DELETE ON project_documents
+    FOR EACH ROW EXECUTE FUNCTION project_documents_summary_trigger();
+CREATE TRIGGER pdf_storage_summary AFTER INSERT OR UPDATE OF file_size OR DELETE ON pdf_storage
+    FOR EACH ROW EXECUTE FUNCTION pdf_storage_summary_trigger();
+
+-- Backfill for existing databases:
+-- INSERT INTO project_summaries (user_id, project_id, document_count, total_bytes)
+-- SELECT d.user_id, d.project_id, COUNT(*), COALESCE(SUM(p.file_size), 0)
+-- FROM project_documents d LEFT JOIN pdf_storage p ON p.id = d.id
+-- GROUP BY d.user_id, d.project_id
+-- ON CONFLICT (user_id, project_id) DO NOTHING;
 
 -- Optional: Table for tracking execution plans and results (if needed for persistence)
 CREATE TABLE execution_plans (
@@ -36,7 +105,8 @@ CREATE TABLE execution_plans (
     document_ids TEXT[], -- Array of document IDs
     strategy TEXT,
     status TEXT DEFAULT 'pending', -- pending, confirmed, executing, completed, failed
-    additional_instructions TEXT
+    additional_instructions TEXT,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
 CREATE TABLE execution_results (
@@ -44,7 +114,8 @@ CREATE TABLE execution_results (
     plan_id TEXT REFERENCES execution_plans(plan_id),
     agent_results JSONB, -- Store agent responses as JSON
     final_result TEXT,
-    status TEXT DEFAULT 'processing' -- processing, completed, failed
+    status TEXT DEFAULT 'processing', -- processing, completed, failed
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
 
@@ -55,12 +126,44 @@ CREATE TABLE document_chunks (
     project_id TEXT NOT NULL,
     doc_id TEXT NOT NULL,
     chunk_index INTEGER NOT NULL,
-    chunk_text TEXT NOT NULL,
+    chunk_text TEXT NOT NULL, -- Empty when the chunk is stored as offsets into the document text
+    char_start INTEGER, -- Offsets into project_documents text (compressed storage mode)
+    char_end INTEGER,
     embedding JSON NOT NULL, -- Store embedding as JSON array
     embedding_size INTEGER NOT NULL, -- Store the size for validation
+    embedding_model TEXT, -- Model that produced the embedding, e.g. DeepMount00/Anita@v1
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
 -- Indexes for better query performance
 CREATE INDEX idx_document_chunks_doc ON document_chunks(user_id, project_id, doc_id);
-CREATE INDEX idx_document_chunks_composite ON document_chunks(user_id, project_id, doc_id, chunk_index);
\ No newline at end of file
+CREATE INDEX idx_document_chunks_composite ON document_chunks(user_id, project_id, doc_id, chunk_index);
+CREATE INDEX idx_document_chunks_model ON document_chunks(embedding_model, id);
+
+-- Migration for existing databases: paginated, projection-aware document listings
+-- ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS content_preview TEXT;
+-- ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+-- UPDATE project_documents SET content_preview = left(content, 500) WHERE content_preview IS NULL;
+-- CREATE INDEX IF NOT EXISTS idx_project_documents_title ON project_documents(user_id, project_id, title, doc_id);
+-- CREATE INDEX IF NOT EXISTS idx_project_documents_created ON project_documents(user_id, project_id, created_at, doc_id);
+
+-- Migration for existing databases: content hashes for ETags
+-- (rows without a hash are hashed on read, so no backfill is required)
+-- ALTER TABLE pdf_storage ADD COLUMN IF NOT EXISTS content_hash TEXT;
+-- ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Migration for existing databases: compressed text storage (TEXT_STORAGE_MODE=compressed)
+-- ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS content_encoding TEXT DEFAULT 'plain';
+-- ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS content_zstd TEXT;
+-- ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS char_start INTEGER;
+-- ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS char_end INTEGER;
+
+-- Migration for existing databases: embedding model versioning
+-- ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_model TEXT;
+-- UPDATE document_chunks SET embedding_model = 'DeepMount00/Anita@v1' WHERE embedding_model IS NULL;
+-- CREATE INDEX IF NOT EXISTS idx_document_chunks_model ON document_chunks(embedding_model, id);
+
+-- Migration for existing databases: persisted orchestration runs
+-- (the orchestration agent uses the execution id as plan_id and stores the planned actions as JSON in strategy)
+-- ALTER TABLE execution_plans ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+-- ALTER TABLE execution_results ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
@@ -0,0 +1,271 @@
+"""
+Async dispatch layer over DatabaseManager
+The Supabase client is synchronous, so every call runs on a bounded thread pool
+(sharing the client's underlying HTTP connection pool) instead of the event loop.
+Each call gets a timeout and is recorded in per-method metrics.
+Document reads (text, chunks, PDF bytes, content hashes) go through a DocumentCache,
+invalidated on writes; reads that overlap a write of their document are not cached.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from cache import DocumentCache
+from database import DatabaseManager
+
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "16"))
+DB_CALL_TIMEOUT_SECONDS = float(os.getenv("DB_CALL_TIMEOUT_SECONDS", "30"))
+
+
+class DatabaseTimeoutError(Exception):
+    """Raised when a database call does not finish within its timeout"""
+
+
+class CallMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        completed = self.calls - self.in_flight
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "avg_ms": round(self.total_ms / completed, 2) if completed else 0.0,
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+class AsyncDatabaseManager:
+    def __init__(self, db_manager: DatabaseManager, max_workers: int = DB_MAX_WORKERS,
+                 timeout: float = DB_CALL_TIMEOUT_SECONDS, cache: Optional[DocumentCache] = None):
+        self.db_manager = db_manager
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache = cache or DocumentCache()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._metrics: Dict[str, CallMetrics] = {}
+        # Concurrent misses for the same cache key share one database fetch
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+        # Write generations: a fetch overlapping a write of its document may have read a partial
+        # result (store_chunks upserts in batches), so it is returned but not cached
+        self._generation = 0
+        self._written_at: Dict[str, int] = {}
+        self._writing: Dict[str, int] = {}
+
+    @property
+    def available(self) -> bool:
+        return self.db_manager.available
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "timeout_seconds": self.timeout,
+            "in_flight": sum(m.in_flight for m in self._metrics.values()),
+            "methods": {name: m.to_dict() for name, m in self._metrics.items()},
+            "storage": self.db_manager.storage_stats.to_dict(),
+        }
+
+    async def _run(self, method_name: str, *args, timeout: Optional[float] = None):
+        metrics = self._metrics.setdefault(method_name, CallMetrics())
+        method = getattr(self.db_manager, method_name)
+        loop = asyncio.get_running_loop()
+
+        metrics.calls += 1
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, method, *args),
+                timeout=timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            raise DatabaseTimeoutError(f"Database call {method_name} timed out")
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            metrics.in_flight -= 1
+            metrics.total_ms += elapsed_ms
+            metrics.max_ms = max(metrics.max_ms, elapsed_ms)
+
+    def _begin_write(self, document_ids: set):
+        self._generation += 1
+        for document_id in document_ids:
+            self._writing[document_id] = self._writing.get(document_id, 0) + 1
+            self._written_at[document_id] = self._generation
+
+    def _end_write(self, document_ids: set):
+        self._generation += 1
+        for document_id in document_ids:
+            if self._writing[document_id] > 1:
+                self._writing[document_id] -= 1
+            else:
+                del self._writing[document_id]
+            self._written_at[document_id] = self._generation
+            self.cache.invalidate(document_id)
+
+    def _cacheable(self, document_id: str, generation: int) -> bool:
+        """True if no write of the document was running or started since generation"""
+        return document_id not in self._writing and self._written_at.get(document_id, 0) <= generation
+
+    async def _read_through(self, kind: str, document_id: str, method_name: str, *args):
+        cached = self.cache.get(kind, document_id)
+        if cached is not None:
+            return cached
+
+        key = (kind, document_id)
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        generation = self._generation
+        try:
+            value = await self._run(method_name, *args)
+            # Empty results are not cached: the document may still be ingesting
+            if value and self._cacheable(document_id, generation):
+                self.cache.put(kind, document_id, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unobserved failure is not reported by the event loop
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+            if not self._in_flight:
+                # No fetch left that could overlap a past write
+                self._written_at.clear()
+            if not future.done():
+                # The caller was cancelled: release the waiters instead of leaving them hanging
+                future.cancel()
+
+    async def list_user_projects(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self._run("list_user_projects", user_id)
+
+    async def store_document(self, document_id: str, user_id: str, project_id: str,
+                             doc_id: str, title: str, file_data: bytes, text_content: str) -> bool:
+        self._begin_write({document_id})
+        try:
+            return await self._run("store_document", document_id, user_id, project_id,
+                                   doc_id, title, file_data, text_content)
+        finally:
+            self._end_write({document_id})
+
+    async def get_document(self, document_id: str) -> Optional[bytes]:
+        return await self._read_through("pdf", document_id, "get_document", document_id)
+
+    async def get_file_hash(self, document_id: str) -> Optional[str]:
+        return await self._read_through("file_hash", document_id, "get_file_hash", document_id)
+
+    async def get_text_hash(self, document_id: str) -> Optional[str]:
+        return await self._read_through("text_hash", document_id, "get_text_hash", document_id)
+
+    async def get_document_text(self, document_id: str) -> Optional[str]:
+        return await self._read_through("text", document_id, "get_document_text", document_id)
+
+    async def get_all_chunks(self, user_id: str, project_id: str, doc_id: str,
+                             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        document_id = f"{user_id}_{project_id}_{doc_id}"
+        chunks = await self._read_through("chunks", document_id, "get_all_chunks",
+                                          user_id, project_id, doc_id)
+        return chunks[:limit] if limit else list(chunks)
+
+    async def get_chunks_page(self, user_id: str, project_id: str, doc_id: str,
+                              after_index: int = -1, limit: int = 50) -> List[Dict[str, Any]]:
+        document_text = None
+        if self.db_manager.codec:
+            # Offsets are resolved against the cached text instead of refetching it per page
+            document_text = await self.get_document_text(f"{user_id}_{project_id}_{doc_id}")
+        return await self._run("get_chunks_page", user_id, project_id, doc_id,
+                               after_index, limit, document_text)
+
+    async def iter_chunks(self, user_id: str, project_id: str, doc_id: str,
+                          after_index: int = -1, page_size: int = 50) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield a document's chunks in order, one keyset page at a time.
+        A cached chunk list is replayed without touching the database.
+        """
+        cached = self.cache.get("chunks", f"{user_id}_{project_id}_{doc_id}")
+        if cached is not None:
+            for chunk in cached:
+                if chunk['chunk_index'] > after_index:
+                    yield chunk
+            return
+
+        while True:
+            page = await self.get_chunks_page(user_id, project_id, doc_id, after_index, page_size)
+            for chunk in page:
+                yield chunk
+            if len(page) < page_size:
+                return
+            after_index = page[-1]['chunk_index']
+
+    async def list_project_documents(self, user_id: str, project_id: str, limit: int = 100,
+                                     after: Optional[Tuple[Any, str]] = None, sort_by: str = 'title',
+                                     descending: bool = False, preview_chars: int = 0) -> Dict[str, Any]:
+        return await self._run("list_project_documents", user_id, project_id, limit,
+                               after, sort_by, descending, preview_chars)
+
+    async def check_if_chunked(self, document_id: str) -> bool:
+        return await self._run("check_if_chunked", document_id)
+
+    async def store_chunks(self, chunks_data: List[Dict[str, Any]],
+                           progress: Optional[Callable[[int, int], None]] = None,
+                           resume: bool = False, document_text: Optional[str] = None) -> bool:
+        document_ids = {f"{c['user_id']}_{c['project_id']}_{c['doc_id']}" for c in chunks_data}
+        self._begin_write(document_ids)
+        # Storing a whole document's chunks can take much longer than a read
+        try:
+            return await self._run("store_chunks", chunks_data, progress, resume, document_text,
+                                   timeout=self.timeout * 10)
+        finally:
+            self._end_write(document_ids)
+
+    async def get_best_chunks(self, user_id: str, project_id: str, doc_id: str,
+                              query_embedding: List[float], limit: int,
+                              embedding_model: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self._run("get_best_chunks", user_id, project_id, doc_id, query_embedding,
+                               limit, embedding_model)
+
+    async def get_best_chunks_multi(self, user_id: str, project_id: str, doc_ids: List[str],
+                                    query_embedding: List[float], limit: int, global_limit: int,
+                                    embedding_model: Optional[str] = None) -> Dict[str, Any]:
+        return await self._run("get_best_chunks_multi", user_id, project_id, doc_ids, query_embedding,
+                               limit, global_limit, embedding_model)
+
+    async def count_stale_chunks(self, model_id: str) -> int:
+        return await self._run("count_stale_chunks", model_id)
+
+    async def get_stale_chunks(self, model_id: str, after_id: str = '', limit: int = 32) -> List[Dict[str, Any]]:
+        return await self._run("get_stale_chunks", model_id, after_id, limit)
+
+    async def update_chunk_embeddings(self, rows: List[Dict[str, Any]]) -> bool:
+        # Cached text and chunk lists carry no embeddings, so nothing to invalidate
+        return await self._run("update_chunk_embeddings", rows)
+
+    async def save_execution_plan(self, plan: Dict[str, Any]) -> bool:
+        return await self._run("save_execution_plan", plan)
+
+    async def save_execution_result(self, result: Dict[str, Any]) -> bool:
+        return await self._run("save_execution_result", result)
+
+    async def get_execution(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run("get_execution", execution_id)
@@ -0,0 +1,187 @@
+"""
+In-process caches for the Document Storage Service
+DocumentCache is a read-through LRU cache for document text, ordered chunk lists,
+PDF bytes and content hashes, bounded by bytes and optionally zstd-compressed.
+QueryEmbeddingCache keeps recent query embeddings per model, bounded by entries and age.
+"""
+
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+DOC_CACHE_MAX_BYTES = int(os.getenv("DOC_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DOC_CACHE_COMPRESSION = os.getenv("DOC_CACHE_COMPRESSION", "none").lower()  # none, zstd
+DOC_CACHE_ZSTD_LEVEL = int(os.getenv("DOC_CACHE_ZSTD_LEVEL", "3"))
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+QUERY_EMBED_CACHE_TTL_SECONDS = float(os.getenv("QUERY_EMBED_CACHE_TTL_SECONDS", "3600"))
+
+# How each kind of cached value is restored from its compressed form (others are JSON)
+BYTES_KINDS = {"pdf"}
+TEXT_KINDS = {"text", "file_hash", "text_hash"}
+
+
+class DocumentCache:
+    """LRU cache keyed by (kind, document_id), evicting by total stored bytes"""
+
+    def __init__(self, max_bytes: int = DOC_CACHE_MAX_BYTES, compression: str = DOC_CACHE_COMPRESSION):
+        self.max_bytes = max_bytes
+        self.compress = compression == "zstd" and ZSTD_AVAILABLE
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            print("⚠️ zstandard not installed, document cache stores values uncompressed")
+        self._compressor = zstandard.ZstdCompressor(level=DOC_CACHE_ZSTD_LEVEL) if self.compress else None
+        self._decompressor = zstandard.ZstdDecompressor() if self.compress else None
+
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, int]]" = OrderedDict()
+        self._keys_by_document: Dict[str, Set[Tuple[str, str]]] = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _encode(self, value: Any) -> Tuple[Any, int]:
+        if isinstance(value, bytes):
+            raw = value
+        elif isinstance(value, str):
+            raw = value.encode('utf-8')
+        else:
+            raw = json.dumps(value).encode('utf-8')
+        if self.compress:
+            payload = self._compressor.compress(raw)
+            return payload, len(payload)
+        return value, len(raw)
+
+    def _decode(self, kind: str, payload: Any) -> Any:
+        if not self.compress:
+            return payload
+        raw = self._decompressor.decompress(payload)
+        if kind in BYTES_KINDS:
+            return raw
+        if kind in TEXT_KINDS:
+            return raw.decode('utf-8')
+        return json.loads(raw)
+
+    def get(self, kind: str, document_id: str) -> Optional[Any]:
+        key = (kind, document_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._decode(kind, entry[0])
+
+    def put(self, kind: str, document_id: str, value: Any):
+        key = (kind, document_id)
+        payload, size = self._encode(value)
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (payload, size)
+        self._keys_by_document.setdefault(document_id, set()).add(key)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, document_id: str):
+        """Drop every cached value of a document (called on writes)"""
+        keys = self._keys_by_document.pop(document_id, set())
+        for key in keys:
+            self._remove(key)
+        if keys:
+            self.invalidations += 1
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.current_bytes -= entry[1]
+        keys = self._keys_by_document.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_document[key[1]]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "compression": "zstd" if self.compress else "none",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query for caching: NFC, trimmed, single spaces"""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', query)).strip()
+
+
+class QueryEmbeddingCache:
+    """LRU cache of query embeddings keyed by (model_id, normalized query), with a TTL"""
+
+    def __init__(self, max_entries: int = QUERY_EMBED_CACHE_SIZE,
+                 ttl_seconds: float = QUERY_EMBED_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[List[float], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, model_id: str, query: str) -> Optional[List[float]]:
+        key = (model_id, query)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[1] < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, model_id: str, query: str, embedding: List[float]):
+        key = (model_id, query)
+        self._entries[key] = (embedding, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,138 @@
+"""
+Async client for the Chunker Service
+One pooled httpx.AsyncClient is shared by the whole service (keep-alive connections,
+per-call timeouts and a cap on concurrent requests toward chunker-service).
+Query embeddings are cached, and concurrent identical queries share one chunker call.
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from cache import QueryEmbeddingCache, normalize_query
+
+CHUNKER_MAX_CONCURRENCY = int(os.getenv("CHUNKER_MAX_CONCURRENCY", "8"))
+CHUNKER_MAX_CONNECTIONS = int(os.getenv("CHUNKER_MAX_CONNECTIONS", "16"))
+CHUNKER_CONNECT_TIMEOUT = float(os.getenv("CHUNKER_CONNECT_TIMEOUT", "5"))
+CHUNK_TIMEOUT_SECONDS = float(os.getenv("CHUNK_TIMEOUT_SECONDS", "300"))  # 5 minutes for large PDFs
+EMBED_TIMEOUT_SECONDS = float(os.getenv("EMBED_TIMEOUT_SECONDS", "30"))
+# Model id assumed for responses from a chunker that does not report one
+DEFAULT_EMBEDDING_MODEL_ID = os.getenv("DEFAULT_EMBEDDING_MODEL_ID", "DeepMount00/Anita@v1")
+
+
+class ChunkerError(Exception):
+    """Raised when the chunker service cannot be reached or returns an error"""
+
+
+class ChunkerClient:
+    def __init__(self, base_url: str, max_concurrency: int = CHUNKER_MAX_CONCURRENCY,
+                 max_connections: int = CHUNKER_MAX_CONNECTIONS,
+                 query_cache: Optional[QueryEmbeddingCache] = None):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.query_cache = query_cache or QueryEmbeddingCache()
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Last embedding model reported by the chunker
+        self.model_id = DEFAULT_EMBEDDING_MODEL_ID
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            ),
+            timeout=httpx.Timeout(EMBED_TIMEOUT_SECONDS, connect=CHUNKER_CONNECT_TIMEOUT)
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        print(f"✅ Chunker client ready: {self.base_url} (max {self.max_concurrency} concurrent calls)")
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, path: str, timeout: float, **kwargs) -> Dict[str, Any]:
+        if not self._client:
+            raise ChunkerError("Chunker client not started")
+        try:
+            async with self._semaphore:
+                r = await self._client.request(
+                    method,
+                    path,
+                    timeout=httpx.Timeout(timeout, connect=CHUNKER_CONNECT_TIMEOUT),
+                    **kwargs
+                )
+        except httpx.HTTPError as e:
+            raise ChunkerError(f"Error contacting chunker service: {e}")
+
+        if r.status_code != 200:
+            raise ChunkerError(f"Chunker error: {r.text}")
+        data = r.json()
+        self.model_id = data.get("model_id") or DEFAULT_EMBEDDING_MODEL_ID
+        return data
+
+    async def _post(self, path: str, timeout: float, **kwargs) -> Dict[str, Any]:
+        return await self._request("POST", path, timeout, **kwargs)
+
+    async def chunk(self, filename: str, file_content: bytes) -> Tuple[List[Dict[str, Any]], str]:
+        """Chunk and embed a PDF, returning ([{"text", "embedding"}, ...], model_id)"""
+        data = await self._post(
+            "/chunk",
+            CHUNK_TIMEOUT_SECONDS,
+            files={"file": (filename, file_content, "application/pdf")}
+        )
+        return data.get("chunks", []), self.model_id
+
+    async def embed_query(self, query: str) -> Tuple[List[float], str]:
+        """Embed a query (normalized first), served from the cache when possible"""
+        query = normalize_query(query)
+        model_id = self.model_id
+        cached = self.query_cache.get(model_id, query)
+        if cached is not None:
+            return cached, model_id
+
+        key = (model_id, query)
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            data = await self._post("/embed-query", EMBED_TIMEOUT_SECONDS, json={"query": query})
+            embedding = data.get("embedding")
+            if not embedding:
+                raise ChunkerError("Chunker returned no embedding")
+            result = (embedding, self.model_id)
+            self.query_cache.put(self.model_id, query, embedding)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unobserved failure is not reported by the event loop
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                # The caller was cancelled: release the waiters instead of leaving them hanging
+                future.cancel()
+            del self._in_flight[key]
+
+    async def embed_texts(self, texts: List[str]) -> Tuple[List[List[float]], str]:
+        """Embed a batch of texts with the chunker's current model"""
+        data = await self._post("/embed", EMBED_TIMEOUT_SECONDS, json={"texts": texts})
+        embeddings = data.get("embeddings") or []
+        if len(embeddings) != len(texts):
+            raise ChunkerError(f"Chunker returned {len(embeddings)} embeddings for {len(texts)} texts")
+        return embeddings, self.model_id
+
+    async def get_model_id(self) -> str:
+        """Ask the chunker which embedding model it is serving"""
+        await self._request("GET", "/health", EMBED_TIMEOUT_SECONDS)
+        return self.model_id
@@ -1,27 +1,101 @@
 import base64
-from typing import List, Optional, Dict, Any
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Dict, Any, Tuple
 import numpy as np
+from text_codec import TEXT_STORAGE_MODE, StorageStats, TextCodec, locate_chunks
 try:
     from supabase import create_client, Client
     SUPABASE_AVAILABLE = True
 except ImportError:
     SUPABASE_AVAILABLE = False
 
-
-def cosine_similarity(v1, v2):
-            """Calcola la similarità del coseno tra due vettori."""
-            dot_product = np.dot(v1, v2)
-            norm_v1 = np.linalg.norm(v1)
-            norm_v2 = np.linalg.norm(v2)
-            if norm_v1 == 0 or norm_v2 == 0:
-                return 0
-            return dot_product / (norm_v1 * norm_v2)
+# Chunk inserts are split into batches bounded by their JSON size, a few in flight at once
+CHUNK_BATCH_MAX_BYTES = int(os.getenv("CHUNK_BATCH_MAX_BYTES", str(2 * 1024 * 1024)))
+CHUNK_BATCH_CONCURRENCY = int(os.getenv("CHUNK_BATCH_CONCURRENCY", "4"))
+CHUNK_BATCH_RETRIES = int(os.getenv("CHUNK_BATCH_RETRIES", "3"))
+
+# Rows fetched per request when scanning chunk embeddings (PostgREST caps rows per response)
+QUERY_SCAN_PAGE_SIZE = int(os.getenv("QUERY_SCAN_PAGE_SIZE", "1000"))
+
+# Leading characters of the extracted text stored alongside it for document listings
+CONTENT_PREVIEW_CHARS = 500
+DOCUMENT_SORT_FIELDS = ('title', 'doc_id', 'created_at')
+
+
+def encode_cursor(sort_value: Any, doc_id: str) -> str:
+    """Opaque keyset cursor pointing after (sort_value, doc_id)"""
+    raw = json.dumps([sort_value, doc_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """Inverse of encode_cursor. Raises ValueError on a malformed cursor"""
+    try:
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return sort_value, doc_id
+
+
+def _postgrest_quote(value: Any) -> str:
+    """Quote a value for use inside a PostgREST or=(...) filter"""
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
+def batch_by_bytes(rows: List[Dict[str, Any]], max_bytes: int) -> List[List[Dict[str, Any]]]:
+    """Split rows into batches whose serialized JSON size stays under max_bytes"""
+    batches = []
+    current = []
+    current_bytes = 0
+    for row in rows:
+        row_bytes = len(json.dumps(row, separators=(',', ':')))
+        if current and current_bytes + row_bytes > max_bytes:
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(row)
+        current_bytes += row_bytes
+    if current:
+        batches.append(current)
+    return batches
+
+
+def cosine_similarities(query_embedding: List[float], embeddings: np.ndarray) -> np.ndarray:
+    """Cosine similarity of one query against every row of an (n, dim) matrix, in one pass"""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query)
+    dots = embeddings @ query
+    return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if scores.size > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
 
 
 class DatabaseManager:
     def __init__(self):
         self.supabase: Optional[Client] = None
         self.available = False
+        self.storage_stats = StorageStats()
+        self.codec: Optional[TextCodec] = None
+        if TEXT_STORAGE_MODE == 'compressed':
+            self.codec = TextCodec()
+            if not self.codec.available:
+                print("⚠️ zstandard not installed, storing document text uncompressed")
+                self.codec = None
         self._initialize_client()
 
     def _initialize_client(self):
@@ -43,10 +117,29 @@ class DatabaseManager:
             self.available = False
 
     def list_user_projects(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get all projects for a user (derived from documents)"""
+        """Get all projects for a user from the trigger-maintained project_summaries table"""
         if not self.available:
             return []
 
+        try:
+            result = self.supabase.table('project_summaries').select(
+                'project_id, document_count, total_bytes, last_updated'
+            ).eq('user_id', user_id).gt('document_count', 0).order('last_updated', desc=True).execute()
+
+            return [
+                {
+                    'project_id': row['project_id'],
+                    'document_count': row['document_count'],
+                    'total_bytes': row['total_bytes'],
+                    'last_updated': row['last_updated']
+                } for row in result.data
+            ]
+        except Exception as e:
+            print(f"List project summaries error, falling back to document scan: {e}")
+            return self._list_user_projects_from_documents(user_id)
+
+    def _list_user_projects_from_documents(self, user_id: str) -> List[Dict[str, Any]]:
+        """Derive projects by scanning the user's documents (before project_summaries exists)"""
         try:
             # Get distinct project_ids for the user with document counts
             result = self.supabase.table('project_documents').select(
@@ -80,40 +173,43 @@ class DatabaseManager:
             return False
 
         try:
-            # Clean text content to remove problematic characters
-            if text_content:
-                # Remove null characters and other problematic Unicode characters
-                text_content = text_content.replace('\u0000', '').replace('\x00', '')
-                # Remove other problematic control characters except newlines and tabs
-                import re
-                text_content = re.sub(r'[\x01-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', text_content)
-                text_content = text_content.strip()
-            
+            # text_content is already sanitized by the ingestion pipeline (PDFProcessor)
             # Convert bytes to base64 for JSON storage
             file_data_b64 = base64.b64encode(file_data).decode('utf-8')
 
-            # Store binary PDF data
-            self.supabase.table('pdf_storage').insert({
+            # Store binary PDF data (upsert so a retried ingestion stage is idempotent)
+            self.supabase.table('pdf_storage').upsert({
                 'id': document_id,
                 'user_id': user_id,
                 'project_id': project_id,
                 'doc_id': doc_id,
                 'file_data': file_data_b64,
                 'file_size': len(file_data),
+                'content_hash': hashlib.sha256(file_data).hexdigest(),
                 'content_type': 'application/pdf'
             }).execute()
 
-            # Store document metadata and text content
-            self.supabase.table('project_documents').insert({
+            # Store document metadata and text content (compressed in 'compressed' storage mode)
+            text_bytes = len((text_content or '').encode('utf-8'))
+            row = {
                 'id': document_id,
                 'user_id': user_id,
                 'project_id': project_id,
                 'doc_id': doc_id,
                 'title': title,
-                'content': text_content
-            }).execute()
-
-            print(f"✅ Document {document_id} stored successfully")
+                'content': text_content,
+                'content_preview': (text_content or '')[:CONTENT_PREVIEW_CHARS],
+                'content_hash': hashlib.sha256((text_content or '').encode('utf-8')).hexdigest()
+            }
+            stored_bytes = text_bytes
+            if self.codec:
+                compressed = self.codec.compress(text_content or '')
+                row.update({'content': None, 'content_zstd': compressed, 'content_encoding': 'zstd'})
+                stored_bytes = len(compressed)
+            self.supabase.table('project_documents').upsert(row).execute()
+            self.storage_stats.record_document(text_bytes, stored_bytes)
+
+            print(f"✅ Document {document_id} stored successfully (text {text_bytes} bytes, stored {stored_bytes} bytes)")
             return True
         except Exception as e:
             print(f"❌ Store error: {e}")
@@ -135,34 +231,87 @@ class DatabaseManager:
             print(f"❌ Get document error: {e}")
             return None
 
+    def get_file_hash(self, document_id: str) -> Optional[str]:
+        """SHA-256 of the stored PDF (None if missing or stored before hashes were recorded)"""
+        if not self.available:
+            return None
+
+        try:
+            result = self.supabase.table('pdf_storage').select(
+                'content_hash').eq('id', document_id).execute()
+            if result.data:
+                return result.data[0].get('content_hash')
+            return None
+        except Exception as e:
+            print(f"Get file hash error: {e}")
+            return None
+
+    def get_text_hash(self, document_id: str) -> Optional[str]:
+        """SHA-256 of the stored document text (None if missing or not recorded)"""
+        if not self.available:
+            return None
+
+        try:
+            result = self.supabase.table('project_documents').select(
+                'content_hash').eq('id', document_id).execute()
+            if result.data:
+                return result.data[0].get('content_hash')
+            return None
+        except Exception as e:
+            print(f"Get text hash error: {e}")
+            return None
+
+    def _decode_content(self, row: Dict[str, Any]) -> Optional[str]:
+        if row.get('content_encoding') == 'zstd':
+            if not self.codec:
+                raise RuntimeError("Document text is zstd-compressed but TEXT_STORAGE_MODE is not 'compressed'")
+            started = time.perf_counter()
+            text = self.codec.decompress(row['content_zstd'])
+            self.storage_stats.record_decompression(started)
+            return text
+        return row['content']
+
     def get_document_text(self, document_id: str) -> Optional[str]:
         if not self.available:
             return None
 
         try:
+            columns = 'content, content_encoding, content_zstd' if self.codec else 'content'
             result = self.supabase.table('project_documents').select(
-                'content').eq('id', document_id).execute()
+                columns).eq('id', document_id).execute()
             if result.data:
-                return result.data[0]['content']
+                return self._decode_content(result.data[0])
             return None
         except Exception as e:
             print(f"Get text error: {e}")
             return None
 
+    def _resolve_chunk_texts(self, chunks: List[Dict[str, Any]], document_id: str,
+                             text_key: str = 'chunk_text', document_text: Optional[str] = None):
+        """Fill in chunk text stored as offsets into the document text"""
+        if not any(not c.get(text_key) and c.get('char_start') is not None for c in chunks):
+            return
+        text = document_text if document_text is not None else self.get_document_text(document_id) or ''
+        for chunk in chunks:
+            if not chunk.get(text_key) and chunk.get('char_start') is not None:
+                chunk[text_key] = text[chunk['char_start']:chunk['char_end']]
+
     def get_all_chunks(self, user_id: str, project_id: str, doc_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Get all chunks for a document (useful for full document generation)"""
         if not self.available:
             return []
             
         try:
+            columns = 'chunk_index, chunk_text, char_start, char_end' if self.codec else 'chunk_index, chunk_text'
             query = self.supabase.table('document_chunks').select(
-                'chunk_index, chunk_text'
+                columns
             ).eq('user_id', user_id).eq('project_id', project_id).eq('doc_id', doc_id).order('chunk_index', desc=False)
             
             if limit:
                 query = query.limit(limit)
                 
             result = query.execute()
+            self._resolve_chunk_texts(result.data, f"{user_id}_{project_id}_{doc_id}")
             
             chunks = []
             for chunk in result.data:
@@ -177,25 +326,92 @@ class DatabaseManager:
             print(f"Get all chunks error: {e}")
             return []
 
-    def list_project_documents(self, user_id: str, project_id: str) -> List[Dict[str, Any]]:
+    def get_chunks_page(self, user_id: str, project_id: str, doc_id: str, after_index: int = -1,
+                        limit: int = 50, document_text: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        One page of a document's chunks in chunk_index order, keyset-paginated: returns up to
+        `limit` chunks with chunk_index > after_index. Pass the document text in compressed
+        mode to avoid fetching it again for every page.
+        Errors are logged and re-raised: an empty page would read as the end of the document.
+        """
         if not self.available:
             return []
 
         try:
-            result = self.supabase.table('project_documents').select(
-                'doc_id, title, content'
-            ).eq('user_id', user_id).eq('project_id', project_id).execute()
+            columns = 'chunk_index, chunk_text, char_start, char_end' if self.codec else 'chunk_index, chunk_text'
+            result = self.supabase.table('document_chunks').select(
+                columns
+            ).eq('user_id', user_id).eq('project_id', project_id).eq('doc_id', doc_id).gt(
+                'chunk_index', after_index
+            ).order('chunk_index', desc=False).limit(limit).execute()
+            self._resolve_chunk_texts(result.data, f"{user_id}_{project_id}_{doc_id}",
+                                      document_text=document_text)
+
+            return [{"chunk_index": chunk['chunk_index'], "text": chunk['chunk_text']} for chunk in result.data]
+        except Exception as e:
+            print(f"Get chunks page error: {e}")
+            raise
+
+    def list_project_documents(self, user_id: str, project_id: str, limit: int = 100,
+                               after: Optional[Tuple[Any, str]] = None, sort_by: str = 'title',
+                               descending: bool = False, preview_chars: int = 0) -> Dict[str, Any]:
+        """
+        One page of a project's documents, metadata only (plus an optional content preview).
+        Keyset pagination on (sort_by, doc_id): `after` is the decoded cursor of the previous page.
+        """
+        if not self.available:
+            return {'documents': [], 'next_cursor': None}
 
-            return [
-                {
+        try:
+            columns = 'doc_id, title, created_at'
+            if preview_chars > 0:
+                columns += ', content_preview'
+
+            query = self.supabase.table('project_documents').select(
+                columns
+            ).eq('user_id', user_id).eq('project_id', project_id)
+
+            if after is not None:
+                after_value, after_doc_id = after
+                op = 'lt' if descending else 'gt'
+                if sort_by == 'doc_id':
+                    query = query.filter('doc_id', op, after_doc_id)
+                else:
+                    value = _postgrest_quote(after_value)
+                    query = query.or_(
+                        f'{sort_by}.{op}.{value},'
+                        f'and({sort_by}.eq.{value},doc_id.{op}.{_postgrest_quote(after_doc_id)})'
+                    )
+
+            query = query.order(sort_by, desc=descending)
+            if sort_by != 'doc_id':
+                query = query.order('doc_id', desc=descending)
+
+            # Fetch one extra row to know whether there is a next page
+            rows = query.limit(limit + 1).execute().data
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+
+            documents = []
+            for doc in rows:
+                item = {
                     'doc_id': doc['doc_id'],
                     'title': doc['title'],
-                    'content': doc['content']
-                } for doc in result.data
-            ]
+                    'created_at': doc.get('created_at')
+                }
+                if preview_chars > 0:
+                    item['content_preview'] = (doc.get('content_preview') or '')[:preview_chars]
+                documents.append(item)
+
+            next_cursor = None
+            if has_more and rows:
+                last = rows[-1]
+                next_cursor = encode_cursor(last.get(sort_by), last['doc_id'])
+
+            return {'documents': documents, 'next_cursor': next_cursor}
         except Exception as e:
             print(f"List documents error: {e}")
-            return []
+            return {'documents': [], 'next_cursor': None}
 
     # New methods for chunk management
     def check_if_chunked(self, document_id: str) -> bool:
@@ -211,76 +427,284 @@ class DatabaseManager:
             print(f"Check chunked status error: {e}")
             return False
 
-    def store_chunks(self, chunks_data: List[Dict[str, Any]]) -> bool:
-        """Stores a list of document chunks in the database."""
+    def get_stored_chunk_ids(self, user_id: str, project_id: str, doc_id: str) -> set:
+        """Ids of the chunks already stored for a document"""
+        if not self.available:
+            return set()
+        try:
+            result = self.supabase.table('document_chunks').select(
+                'id'
+            ).eq('user_id', user_id).eq('project_id', project_id).eq('doc_id', doc_id).execute()
+            return {row['id'] for row in result.data}
+        except Exception as e:
+            print(f"Get stored chunk ids error: {e}")
+            return set()
+
+    def _upsert_chunk_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        """Upsert one batch of chunks, retrying it on its own if it fails"""
+        for attempt in range(1, CHUNK_BATCH_RETRIES + 1):
+            try:
+                self.supabase.table('document_chunks').upsert(
+                    batch, on_conflict='id').execute()
+                return True
+            except Exception as e:
+                print(f"⚠️ Chunk batch upsert attempt {attempt}/{CHUNK_BATCH_RETRIES} failed: {e}")
+                if attempt < CHUNK_BATCH_RETRIES:
+                    time.sleep(attempt)
+        return False
+
+    def store_chunks(self, chunks_data: List[Dict[str, Any]],
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     resume: bool = False, document_text: Optional[str] = None) -> bool:
+        """
+        Stores a list of document chunks in the database.
+        Chunks are upserted in size-bounded batches, several in flight at once; a failed batch is
+        retried alone. With resume=True, chunks already stored for the document are skipped.
+        progress(stored, total) is called after every batch.
+        In 'compressed' storage mode, chunks found in document_text are stored as offsets.
+        """
         if not self.available:
             return False
         try:
             # We need to explicitly convert embeddings to list of floats for Supabase
+            # (chunk text is already sanitized by the ingestion pipeline)
             chunks_to_insert = []
             for chunk in chunks_data:
-                # Clean chunk text to remove problematic characters
-                chunk_text = chunk['chunk_text']
-                if chunk_text:
-                    # Remove null characters and other problematic Unicode characters
-                    chunk_text = chunk_text.replace('\u0000', '').replace('\x00', '')
-                    # Remove other problematic control characters except newlines and tabs
-                    import re
-                    chunk_text = re.sub(r'[\x01-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', chunk_text)
-                    chunk_text = chunk_text.strip()
-                
                 chunks_to_insert.append({
                     'id': chunk['id'],
                     'user_id': chunk['user_id'],
                     'project_id': chunk['project_id'],
                     'doc_id': chunk['doc_id'],
                     'chunk_index': chunk['chunk_index'],
-                    'chunk_text': chunk_text,
+                    'chunk_text': chunk['chunk_text'],
                     'embedding': chunk['embedding'],
-                    'embedding_size': len(chunk['embedding'])
+                    'embedding_size': len(chunk['embedding']),
+                    'embedding_model': chunk['embedding_model']
                 })
 
-            self.supabase.table('document_chunks').insert(
-                chunks_to_insert).execute()
-            print(f"✅ Stored {len(chunks_to_insert)} chunks successfully.")
+            if self.codec and document_text:
+                offsets = locate_chunks(document_text, [c['chunk_text'] for c in chunks_to_insert])
+                for row, offset in zip(chunks_to_insert, offsets):
+                    # Every row carries the offset columns: bulk upserts need uniform keys
+                    row['char_start'], row['char_end'] = offset if offset else (None, None)
+                    if offset:
+                        self.storage_stats.chunk_text_bytes_saved += len(row['chunk_text'].encode('utf-8'))
+                        self.storage_stats.chunks_as_offsets += 1
+                        row['chunk_text'] = ''
+            self.storage_stats.chunks += len(chunks_to_insert)
+
+            total = len(chunks_to_insert)
+            stored = 0
+            if resume and chunks_to_insert:
+                first = chunks_to_insert[0]
+                existing = self.get_stored_chunk_ids(first['user_id'], first['project_id'], first['doc_id'])
+                chunks_to_insert = [c for c in chunks_to_insert if c['id'] not in existing]
+                stored = total - len(chunks_to_insert)
+                if stored:
+                    print(f"⏩ Resuming: {stored}/{total} chunks already stored")
+
+            if progress:
+                progress(stored, total)
+
+            batches = batch_by_bytes(chunks_to_insert, CHUNK_BATCH_MAX_BYTES)
+            failed_batches = 0
+            with ThreadPoolExecutor(max_workers=CHUNK_BATCH_CONCURRENCY) as pool:
+                futures = {pool.submit(self._upsert_chunk_batch, batch): batch for batch in batches}
+                for future in as_completed(futures):
+                    if future.result():
+                        stored += len(futures[future])
+                        if progress:
+                            progress(stored, total)
+                    else:
+                        failed_batches += 1
+
+            if failed_batches:
+                print(f"❌ Store chunks: {failed_batches}/{len(batches)} batches failed, {stored}/{total} chunks stored")
+                return False
+
+            print(f"✅ Stored {total} chunks successfully in {len(batches)} batches.")
             return True
         except Exception as e:
             print(f"❌ Store chunks error: {e}")
             return False
     
 
-    def get_best_chunks(self, user_id: str, project_id: str, doc_id: str, query_embedding: List[float], limit: int) -> List[Dict[str, Any]]:
-        """Retrieves the best chunks by calculating cosine similarity locally."""
+    def _stale_embedding_filter(self, model_id: str) -> str:
+        return f'embedding_model.is.null,embedding_model.neq.{_postgrest_quote(model_id)}'
+
+    def count_stale_chunks(self, model_id: str) -> int:
+        """Number of chunks whose embedding was not produced by model_id"""
+        if not self.available:
+            return 0
+        result = self.supabase.table('document_chunks').select('id', count='exact').or_(
+            self._stale_embedding_filter(model_id)).limit(1).execute()
+        return result.count or 0
+
+    def get_stale_chunks(self, model_id: str, after_id: str = '', limit: int = 32) -> List[Dict[str, Any]]:
+        """
+        One page of chunks not embedded with model_id, keyset-paginated by id.
+        Rows keep their stored columns; their text (resolved from offsets if needed) is under 'text'.
+        """
+        if not self.available:
+            return []
+        columns = 'id, user_id, project_id, doc_id, chunk_index, chunk_text'
+        if self.codec:
+            columns += ', char_start, char_end'
+        result = self.supabase.table('document_chunks').select(columns).or_(
+            self._stale_embedding_filter(model_id)
+        ).gt('id', after_id).order('id', desc=False).limit(limit).execute()
+
+        by_document: Dict[str, List[Dict[str, Any]]] = {}
+        for row in result.data:
+            row['text'] = row['chunk_text']
+            by_document.setdefault(f"{row['user_id']}_{row['project_id']}_{row['doc_id']}", []).append(row)
+        for document_id, rows in by_document.items():
+            self._resolve_chunk_texts(rows, document_id, text_key='text')
+        return result.data
+
+    def update_chunk_embeddings(self, rows: List[Dict[str, Any]]) -> bool:
+        """Write re-computed embeddings back, upserting the rows returned by get_stale_chunks"""
+        if not self.available:
+            return False
+        rows = [{k: v for k, v in row.items() if k != 'text'} for row in rows]
+        return all(self._upsert_chunk_batch(batch) for batch in batch_by_bytes(rows, CHUNK_BATCH_MAX_BYTES))
+
+    def _scan_chunk_embeddings(self, user_id: str, project_id: str, doc_ids: List[str],
+                               embedding_model: Optional[str], dimensions: int
+                               ) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """
+        Load the chunks of the given documents with their embeddings stacked into one
+        (n, dimensions) float32 matrix. Chunks with a different embedding size are skipped.
+        """
+        columns = 'id, doc_id, chunk_index, chunk_text, embedding'
+        if self.codec:
+            columns += ', char_start, char_end'
+
+        rows: List[Dict[str, Any]] = []
+        vectors: List[List[float]] = []
+        offset = 0
+        while True:
+            query = self.supabase.table('document_chunks').select(columns).eq(
+                'user_id', user_id).eq('project_id', project_id).in_('doc_id', doc_ids)
+            if embedding_model:
+                query = query.eq('embedding_model', embedding_model)
+            page = query.order('id').range(offset, offset + QUERY_SCAN_PAGE_SIZE - 1).execute().data
+            for row in page:
+                embedding = row.pop('embedding')
+                if isinstance(embedding, str):
+                    embedding = json.loads(embedding)
+                if embedding and len(embedding) == dimensions:
+                    rows.append(row)
+                    vectors.append(embedding)
+            if len(page) < QUERY_SCAN_PAGE_SIZE:
+                break
+            offset += QUERY_SCAN_PAGE_SIZE
+
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), dimensions)
+        return rows, matrix
+
+    def _scored_chunks(self, user_id: str, project_id: str, rows: List[Dict[str, Any]],
+                       scores: np.ndarray, indices: np.ndarray) -> List[Dict[str, Any]]:
+        """Build the response entries for the selected rows, resolving offset-stored text"""
+        chunks = [dict(rows[i], score=float(scores[i])) for i in indices]
+        by_document: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            by_document.setdefault(chunk['doc_id'], []).append(chunk)
+        for doc_id, doc_chunks in by_document.items():
+            self._resolve_chunk_texts(doc_chunks, f"{user_id}_{project_id}_{doc_id}")
+        for chunk in chunks:
+            chunk.pop('char_start', None)
+            chunk.pop('char_end', None)
+            chunk['text'] = chunk['chunk_text']
+        return chunks
+
+    def get_best_chunks(self, user_id: str, project_id: str, doc_id: str, query_embedding: List[float], limit: int,
+                        embedding_model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieves the best chunks by calculating cosine similarity locally, in one vectorized pass.
+        With embedding_model, only chunks embedded by that model are scored.
+        """
         if not self.available:
             return []
         try:
-            # 1. Recupera TUTTI i chunk per il documento
-            result = self.supabase.from_('document_chunks').select('*').eq('user_id', user_id).eq('project_id', project_id).eq('doc_id', doc_id).execute()
-            
-            # 2. Prepara una lista per i chunk con i loro punteggi
-            chunks_with_scores = []
-            
-            # 3. Itera su ogni chunk per calcolare la similarità
-            for chunk in result.data:
-                chunk_embedding = np.array(chunk['embedding'])  # Converte la lista JSON in un array NumPy
-                score = cosine_similarity(np.array(query_embedding), chunk_embedding)
-                chunk['score'] = score  # Aggiungi il punteggio al dizionario del chunk
-                chunks_with_scores.append(chunk)
+            rows, matrix = self._scan_chunk_embeddings(user_id, project_id, [doc_id], embedding_model,
+                                                       len(query_embedding))
+            scores = cosine_similarities(query_embedding, matrix)
+            return self._scored_chunks(user_id, project_id, rows, scores, top_k_indices(scores, limit))
+        except Exception as e:
+            print(f"Get best chunks error: {e}")
+            return []
 
-            # 4. Ordina i chunk in base al punteggio di similarità in ordine decrescente
-            chunks_with_scores.sort(key=lambda x: x['score'], reverse=True)
+    def get_best_chunks_multi(self, user_id: str, project_id: str, doc_ids: List[str],
+                              query_embedding: List[float], limit: int, global_limit: int,
+                              embedding_model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Score the chunks of several documents against one query embedding in a single pass.
+        Returns {"documents": {doc_id: [top `limit` chunks]}, "global": [top `global_limit` chunks]}.
+        """
+        if not self.available:
+            return {"documents": {}, "global": []}
 
-            # 5. Rimuovi il campo 'embedding' da ogni chunk prima di restituirli
-            for chunk in chunks_with_scores:
-                if 'embedding' in chunk:
-                    del chunk['embedding']
+        try:
+            rows, matrix = self._scan_chunk_embeddings(user_id, project_id, doc_ids, embedding_model,
+                                                       len(query_embedding))
+            scores = cosine_similarities(query_embedding, matrix)
+
+            row_docs = np.array([row['doc_id'] for row in rows], dtype=object)
+            documents: Dict[str, List[Dict[str, Any]]] = {}
+            for doc_id in doc_ids:
+                doc_rows = np.flatnonzero(row_docs == doc_id)
+                best = doc_rows[top_k_indices(scores[doc_rows], limit)]
+                documents[doc_id] = self._scored_chunks(user_id, project_id, rows, scores, best)
+
+            return {
+                "documents": documents,
+                "global": self._scored_chunks(user_id, project_id, rows, scores, top_k_indices(scores, global_limit)),
+            }
+        except Exception as e:
+            print(f"Get best chunks (batch) error: {e}")
+            return {"documents": {}, "global": []}
 
-            # 6. Restituisci i chunk migliori in base al limite
-            return chunks_with_scores[:limit]
-        
+    def save_execution_plan(self, plan: Dict[str, Any]) -> bool:
+        """Upsert an execution_plans row (plan_id is the orchestration's execution id)"""
+        if not self.available:
+            return False
+        try:
+            self.supabase.table('execution_plans').upsert(
+                dict(plan, updated_at=datetime.now(timezone.utc).isoformat())).execute()
+            return True
         except Exception as e:
-            print(f"Get best chunks error: {e}")
-            return []
+            print(f"❌ Save execution plan error: {e}")
+            return False
+
+    def save_execution_result(self, result: Dict[str, Any]) -> bool:
+        """Upsert an execution_results row; agent_results is the full list of results so far"""
+        if not self.available:
+            return False
+        try:
+            self.supabase.table('execution_results').upsert(
+                dict(result, updated_at=datetime.now(timezone.utc).isoformat())).execute()
+            return True
+        except Exception as e:
+            print(f"❌ Save execution result error: {e}")
+            return False
+
+    def get_execution(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        """{"plan": row or None, "result": row or None}, or None if nothing was recorded"""
+        if not self.available:
+            return None
+        try:
+            plans = self.supabase.table('execution_plans').select('*').eq('plan_id', execution_id).execute()
+            results = self.supabase.table('execution_results').select('*').eq('execution_id', execution_id).execute()
+        except Exception as e:
+            print(f"Get execution error: {e}")
+            return None
+        if not plans.data and not results.data:
+            return None
+        return {
+            "plan": plans.data[0] if plans.data else None,
+            "result": results.data[0] if results.data else None,
+        }
         
 
 
@@ -0,0 +1,80 @@
+"""
+HTTP caching helpers for document endpoints
+Strong ETags derived from stored content hashes, If-None-Match handling and byte ranges
+"""
+
+import hashlib
+import os
+from typing import Dict, Optional, Tuple
+
+DOCUMENT_CACHE_CONTROL = os.getenv("DOCUMENT_CACHE_CONTROL", "private, max-age=3600")
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header cannot be served for the resource size"""
+
+
+def content_hash(data) -> str:
+    """SHA-256 hex digest of text or bytes, as stored next to documents"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_etag(base_hash: str, *variant) -> str:
+    """
+    Strong ETag for a representation of a document.
+    `variant` holds the request parameters that change the body (mode, query, limit...).
+    """
+    if variant:
+        suffix = hashlib.sha256(repr(variant).encode('utf-8')).hexdigest()[:16]
+        return f'"{base_hash}-{suffix}"'
+    return f'"{base_hash}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True when an If-None-Match header matches the ETag (weak comparison, per RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": DOCUMENT_CACHE_CONTROL}
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into inclusive (start, end) offsets.
+    Returns None for headers that should be ignored (invalid syntax such as `bytes=9-3`,
+    multiple or non-byte ranges), and raises RangeNotSatisfiable for valid ranges that lie
+    outside the resource (RFC 9110, section 14.1.2).
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    start_text, sep, end_text = spec.strip().partition("-")
+    start_text, end_text = start_text.strip(), end_text.strip()
+    if not sep or not (start_text or end_text):
+        return None
+    if (start_text and not start_text.isdigit()) or (end_text and not end_text.isdigit()):
+        return None
+
+    if start_text == "":
+        # Suffix range: the last N bytes
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if end_text and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
@@ -0,0 +1,362 @@
+"""
+Ingestion job queue for the Document Storage Service
+Uploads are turned into jobs that a bounded pool of workers runs through
+the extract -> chunk/embed -> store stages, with retries per stage
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from chunker_client import ChunkerClient, ChunkerError
+from text_sanitizer import sanitize_text
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+INGEST_STAGE_RETRIES = int(os.getenv("INGEST_STAGE_RETRIES", "3"))
+INGEST_RETRY_BACKOFF_SECONDS = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "2"))
+INGEST_JOB_RETENTION_SECONDS = int(os.getenv("INGEST_JOB_RETENTION_SECONDS", "3600"))
+# Per-stage concurrency: with more workers than slots in a stage, jobs overlap across
+# stages (extraction of file N+1 runs while file N is embedded and file N-1 is stored)
+INGEST_STAGE_CONCURRENCY = {
+    "extract": int(os.getenv("INGEST_EXTRACT_CONCURRENCY", "2")),
+    "chunk": int(os.getenv("INGEST_CHUNK_CONCURRENCY", "2")),
+    "store": int(os.getenv("INGEST_STORE_CONCURRENCY", "2")),
+}
+
+# Progress reached when each stage completes
+STAGE_PROGRESS = {
+    "extract": 0.2,
+    "chunk": 0.7,
+    "store": 1.0,
+}
+
+
+class StageError(Exception):
+    """Raised by a stage when its work failed and may be retried"""
+
+
+class IngestionJob:
+    """State of a single document ingestion"""
+
+    def __init__(self, user_id: str, project_id: str, doc_id: str, title: str,
+                 filename: str, file_content: bytes, keep_chunks: bool = False):
+        self.job_id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.project_id = project_id
+        self.doc_id = doc_id
+        self.title = title
+        self.filename = filename
+        self.file_content: Optional[bytes] = file_content
+        self.file_size = len(file_content)
+        self.document_id = f"{user_id}_{project_id}_{doc_id}"
+
+        self.status = "queued"  # queued, running, completed, failed, cancelled
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.attempts: Dict[str, int] = {}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        # Intermediate stage outputs
+        self.text_content: Optional[str] = None
+        self.chunks_from_service: Optional[List[Dict[str, Any]]] = None
+        self.embedding_model: Optional[str] = None
+        # Chunk metadata is only kept for a caller that waits for it (cleared once handed over):
+        # finished jobs stay in the job table for INGEST_JOB_RETENTION_SECONDS
+        self.keep_chunks = keep_chunks
+        self.chunks: List[Dict[str, Any]] = []
+        self.chunks_count = 0
+        self.chunks_stored = 0
+
+        self.done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "document_id": self.document_id,
+            "doc_id": self.doc_id,
+            "project_id": self.project_id,
+            "title": self.title,
+            "filename": self.filename,
+            "file_size": self.file_size,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "attempts": dict(self.attempts),
+            "chunks_count": self.chunks_count,
+            "chunks_stored": self.chunks_stored,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionBatch:
+    """A group of jobs submitted together by a bulk upload"""
+
+    def __init__(self, user_id: str, project_id: str):
+        self.batch_id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.project_id = project_id
+        self.jobs: List[IngestionJob] = []
+        self.rejected: List[Dict[str, Any]] = []
+        self.created_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return all(job.finished for job in self.jobs)
+
+    async def wait(self):
+        await asyncio.gather(*(job.done.wait() for job in self.jobs))
+
+    def to_dict(self) -> Dict[str, Any]:
+        completed = [job for job in self.jobs if job.status == "completed"]
+        failed = [job for job in self.jobs if job.status in ("failed", "cancelled")]
+        finished_times = [job.finished_at for job in self.jobs if job.finished_at]
+
+        end = max(finished_times) if self.finished and finished_times else time.time()
+        elapsed = max(end - self.created_at, 1e-6)
+        completed_bytes = sum(job.file_size for job in completed)
+        completed_chunks = sum(job.chunks_stored for job in completed)
+
+        return {
+            "batch_id": self.batch_id,
+            "project_id": self.project_id,
+            "status": "completed" if self.finished else "running",
+            "files_total": len(self.jobs) + len(self.rejected),
+            "files_completed": len(completed),
+            "files_failed": len(failed) + len(self.rejected),
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput": {
+                "files_per_second": round(len(completed) / elapsed, 3),
+                "bytes_per_second": round(completed_bytes / elapsed, 1),
+                "chunks_per_second": round(completed_chunks / elapsed, 3),
+            },
+            "files": [job.to_dict() for job in self.jobs] + self.rejected,
+        }
+
+
+class IngestionPipeline:
+    """The stages a job goes through. Each stage raises StageError on failure"""
+
+    def __init__(self, db_manager, pdf_processor, chunker_client: ChunkerClient):
+        self.db_manager = db_manager
+        self.pdf_processor = pdf_processor
+        self.chunker_client = chunker_client
+
+    async def extract(self, job: IngestionJob):
+        job.text_content = await asyncio.to_thread(
+            self.pdf_processor.extract_text_from_bytes, job.file_content
+        )
+
+    async def chunk(self, job: IngestionJob):
+        print(f"📄 Sending document to chunker service: {job.filename} ({job.file_size} bytes)")
+        try:
+            job.chunks_from_service, job.embedding_model = await self.chunker_client.chunk(
+                job.filename, job.file_content
+            )
+        except ChunkerError as e:
+            raise StageError(str(e))
+        print(f"✅ Received {len(job.chunks_from_service)} chunks from chunker service")
+
+    async def store(self, job: IngestionJob):
+        stored = await self.db_manager.store_document(
+            job.document_id, job.user_id, job.project_id, job.doc_id,
+            job.title, job.file_content, job.text_content
+        )
+        if not stored:
+            raise StageError("Failed to store document")
+
+        chunks_to_store = [{
+            "id": f"{job.document_id}_{i}",
+            "user_id": job.user_id,
+            "project_id": job.project_id,
+            "doc_id": job.doc_id,
+            "chunk_index": i,
+            "chunk_text": sanitize_text(chunk['text'], normalize_whitespace=False),
+            "embedding": chunk['embedding'],
+            "embedding_model": job.embedding_model
+        } for i, chunk in enumerate(job.chunks_from_service or [])]
+
+        def report_progress(stored: int, total: int):
+            # Chunk storage spans the progress between the chunk stage and completion
+            job.chunks_stored = stored
+            if total:
+                job.progress = STAGE_PROGRESS["chunk"] + (
+                    STAGE_PROGRESS["store"] - STAGE_PROGRESS["chunk"]) * stored / total
+
+        # On a retried store stage, skip the batches that already made it
+        resume = job.attempts.get("store", 1) > 1
+        print(f"💾 Storing {len(chunks_to_store)} chunks in database...")
+        if not await self.db_manager.store_chunks(chunks_to_store, report_progress, resume,
+                                                  job.text_content):
+            raise StageError("Failed to store chunks in database")
+
+        job.chunks_count = len(chunks_to_store)
+        job.chunks_stored = len(chunks_to_store)
+        job.chunks_from_service = None
+        if job.keep_chunks:
+            # Keep only chunk metadata, embeddings are large
+            for chunk in chunks_to_store:
+                chunk.pop("embedding", None)
+            job.chunks = chunks_to_store
+
+
+class IngestionQueue:
+    """Bounded job queue drained by a fixed pool of worker tasks"""
+
+    def __init__(self, pipeline: IngestionPipeline, workers: int = INGEST_WORKERS,
+                 maxsize: int = INGEST_QUEUE_SIZE):
+        self.pipeline = pipeline
+        self.workers = workers
+        self.maxsize = maxsize
+        self.jobs: Dict[str, IngestionJob] = {}
+        self.batches: Dict[str, IngestionBatch] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stage_slots: Dict[str, asyncio.Semaphore] = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._stage_slots = {
+            name: asyncio.Semaphore(limit) for name, limit in INGEST_STAGE_CONCURRENCY.items()
+        }
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"✅ Ingestion queue started with {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Jobs still queued will never run: give them a terminal status
+        while self._queue and not self._queue.empty():
+            job = self._queue.get_nowait()
+            self._cancel(job)
+        print("🛑 Ingestion queue stopped")
+
+    def submit(self, job: IngestionJob) -> IngestionJob:
+        """Enqueue a job. Raises asyncio.QueueFull when the queue is saturated"""
+        self._prune()
+        self._queue.put_nowait(job)
+        self.jobs[job.job_id] = job
+        return job
+
+    def submit_batch(self, batch: IngestionBatch, jobs: List[IngestionJob]) -> IngestionBatch:
+        """Enqueue all jobs of a batch. Raises asyncio.QueueFull if they do not all fit"""
+        if len(jobs) > self.free_slots():
+            raise asyncio.QueueFull()
+        for job in jobs:
+            self.submit(job)
+            batch.jobs.append(job)
+        self.batches[batch.batch_id] = batch
+        return batch
+
+    def free_slots(self) -> int:
+        return self.maxsize - self._queue.qsize()
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def get_batch(self, batch_id: str) -> Optional[IngestionBatch]:
+        return self.batches.get(batch_id)
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queue_size": self._queue.qsize() if self._queue else 0,
+            "queue_capacity": self.maxsize,
+            "stage_concurrency": dict(INGEST_STAGE_CONCURRENCY),
+            "jobs": counts,
+        }
+
+    def _prune(self):
+        cutoff = time.time() - INGEST_JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished and job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+        expired_batches = [batch_id for batch_id, batch in self.batches.items()
+                           if batch.finished and batch.created_at < cutoff]
+        for batch_id in expired_batches:
+            del self.batches[batch_id]
+
+    async def _worker(self, worker_index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ingestion worker {worker_index} crashed on job {job.job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: IngestionJob):
+        job.status = "running"
+        job.started_at = time.time()
+        stages: List[tuple[str, Callable[[IngestionJob], Awaitable[None]]]] = [
+            ("extract", self.pipeline.extract),
+            ("chunk", self.pipeline.chunk),
+            ("store", self.pipeline.store),
+        ]
+        try:
+            for name, stage in stages:
+                await self._run_stage(job, name, stage)
+            job.status = "completed"
+            print(f"✅ Ingestion job {job.job_id} completed ({job.chunks_count} chunks)")
+        except StageError as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"❌ Ingestion job {job.job_id} failed at stage {job.stage}: {e}")
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            job.error = "Ingestion cancelled (service shutting down)"
+            print(f"🛑 Ingestion job {job.job_id} cancelled at stage {job.stage}")
+            raise
+        finally:
+            job.finished_at = time.time()
+            # Release the large intermediate payloads
+            job.file_content = None
+            job.text_content = None
+            job.chunks_from_service = None
+            job.done.set()
+
+    def _cancel(self, job: IngestionJob):
+        job.status = "cancelled"
+        job.error = "Ingestion cancelled (service shutting down)"
+        job.finished_at = time.time()
+        job.file_content = None
+        job.done.set()
+
+    async def _run_stage(self, job: IngestionJob, name: str,
+                         stage: Callable[[IngestionJob], Awaitable[None]]):
+        job.stage = name
+        last_error: Optional[Exception] = None
+        for attempt in range(1, INGEST_STAGE_RETRIES + 1):
+            job.attempts[name] = attempt
+            try:
+                async with self._stage_slots[name]:
+                    await stage(job)
+                job.progress = STAGE_PROGRESS[name]
+                return
+            except Exception as e:
+                last_error = e
+                print(f"⚠️ Job {job.job_id} stage '{name}' attempt {attempt}/{INGEST_STAGE_RETRIES} failed: {e}")
+                if attempt < INGEST_STAGE_RETRIES:
+                    await asyncio.sleep(INGEST_RETRY_BACKOFF_SECONDS * attempt)
+        raise StageError(f"Stage '{name}' failed after {INGEST_STAGE_RETRIES} attempts: {last_error}")
@@ -4,28 +4,65 @@ Handles PDF document storage, retrieval, and text extraction
 Now integrated with Chunker Service for automatic chunking
 """
 
-from typing import List, Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query
-from fastapi.responses import Response
-from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import uvicorn
-import requests
-import tempfile
 import os
+import io
 import uuid
-
-from database import DatabaseManager
+import zipfile
+
+from chunker_client import ChunkerClient, ChunkerError
+from http_cache import (
+    RangeNotSatisfiable, cache_headers, content_hash, etag_matches, make_etag, parse_range
+)
+from database import CONTENT_PREVIEW_CHARS, DOCUMENT_SORT_FIELDS, DatabaseManager, decode_cursor
+from async_database import AsyncDatabaseManager, DatabaseTimeoutError
 from pdf_processor import PDFProcessor
+from ingestion import IngestionBatch, IngestionJob, IngestionPipeline, IngestionQueue
+from reembedding import REEMBED_BATCH_SIZE, REEMBED_MAX_CHUNKS_PER_SECOND, ReembeddingWorker
 
 # URL del chunker service (in Docker sarà il nome del servizio)
 CHUNKER_URL = os.getenv("CHUNKER_URL", "http://chunker-service:8000")
 CHUNK_LIMIT_CHARS = 4000  # Define the limit for chunking
-
-app = FastAPI(title="Document Storage Service")
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "200"))
+# Uncompressed size limits for zip members, checked before anything is decompressed
+BULK_MAX_FILE_BYTES = int(os.getenv("BULK_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+BULK_MAX_TOTAL_BYTES = int(os.getenv("BULK_MAX_TOTAL_BYTES", str(500 * 1024 * 1024)))
+BATCH_QUERY_MAX_DOCUMENTS = int(os.getenv("BATCH_QUERY_MAX_DOCUMENTS", "50"))
 
 # Initialize services
-db_manager = DatabaseManager()
+db_manager = AsyncDatabaseManager(DatabaseManager())
 pdf_processor = PDFProcessor()
+chunker_client = ChunkerClient(CHUNKER_URL)
+ingestion_queue = IngestionQueue(IngestionPipeline(db_manager, pdf_processor, chunker_client))
+reembedding_worker = ReembeddingWorker(db_manager, chunker_client)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: open the pooled chunker client and start the ingestion workers
+    await chunker_client.start()
+    await ingestion_queue.start()
+    yield
+    # Shutdown: stop the ingestion workers and re-embedding, then close the pooled connections
+    await ingestion_queue.stop()
+    await reembedding_worker.cancel()
+    await chunker_client.close()
+    db_manager.shutdown()
+
+
+app = FastAPI(title="Document Storage Service", lifespan=lifespan)
+
+
+@app.exception_handler(DatabaseTimeoutError)
+async def database_timeout_handler(request: Request, exc: DatabaseTimeoutError):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 
 # Pydantic models
@@ -33,31 +70,75 @@ class DocumentResponse(BaseModel):
     success: bool
     message: str
     doc_id: str
+    job_id: Optional[str] = None
+    status: Optional[str] = None
     chunks: List[dict] = []
 
 
 class DocumentMetadata(BaseModel):
     doc_id: str
     title: str
-    content: str
+    created_at: Optional[str] = None
+    content_preview: Optional[str] = None
 
 
 class DocumentListResponse(BaseModel):
     documents: List[DocumentMetadata]
+    next_cursor: Optional[str] = None
 
 
 class ProjectInfo(BaseModel):
     project_id: str
     document_count: int
+    total_bytes: int = 0
+    last_updated: Optional[str] = None
 
 
 class ProjectListResponse(BaseModel):
     projects: List[ProjectInfo]
 
 
+class ExecutionPlanRequest(BaseModel):
+    user_id: str
+    project_id: str
+    prompt: str
+    document_ids: List[str]
+    strategy: Optional[str] = None  # Planned actions, JSON-encoded
+    status: str = Field("executing", pattern="^(pending|confirmed|executing|completed|failed)$")
+
+
+class ExecutionResultRequest(BaseModel):
+    agent_results: List[Dict[str, Any]] = []
+    final_result: Optional[str] = None
+    status: str = Field("processing", pattern="^(processing|completed|failed)$")
+
+
+class BatchQueryRequest(BaseModel):
+    doc_ids: List[str] = Field(..., min_length=1)
+    query: str = Field(..., min_length=1)
+    top_k: int = Field(7, ge=1, le=50, description="Chunks returned per document")
+    global_top_k: int = Field(10, ge=1, le=200, description="Chunks returned across all documents")
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Database dispatch and ingestion metrics"""
+    return {
+        "db": db_manager.metrics(),
+        "cache": db_manager.cache.stats(),
+        "query_embeddings": chunker_client.query_cache.stats(),
+        "ingestion": ingestion_queue.stats(),
+        "embeddings": reembedding_worker.stats()
+    }
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "document-service"}
+    return {
+        "status": "healthy",
+        "service": "document-service",
+        "ingestion": ingestion_queue.stats()
+    }
 
 
 # Get user projects
@@ -65,7 +146,7 @@ async def health_check():
 async def get_user_projects(user_id: str):
     """Get all projects for a user"""
     try:
-        projects = db_manager.list_user_projects(user_id)
+        projects = await db_manager.list_user_projects(user_id)
         return ProjectListResponse(projects=projects)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve projects: {str(e)}")
@@ -78,9 +159,14 @@ async def upload_document(
     user_id: str = Form(...),
     project_id: str = Form(...),
     title: str = Form(...),
-    doc_id: Optional[str] = Form(None)
+    doc_id: Optional[str] = Form(None),
+    wait: bool = Form(True)
 ):
-    """Upload a document to a project and store its chunks+embeddings"""
+    """
+    Ingest a document (extract, chunk+embed, store) on the ingestion worker pool.
+    By default the request blocks until the job finishes, as the upload always did;
+    with wait=false it returns the job id at once (poll /api/v1/jobs/{job_id}).
+    """
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
@@ -88,96 +174,282 @@ async def upload_document(
         doc_id = str(uuid.uuid4())
 
     file_content = await file.read()
-    text_content = pdf_processor.extract_text_from_bytes(file_content)
-    document_id = f"{user_id}_{project_id}_{doc_id}"
+    job = IngestionJob(user_id, project_id, doc_id, title, file.filename, file_content, keep_chunks=wait)
+
+    try:
+        ingestion_queue.submit(job)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, retry later")
 
-    # Store document binary + text
-    success = db_manager.store_document(
-        document_id, user_id, project_id, doc_id, title, file_content, text_content
+    print(f"📥 Queued ingestion job {job.job_id} for {file.filename} ({job.file_size} bytes)")
+
+    if not wait:
+        return DocumentResponse(
+            success=True,
+            message="Document queued for ingestion",
+            doc_id=doc_id,
+            job_id=job.job_id,
+            status=job.status
+        )
+
+    await job.done.wait()
+    if job.status != "completed":
+        raise HTTPException(status_code=500, detail=f"Failed to process document: {job.error}")
+
+    # Hand the chunk metadata over; the finished job only keeps its counts
+    chunks, job.chunks = job.chunks, []
+    return DocumentResponse(
+        success=True,
+        message="Document uploaded and chunked successfully",
+        doc_id=doc_id,
+        job_id=job.job_id,
+        status=job.status,
+        chunks=chunks
     )
 
-    temp_path = None
-    chunks_data = []
+
+def _expand_bulk_files(filename: str, content: bytes, max_files: int = BULK_MAX_FILES,
+                       max_total_bytes: int = BULK_MAX_TOTAL_BYTES) -> List[tuple[str, bytes]]:
+    """
+    Return the PDFs contained in an uploaded file (the file itself, or the members of a zip).
+    File counts and (uncompressed) sizes are checked against the limits before any zip
+    member is read (ValueError if exceeded), so a small archive cannot expand into gigabytes.
+    """
+    if filename.lower().endswith('.pdf'):
+        _check_bulk_limits(filename, [(filename, len(content))], max_files, max_total_bytes)
+        return [(filename, content)]
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith('.pdf')
+                and not os.path.basename(info.filename).startswith('.')
+            ]
+            _check_bulk_limits(filename, [(info.filename, info.file_size) for info in members],
+                               max_files, max_total_bytes)
+            # ZipExtFile never returns more than the declared file_size, so the checks above hold
+            return [(os.path.basename(info.filename), archive.read(info)) for info in members]
+    return []
+
+
+def _check_bulk_limits(filename: str, sizes: List[tuple[str, int]], max_files: int, max_total_bytes: int):
+    """Raise ValueError if the PDFs of one upload exceed the file count, per-file or total size limit"""
+    if len(sizes) > max_files:
+        raise ValueError(f"Too many files, {filename} brings {len(sizes)} but only {max_files} more are allowed")
+    for name, size in sizes:
+        if size > BULK_MAX_FILE_BYTES:
+            raise ValueError(f"{name} is {size} bytes, the limit per file is {BULK_MAX_FILE_BYTES}")
+    total = sum(size for _, size in sizes)
+    if total > max_total_bytes:
+        raise ValueError(f"Upload too large, {filename} brings {total} bytes but only "
+                         f"{max_total_bytes} more are allowed")
+
+
+# Bulk upload endpoint
+@app.post("/api/v1/documents/bulk-upload")
+async def bulk_upload_documents(
+    files: List[UploadFile] = File(...),
+    user_id: str = Form(...),
+    project_id: str = Form(...),
+    wait: bool = Form(False)
+):
+    """
+    Upload many PDFs (or zip archives of PDFs) to a project in one call.
+    Files are pipelined through the ingestion stages; progress, per-file results
+    and aggregate throughput are available at /api/v1/jobs/batches/{batch_id}.
+    """
+    batch = IngestionBatch(user_id, project_id)
+    jobs = []
+    total_bytes = 0
+
+    for upload in files:
+        content = await upload.read()
+        try:
+            pdfs = _expand_bulk_files(upload.filename, content, BULK_MAX_FILES - len(jobs),
+                                      BULK_MAX_TOTAL_BYTES - total_bytes)
+        except zipfile.BadZipFile:
+            pdfs = []
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not pdfs:
+            batch.rejected.append({
+                "filename": upload.filename,
+                "status": "failed",
+                "error": "Only PDF files or zip archives of PDFs are allowed"
+            })
+            continue
+
+        for filename, pdf_content in pdfs:
+            total_bytes += len(pdf_content)
+            title = os.path.splitext(filename)[0]
+            jobs.append(IngestionJob(user_id, project_id, str(uuid.uuid4()), title, filename, pdf_content))
+
+    if len(jobs) > BULK_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files, the limit is {BULK_MAX_FILES}")
+
     try:
-        # Create temporary file for chunker service
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(file_content)
-            temp_path = tmp.name
+        ingestion_queue.submit_batch(batch, jobs)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Ingestion queue cannot take this batch, retry later")
 
-        print(f"📄 Sending document to chunker service: {file.filename}")
-        print(f"📊 File size: {len(file_content)} bytes")
-        
-        # Call chunker service with increased timeout
-        with open(temp_path, "rb") as f:
-            files = {"file": (file.filename, f)}
-            print(f"🔗 Calling chunker at: {CHUNKER_URL}/chunk")
-            r = requests.post(f"{CHUNKER_URL}/chunk", files=files, timeout=300)  # 5 minute timeout
+    print(f"📥 Queued bulk batch {batch.batch_id}: {len(jobs)} files, {len(batch.rejected)} rejected")
 
-        print(f"📋 Chunker response status: {r.status_code}")
-        
-        if r.status_code != 200:
-            print(f"❌ Chunker error response: {r.text}")
-            raise HTTPException(status_code=500, detail=f"Chunker error: {r.text}")
+    if wait:
+        await batch.wait()
 
-        chunks_from_service = r.json().get("chunks", [])
-        print(f"✅ Received {len(chunks_from_service)} chunks from chunker service")
+    return batch.to_dict()
 
-        chunks_to_store = [{
-            "id": f"{document_id}_{i}",
-            "user_id": user_id,
-            "project_id": project_id,
-            "doc_id": doc_id,
-            "chunk_index": i,
-            "chunk_text": chunk['text'],
-            "embedding": chunk['embedding']
-        } for i, chunk in enumerate(chunks_from_service)]
 
-        print(f"💾 Storing {len(chunks_to_store)} chunks in database...")
-        if not db_manager.store_chunks(chunks_to_store):
-            raise HTTPException(status_code=500, detail="Failed to store chunks in database.")
+# Bulk upload batch status
+@app.get("/api/v1/jobs/batches/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Get per-file results and aggregate throughput of a bulk upload"""
+    batch = ingestion_queue.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch.to_dict()
 
-        # Remove embeddings from response (they're large)
-        for chunk in chunks_to_store:
-            chunk.pop("embedding", None)
 
-        chunks_data = chunks_to_store
+# Ingestion job status
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Get status and progress of an ingestion job"""
+    job = ingestion_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
-    except Exception as e:
-        print(f"Error during chunking or storage: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to process document: {e}")
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
 
-    if success:
-        return DocumentResponse(
-            success=True,
-            message="Document uploaded and chunked successfully",
-            doc_id=doc_id,
-            chunks=chunks_data
-        )
-    else:
-        raise HTTPException(status_code=500, detail="Failed to store document")
+@app.post("/api/v1/embeddings/reembed")
+async def start_reembedding(
+    batch_size: int = Query(REEMBED_BATCH_SIZE, ge=1, le=256),
+    max_chunks_per_second: float = Query(REEMBED_MAX_CHUNKS_PER_SECOND, gt=0),
+    resume: bool = Query(False, description="Continue after the previous job's cursor")
+):
+    """Start re-embedding every chunk not embedded by the chunker's current model"""
+    try:
+        job = await reembedding_worker.start(batch_size, max_chunks_per_second, resume)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ChunkerError as e:
+        raise HTTPException(status_code=502, detail=f"Chunker unavailable: {e}")
+    return job.to_dict()
+
+
+@app.get("/api/v1/embeddings/reembed")
+async def get_reembedding_status():
+    """Status of the current (or last) re-embedding job"""
+    if not reembedding_worker.job:
+        raise HTTPException(status_code=404, detail="No re-embedding job has been started")
+    return reembedding_worker.job.to_dict()
+
+
+@app.delete("/api/v1/embeddings/reembed")
+async def cancel_reembedding():
+    """Cancel the running re-embedding job (start it again with resume=true to continue)"""
+    if not reembedding_worker.running:
+        raise HTTPException(status_code=404, detail="No re-embedding job is running")
+    await reembedding_worker.cancel()
+    return reembedding_worker.job.to_dict()
+
+
+# Orchestration execution records (written step by step by the orchestration agent)
+@app.put("/api/v1/executions/{execution_id}/plan")
+async def save_execution_plan(execution_id: str, request: ExecutionPlanRequest):
+    """Record (or update the status of) the plan of an orchestration run"""
+    stored = await db_manager.save_execution_plan({
+        'plan_id': execution_id,
+        'user_id': request.user_id,
+        'project_id': request.project_id,
+        'original_prompt': request.prompt,
+        'document_ids': request.document_ids,
+        'strategy': request.strategy,
+        'status': request.status,
+    })
+    if not stored:
+        raise HTTPException(status_code=500, detail="Failed to store execution plan")
+    return {"success": True, "execution_id": execution_id, "status": request.status}
+
+
+@app.put("/api/v1/executions/{execution_id}/result")
+async def save_execution_result(execution_id: str, request: ExecutionResultRequest):
+    """Record the agent results so far (and the final answer once there is one); the plan must exist"""
+    stored = await db_manager.save_execution_result({
+        'execution_id': execution_id,
+        'plan_id': execution_id,
+        'agent_results': request.agent_results,
+        'final_result': request.final_result,
+        'status': request.status,
+    })
+    if not stored:
+        raise HTTPException(status_code=500, detail="Failed to store execution result")
+    return {"success": True, "execution_id": execution_id, "status": request.status}
+
+
+@app.get("/api/v1/executions/{execution_id}")
+async def get_execution(execution_id: str):
+    """Recorded plan and results of an orchestration run, used to resume it"""
+    execution = await db_manager.get_execution(execution_id)
+    if execution is None:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    return {"execution_id": execution_id, **execution}
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+async def _text_etag(document_id: str, *variant) -> Optional[str]:
+    """ETag of a text representation, from the stored text hash (None if not recorded)"""
+    text_hash = await db_manager.get_text_hash(document_id)
+    return make_etag(text_hash, *variant) if text_hash else None
 
 
 # Document retrieval endpoint (PDF binary)
 @app.get("/api/v1/documents/{user_id}/{project_id}/{doc_id}")
-async def get_document(user_id: str, project_id: str, doc_id: str):
-    """Get document PDF binary"""
+async def get_document(user_id: str, project_id: str, doc_id: str, request: Request):
+    """Get document PDF binary (supports If-None-Match and single byte ranges)"""
     document_id = f"{user_id}_{project_id}_{doc_id}"
-    document_data = db_manager.get_document(document_id)
+    if_none_match = request.headers.get("if-none-match")
+
+    # Answer conditional requests from the stored hash, without loading the PDF
+    file_hash = await db_manager.get_file_hash(document_id)
+    if file_hash and etag_matches(if_none_match, make_etag(file_hash)):
+        return _not_modified(make_etag(file_hash))
+
+    document_data = await db_manager.get_document(document_id)
 
     if not document_data:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    return Response(content=document_data, media_type="application/pdf")
+    etag = make_etag(file_hash or content_hash(document_data))
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+
+    size = len(document_data)
+    headers = {**cache_headers(etag), "Accept-Ranges": "bytes"}
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return Response(content=document_data[start:end + 1], status_code=206,
+                            media_type="application/pdf", headers=headers)
+
+    return Response(content=document_data, media_type="application/pdf", headers=headers)
 
 
 # Alternative endpoint with /pdf suffix
 @app.get("/api/v1/documents/{user_id}/{project_id}/{doc_id}/pdf")
-async def get_document_pdf(user_id: str, project_id: str, doc_id: str):
+async def get_document_pdf(user_id: str, project_id: str, doc_id: str, request: Request):
     """Get document PDF binary (alternative endpoint with /pdf suffix)"""
-    return await get_document(user_id, project_id, doc_id)
+    return await get_document(user_id, project_id, doc_id, request)
 
 
 @app.get("/api/v1/documents/{user_id}/{project_id}/{doc_id}/text")
@@ -185,6 +457,8 @@ async def get_document_text(
     user_id: str,
     project_id: str,
     doc_id: str,
+    request: Request,
+    response: Response,
     is_query: bool = Query(False, description="Set true if this is a query request"),
     query: Optional[str] = Query(None, description="Query text if is_query=true"),
     full_chunks: bool = Query(False, description="Return all chunks even for large documents")
@@ -194,10 +468,24 @@ async def get_document_text(
     i chunk più rilevanti. Se full_chunks=true, restituisce sempre tutti i chunk.
     """
     document_id = f"{user_id}_{project_id}_{doc_id}"
-    text_content = db_manager.get_document_text(document_id)
+    if_none_match = request.headers.get("if-none-match")
+    # Query results depend on the embedding model as well as the text
+    variant = ("text", is_query, query, full_chunks, chunker_client.model_id if is_query else None)
+
+    etag = await _text_etag(document_id, *variant)
+    if etag and etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+
+    text_content = await db_manager.get_document_text(document_id)
 
     if text_content is None:
         raise HTTPException(status_code=404, detail="Document not found")
+
+    if not etag:
+        etag = make_etag(content_hash(text_content), *variant)
+        if etag_matches(if_none_match, etag):
+            return _not_modified(etag)
+    response.headers.update(cache_headers(etag))
     
     # Check document size first, regardless of the 'is_query' flag.
     # If the document is small, always return the full text.
@@ -212,7 +500,7 @@ async def get_document_text(
     # If full_chunks is requested, get all chunks from database
     if full_chunks:
         try:
-            all_chunks = db_manager.get_all_chunks(user_id, project_id, doc_id)
+            all_chunks = await db_manager.get_all_chunks(user_id, project_id, doc_id)
             if all_chunks:
                 return {
                     "success": True,
@@ -221,7 +509,10 @@ async def get_document_text(
                     "chunks": all_chunks
                 }
             else:
-                # Fallback to chunking the full text if no chunks in DB
+                # Fallback to chunking the full text if no chunks in DB (not cacheable: the
+                # document may still be ingesting, and the ETag does not cover its chunks)
+                response.headers["Cache-Control"] = "no-store"
+                del response.headers["ETag"]
                 chunks = [{"text": text_content[i:i+CHUNK_LIMIT_CHARS]}
                          for i in range(0, len(text_content), CHUNK_LIMIT_CHARS)]
                 return {
@@ -231,7 +522,9 @@ async def get_document_text(
                     "chunks": chunks
                 }
         except Exception as e:
-            # Fallback to text chunking if database chunks fail
+            # Fallback to text chunking if database chunks fail (not cacheable)
+            response.headers["Cache-Control"] = "no-store"
+            del response.headers["ETag"]
             chunks = [{"text": text_content[i:i+CHUNK_LIMIT_CHARS]}
                      for i in range(0, len(text_content), CHUNK_LIMIT_CHARS)]
             return {
@@ -244,17 +537,26 @@ async def get_document_text(
     # If the document is large, check for a query.
     if is_query and query:
         try:
-            r = requests.post(f"{CHUNKER_URL}/embed-query", json={"query": query}, timeout=30)
-            if r.status_code != 200:
-                raise HTTPException(status_code=500, detail=f"Embedding error: {r.text}")
-            query_embedding = r.json().get("embedding")
-        except requests.RequestException as e:
-            raise HTTPException(status_code=500, detail=f"Error contacting chunker service: {str(e)}")
-
-        best_chunks = db_manager.get_best_chunks(
-            user_id, project_id, doc_id, query_embedding, limit=7
+            query_embedding, embedding_model = await chunker_client.embed_query(query)
+        except ChunkerError as e:
+            raise HTTPException(status_code=500, detail=f"Embedding error: {str(e)}")
+
+        best_chunks = await db_manager.get_best_chunks(
+            user_id, project_id, doc_id, query_embedding, limit=7, embedding_model=embedding_model
         )
 
+        if not best_chunks:
+            # Not re-embedded with the current model yet: fall back to the raw text (not cacheable)
+            response.headers["Cache-Control"] = "no-store"
+            del response.headers["ETag"]
+            return {
+                "success": True,
+                "mode": "chunked_text",
+                "message": f"No chunks embedded with {embedding_model} yet, returning text split into chunks.",
+                "chunks": [{"text": text_content[i:i+CHUNK_LIMIT_CHARS]}
+                           for i in range(0, len(text_content), CHUNK_LIMIT_CHARS)]
+            }
+
         return {
             "success": True,
             "mode": "query",
@@ -277,12 +579,66 @@ async def get_document_text(
 
 
 
+@app.post("/api/v1/documents/{user_id}/{project_id}/query")
+async def batch_query_documents(user_id: str, project_id: str, request: BatchQueryRequest):
+    """
+    Rank the chunks of several documents of a project against one query: the query is embedded
+    once and all chunks are scored in a single pass. Returns the top_k chunks of each document
+    and the global_top_k chunks across all of them.
+    """
+    doc_ids = list(dict.fromkeys(request.doc_ids))
+    if len(doc_ids) > BATCH_QUERY_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {BATCH_QUERY_MAX_DOCUMENTS} documents per batch query")
+
+    try:
+        query_embedding, embedding_model = await chunker_client.embed_query(request.query)
+    except ChunkerError as e:
+        raise HTTPException(status_code=500, detail=f"Embedding error: {str(e)}")
+
+    ranked = await db_manager.get_best_chunks_multi(
+        user_id, project_id, doc_ids, query_embedding, request.top_k, request.global_top_k,
+        embedding_model
+    )
+    documents = ranked["documents"]
+    return {
+        "success": True,
+        "mode": "batch_query",
+        "embedding_model": embedding_model,
+        "documents": documents,
+        "global_chunks": ranked["global"],
+        # Not found, not chunked yet, or not re-embedded with the current model
+        "documents_without_chunks": [doc_id for doc_id in doc_ids if not documents.get(doc_id)],
+    }
+
+
 # List project documents
-@app.get("/api/v1/documents/{user_id}/{project_id}", response_model=DocumentListResponse)
-async def list_project_documents(user_id: str, project_id: str):
-    """Get all documents in a project"""
-    documents = db_manager.list_project_documents(user_id, project_id)
-    return DocumentListResponse(documents=documents)
+@app.get("/api/v1/documents/{user_id}/{project_id}", response_model=DocumentListResponse,
+         response_model_exclude_none=True)
+async def list_project_documents(
+    user_id: str,
+    project_id: str,
+    limit: int = Query(100, ge=1, le=500, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    sort_by: str = Query("title", description=f"One of {', '.join(DOCUMENT_SORT_FIELDS)}"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    preview_chars: int = Query(0, ge=0, le=CONTENT_PREVIEW_CHARS, description="Include a content preview of N chars")
+):
+    """Get one page of a project's documents (metadata only, plus an optional content preview)"""
+    if sort_by not in DOCUMENT_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {', '.join(DOCUMENT_SORT_FIELDS)}")
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    page = await db_manager.list_project_documents(
+        user_id, project_id, limit, after, sort_by, order == "desc", preview_chars
+    )
+    return DocumentListResponse(documents=page['documents'], next_cursor=page['next_cursor'])
 
 
 #  new endpoint for getting all chunks
@@ -291,17 +647,26 @@ async def get_document_chunks(
     user_id: str,
     project_id: str,
     doc_id: str,
+    request: Request,
+    response: Response,
     limit: Optional[int] = Query(None, description="Limit number of chunks returned")
 ):
     """
     Get all chunks for a document (useful for full document generation)
     """
+    document_id = f"{user_id}_{project_id}_{doc_id}"
+    etag = await _text_etag(document_id, "chunks", limit)
+    if etag and etag_matches(request.headers.get("if-none-match"), etag):
+        return _not_modified(etag)
+
     try:
-        chunks = db_manager.get_all_chunks(user_id, project_id, doc_id, limit)
+        chunks = await db_manager.get_all_chunks(user_id, project_id, doc_id, limit)
         
         if not chunks:
             raise HTTPException(status_code=404, detail="No chunks found for document")
-        
+
+        if etag:
+            response.headers.update(cache_headers(etag))
         return {
             "success": True,
             "mode": "all_chunks",
@@ -314,5 +679,48 @@ async def get_document_chunks(
         raise HTTPException(status_code=500, detail=f"Failed to retrieve document chunks: {str(e)}")
 
 
+@app.get("/api/v1/documents/{user_id}/{project_id}/{doc_id}/chunks/stream")
+async def stream_document_chunks(
+    user_id: str,
+    project_id: str,
+    doc_id: str,
+    after_index: int = Query(-1, ge=-1, description="Resume after this chunk_index"),
+    page_size: int = Query(50, ge=1, le=500, description="Chunks fetched from the database per page"),
+    max_chars: Optional[int] = Query(None, ge=1, description="Stop once this many characters have been sent")
+):
+    """
+    Stream a document's chunks as NDJSON, one {"chunk_index", "text"} object per line in
+    chunk_index order. Chunks are paged from the database by chunk_index and sent as they
+    arrive; consumers can stop reading at any point and resume with after_index.
+    If reading fails mid-stream, a final {"error": ...} line is sent instead of just stopping.
+    """
+    chunks = db_manager.iter_chunks(user_id, project_id, doc_id, after_index, page_size)
+    try:
+        first = await anext(chunks, None)
+    except Exception as e:
+        await chunks.aclose()
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve document chunks: {str(e)}")
+    if first is None and after_index < 0:
+        raise HTTPException(status_code=404, detail="No chunks found for document")
+
+    async def ndjson_lines():
+        sent_chars = 0
+        chunk = first
+        try:
+            while chunk is not None:
+                yield json.dumps(chunk, ensure_ascii=False) + "\n"
+                sent_chars += len(chunk['text'])
+                if max_chars and sent_chars >= max_chars:
+                    return
+                chunk = await anext(chunks, None)
+        except Exception as e:
+            print(f"❌ Chunk stream for {doc_id} failed: {e}")
+            yield json.dumps({"error": f"Failed to retrieve document chunks: {str(e)}"}) + "\n"
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,5 +1,6 @@
 import io
-import re
+
+from text_sanitizer import sanitize_text
 
 class PDFProcessor:
     def __init__(self):
@@ -18,22 +19,8 @@ class PDFProcessor:
             pass
     
     def _clean_text(self, text: str) -> str:
-        """Clean extracted text to remove problematic characters"""
-        if not text:
-            return ""
-        
-        # Remove null characters and other problematic Unicode characters
-        # that can't be stored in PostgreSQL
-        text = text.replace('\u0000', '')  # Remove null characters
-        text = text.replace('\x00', '')    # Remove null bytes
-        
-        # Remove other problematic control characters except newlines and tabs
-        text = re.sub(r'[\x01-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', text)
-        
-        # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        return text.strip()
+        """Clean extracted text to remove problematic characters and normalize whitespace"""
+        return sanitize_text(text)
     
     def extract_text_from_bytes(self, pdf_bytes: bytes) -> str:
         for extractor in self.available_extractors:
@@ -0,0 +1,162 @@
+"""
+Background re-embedding for the Document Storage Service
+After the chunker switches embedding model, stored chunks embedded by another model are
+re-embedded in rate-limited batches. Progress lives in the data (a chunk stops being stale
+once rewritten), so a cancelled, failed or interrupted job resumes by starting a new one.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from chunker_client import ChunkerClient, ChunkerError
+
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "32"))
+REEMBED_MAX_CHUNKS_PER_SECOND = float(os.getenv("REEMBED_MAX_CHUNKS_PER_SECOND", "50"))
+REEMBED_BATCH_RETRIES = int(os.getenv("REEMBED_BATCH_RETRIES", "3"))
+REEMBED_RETRY_BACKOFF_SECONDS = float(os.getenv("REEMBED_RETRY_BACKOFF_SECONDS", "5"))
+
+
+class ReembeddingJob:
+    """State of one pass over the stale chunks"""
+
+    def __init__(self, target_model: str, batch_size: int, max_chunks_per_second: float,
+                 after_id: str = ''):
+        self.job_id = str(uuid.uuid4())
+        self.target_model = target_model
+        self.batch_size = batch_size
+        self.max_chunks_per_second = max_chunks_per_second
+        self.status = "running"  # running, completed, failed, cancelled
+        self.after_id = after_id  # Keyset cursor: last chunk id processed
+        self.stale_at_start = 0
+        self.reembedded = 0
+        self.batches = 0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status != "running"
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.job_id,
+            "target_model": self.target_model,
+            "status": self.status,
+            "stale_at_start": self.stale_at_start,
+            "reembedded": self.reembedded,
+            "batches": self.batches,
+            "after_id": self.after_id,
+            "batch_size": self.batch_size,
+            "max_chunks_per_second": self.max_chunks_per_second,
+            "chunks_per_second": round(self.reembedded / elapsed, 2) if elapsed > 0 else 0.0,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ReembeddingWorker:
+    """Runs at most one re-embedding job at a time as a background task"""
+
+    def __init__(self, db_manager, chunker_client: ChunkerClient):
+        self.db_manager = db_manager
+        self.chunker_client = chunker_client
+        self.job: Optional[ReembeddingJob] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, batch_size: int = REEMBED_BATCH_SIZE,
+                    max_chunks_per_second: float = REEMBED_MAX_CHUNKS_PER_SECOND,
+                    resume: bool = False) -> ReembeddingJob:
+        """
+        Start re-embedding every chunk not produced by the chunker's current model.
+        With resume=True, continue after the previous job's cursor instead of from the start.
+        Raises RuntimeError if a job is already running.
+        """
+        if self.running:
+            raise RuntimeError("A re-embedding job is already running")
+
+        target_model = await self.chunker_client.get_model_id()
+        after_id = ''
+        if resume and self.job and self.job.target_model == target_model:
+            after_id = self.job.after_id
+
+        job = ReembeddingJob(target_model, batch_size, max_chunks_per_second, after_id)
+        job.stale_at_start = await self.db_manager.count_stale_chunks(target_model)
+        self.job = job
+        self._task = asyncio.create_task(self._run(job))
+        print(f"🔁 Re-embedding {job.stale_at_start} chunks with {target_model}")
+        return job
+
+    async def cancel(self):
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "embedding_model": self.chunker_client.model_id,
+            "job": self.job.to_dict() if self.job else None,
+        }
+
+    async def _run(self, job: ReembeddingJob):
+        try:
+            while True:
+                batch_started = time.perf_counter()
+                rows = await self.db_manager.get_stale_chunks(job.target_model, job.after_id, job.batch_size)
+                if not rows:
+                    break
+
+                await self._reembed_batch(job, rows)
+                job.after_id = rows[-1]['id']
+                job.reembedded += len(rows)
+                job.batches += 1
+
+                # Pace batches so the chunker keeps capacity for uploads and queries
+                min_duration = len(rows) / job.max_chunks_per_second if job.max_chunks_per_second > 0 else 0
+                remaining = min_duration - (time.perf_counter() - batch_started)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+            job.status = "completed"
+            print(f"✅ Re-embedding job {job.job_id} completed ({job.reembedded} chunks)")
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            print(f"🛑 Re-embedding job {job.job_id} cancelled after {job.reembedded} chunks")
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"❌ Re-embedding job {job.job_id} failed after {job.reembedded} chunks: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    async def _reembed_batch(self, job: ReembeddingJob, rows):
+        last_error: Optional[Exception] = None
+        for attempt in range(1, REEMBED_BATCH_RETRIES + 1):
+            try:
+                embeddings, model_id = await self.chunker_client.embed_texts([row['text'] for row in rows])
+                if model_id != job.target_model:
+                    # The chunker was swapped mid-job: never store vectors from another model
+                    raise RuntimeError(f"Chunker now serves {model_id}, job targets {job.target_model}")
+                for row, embedding in zip(rows, embeddings):
+                    row['embedding'] = embedding
+                    row['embedding_size'] = len(embedding)
+                    row['embedding_model'] = model_id
+                if await self.db_manager.update_chunk_embeddings(rows):
+                    return
+                last_error = RuntimeError("Failed to store re-embedded chunks")
+            except ChunkerError as e:
+                last_error = e
+            print(f"⚠️ Re-embedding batch after {job.after_id or 'start'} attempt "
+                  f"{attempt}/{REEMBED_BATCH_RETRIES} failed: {last_error}")
+            if attempt < REEMBED_BATCH_RETRIES:
+                await asyncio.sleep(REEMBED_RETRY_BACKOFF_SECONDS * attempt)
+        raise last_error
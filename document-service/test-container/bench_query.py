@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Concurrent query benchmark for the document-service (bench_query.py)
+Fires concurrent GET /text?is_query=true requests at a large, already uploaded document
+and reports throughput and latency percentiles.
+
+Run it once against the old build and once against the new one to compare:
+    python bench_query.py <user_id> <project_id> <doc_id> [--concurrency 16] [--requests 200]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DOCUMENT_SERVICE_URL = "http://localhost:8000"  # Direct to document service
+QUERIES = [
+    "Qual è l'importo della rata?",
+    "Chi sono le parti del contratto?",
+    "Quali sono le date di scadenza?",
+    "Ci sono clausole di recesso?",
+]
+
+
+async def run_benchmark(base_url: str, user_id: str, project_id: str, doc_id: str,
+                        concurrency: int, total_requests: int):
+    url = f"{base_url}/api/v1/documents/{user_id}/{project_id}/{doc_id}/text"
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=120.0,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one_request(i: int):
+            nonlocal errors
+            params = {"is_query": True, "query": QUERIES[i % len(QUERIES)]}
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url, params=params)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    errors += 1
+                    print(f"❌ Request {i} failed: {e}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request(i) for i in range(total_requests)))
+        elapsed = time.perf_counter() - start
+
+    print(f"\n📊 {total_requests} requests, concurrency {concurrency}")
+    print(f"   Elapsed:    {elapsed:.2f}s")
+    print(f"   Throughput: {len(latencies) / elapsed:.2f} req/s")
+    print(f"   Errors:     {errors}")
+    if latencies:
+        latencies.sort()
+        print(f"   p50:        {statistics.median(latencies) * 1000:.0f} ms")
+        print(f"   p95:        {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms")
+        print(f"   max:        {latencies[-1] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent query-mode /text calls")
+    parser.add_argument("user_id")
+    parser.add_argument("project_id")
+    parser.add_argument("doc_id")
+    parser.add_argument("--url", default=DOCUMENT_SERVICE_URL)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(run_benchmark(args.url, args.user_id, args.project_id, args.doc_id,
+                              args.concurrency, args.requests))
+
+
+if __name__ == "__main__":
+    main()
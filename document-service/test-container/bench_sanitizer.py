@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Text sanitizer benchmark for the document-service (bench_sanitizer.py)
+Compares the previous ingestion cleanup (PDFProcessor cleaned the text, then DatabaseManager
+cleaned it again along with every chunk) with sanitizing once via sanitize_text, on synthetic
+multi-MB text, and checks both give the same output. Also times control character removal
+alone with the regex used by sanitize_text against a str.translate deletion table.
+
+    python bench_sanitizer.py [--size-mb 8] [--repeat 5]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from text_sanitizer import _CONTROL_CHARS, sanitize_text  # noqa: E402
+
+WORDS = ["contratto", "locazione", "articolo", "clausola", "parti", "rata", "scadenza", "€", "n°", "L'"]
+NOISE = ["\x00", "\x07", "\x0b", "\x1f", "\x85", "\t", "\n", "  "]
+
+
+def legacy_clean(text: str) -> str:
+    """The cleanup previously applied by PDFProcessor"""
+    text = text.replace('\x00', '')
+    text = re.sub(r'[\x01-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', text)
+    text = ' '.join(text.split())
+    return text.strip()
+
+
+def legacy_store_clean(text: str) -> str:
+    """The cleanup previously repeated by DatabaseManager on the text and on each chunk"""
+    text = text.replace('\u0000', '').replace('\x00', '')
+    text = re.sub(r'[\x01-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', text)
+    return text.strip()
+
+
+# Same characters as _CONTROL_CHARS, as a str.translate deletion table
+DELETE_TABLE = str.maketrans(dict.fromkeys(c for c in range(0xa0) if _CONTROL_CHARS.match(chr(c))))
+
+
+def regex_strip(text: str) -> str:
+    return _CONTROL_CHARS.sub('', text) if _CONTROL_CHARS.search(text) is not None else text
+
+
+def translate_strip(text: str) -> str:
+    return text.translate(DELETE_TABLE)
+
+
+def split_chunks(text: str, size: int = 4000):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def legacy_pipeline(raw: str):
+    text = legacy_store_clean(legacy_clean(raw))
+    return text, [legacy_store_clean(chunk) for chunk in split_chunks(raw)]
+
+
+def sanitized_pipeline(raw: str):
+    text = sanitize_text(raw)
+    return text, [sanitize_text(chunk, normalize_whitespace=False) for chunk in split_chunks(raw)]
+
+
+def make_text(size_mb: float) -> str:
+    rng = random.Random(42)
+    parts, size = [], 0
+    target = int(size_mb * 1024 * 1024)
+    while size < target:
+        token = rng.choice(NOISE) if rng.random() < 0.05 else rng.choice(WORDS) + " "
+        parts.append(token)
+        size += len(token)
+    return "".join(parts)
+
+
+def best_of(func, text: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion text sanitizer")
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = make_text(args.size_mb)
+    assert legacy_pipeline(text) == sanitized_pipeline(text), "sanitizer output differs from legacy cleanup"
+    assert regex_strip(text) == translate_strip(text), "translate table differs from the regex"
+
+    legacy = best_of(legacy_pipeline, text, args.repeat)
+    single = best_of(sanitized_pipeline, text, args.repeat)
+    mb = len(text.encode('utf-8')) / (1024 * 1024)
+    print(f"📄 Text: {mb:.1f} MB")
+    print(f"🐢 Legacy cleanup: {legacy * 1000:.1f} ms ({mb / legacy:.1f} MB/s)")
+    print(f"🚀 Sanitize once:  {single * 1000:.1f} ms ({mb / single:.1f} MB/s)")
+    print(f"📊 Speedup: {legacy / single:.2f}x")
+
+    clean = regex_strip(text)
+    for label, sample in (("noisy", text), ("clean", clean)):
+        regex = best_of(regex_strip, sample, args.repeat)
+        translate = best_of(translate_strip, sample, args.repeat)
+        print(f"🔎 Control chars, {label} text: regex {regex * 1000:.1f} ms, "
+              f"str.translate {translate * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -151,7 +151,8 @@ class DirectDocumentServiceTester:
         print(f"📄 Testing get project documents (direct): {project_id}")
         
         try:
-            response = requests.get(f"{DOCUMENT_SERVICE_URL}/api/v1/documents/{REAL_USER_ID}/{project_id}")
+            response = requests.get(f"{DOCUMENT_SERVICE_URL}/api/v1/documents/{REAL_USER_ID}/{project_id}",
+                                    params={"preview_chars": 50})
             
             if response.status_code == 200:
                 result = response.json()
@@ -159,7 +160,7 @@ class DirectDocumentServiceTester:
                 self.log_result(f"Get Project Documents Direct ({project_id})", True)
                 print(f"   Found {len(documents)} documents:")
                 for doc in documents:
-                    content_preview = doc['content'][:50] + "..." if len(doc['content']) > 50 else doc['content']
+                    content_preview = doc.get('content_preview', '')
                     print(f"   - {doc['title']} ({doc['doc_id']})")
                     print(f"     Content preview: {content_preview}")
                 return documents
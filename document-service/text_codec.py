@@ -0,0 +1,114 @@
+"""
+Compressed text storage for the Document Storage Service
+Document text can be stored zstd-compressed (with an optional dictionary trained on our
+Italian legal corpus) and chunks as character offsets into it instead of duplicate strings
+"""
+
+import base64
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+TEXT_STORAGE_MODE = os.getenv("TEXT_STORAGE_MODE", "plain").lower()  # plain, compressed
+ZSTD_DICT_PATH = os.getenv("ZSTD_DICT_PATH", "zstd_legal_it.dict")
+ZSTD_TEXT_LEVEL = int(os.getenv("ZSTD_TEXT_LEVEL", "19"))
+
+class TextCodec:
+    """zstd codec for document text, stored base64-encoded in a TEXT column"""
+
+    def __init__(self, dict_path: str = ZSTD_DICT_PATH, level: int = ZSTD_TEXT_LEVEL):
+        self.available = ZSTD_AVAILABLE
+        self.dict_id: Optional[int] = None
+        self._dictionary = None
+        if not self.available:
+            return
+
+        if dict_path and os.path.exists(dict_path):
+            with open(dict_path, 'rb') as f:
+                self._dictionary = zstandard.ZstdCompressionDict(f.read())
+            self.dict_id = self._dictionary.dict_id()
+            print(f"✅ Loaded zstd dictionary {dict_path} (id {self.dict_id})")
+
+        self._compressor = zstandard.ZstdCompressor(level=level, dict_data=self._dictionary)
+        self._decompressor = zstandard.ZstdDecompressor(dict_data=self._dictionary)
+
+    def compress(self, text: str) -> str:
+        return base64.b64encode(self._compressor.compress(text.encode('utf-8'))).decode('ascii')
+
+    def decompress(self, payload: str) -> str:
+        return self._decompressor.decompress(base64.b64decode(payload)).decode('utf-8')
+
+
+def train_dictionary(samples: List[str], dict_size: int = 112640) -> bytes:
+    """Train a zstd dictionary from sample texts (split into ~4 KB pieces for better coverage)"""
+    pieces = []
+    for text in samples:
+        data = text.encode('utf-8')
+        pieces.extend(data[i:i + 4096] for i in range(0, len(data), 4096))
+    return zstandard.train_dictionary(dict_size, pieces).as_bytes()
+
+
+def locate_chunks(text: str, chunk_texts: List[str]) -> List[Optional[Tuple[int, int]]]:
+    """
+    Find each chunk verbatim in the document text, returning (start, end) character offsets or None.
+    Chunks are matched in order; a chunk that does not appear exactly (the chunker may have
+    reflowed its whitespace) is kept as a literal string, so text[start:end] always equals the chunk.
+    """
+    offsets: List[Optional[Tuple[int, int]]] = []
+    position = 0
+    for chunk_text in chunk_texts:
+        if not chunk_text:
+            offsets.append(None)
+            continue
+        start = text.find(chunk_text, position)
+        if start == -1:
+            start = text.find(chunk_text)
+        if start == -1:
+            offsets.append(None)
+            continue
+        end = start + len(chunk_text)
+        offsets.append((start, end))
+        position = end
+    return offsets
+
+
+class StorageStats:
+    """Bytes stored per document and decompression cost, reported under /metrics"""
+
+    def __init__(self):
+        self.documents = 0
+        self.text_bytes = 0
+        self.stored_text_bytes = 0
+        self.chunks = 0
+        self.chunks_as_offsets = 0
+        self.chunk_text_bytes_saved = 0
+        self.decompressions = 0
+        self.decompress_ms = 0.0
+
+    def record_document(self, text_bytes: int, stored_bytes: int):
+        self.documents += 1
+        self.text_bytes += text_bytes
+        self.stored_text_bytes += stored_bytes
+
+    def record_decompression(self, started: float):
+        self.decompressions += 1
+        self.decompress_ms += (time.perf_counter() - started) * 1000
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "mode": TEXT_STORAGE_MODE,
+            "documents_stored": self.documents,
+            "avg_text_bytes_per_document": round(self.text_bytes / self.documents, 1) if self.documents else 0,
+            "avg_stored_bytes_per_document": round(self.stored_text_bytes / self.documents, 1) if self.documents else 0,
+            "compression_ratio": round(self.text_bytes / self.stored_text_bytes, 2) if self.stored_text_bytes else 0,
+            "chunks_stored": self.chunks,
+            "chunks_as_offsets": self.chunks_as_offsets,
+            "chunk_text_bytes_saved": self.chunk_text_bytes_saved,
+            "avg_decompress_ms": round(self.decompress_ms / self.decompressions, 3) if self.decompressions else 0,
+        }
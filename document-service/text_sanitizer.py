@@ -0,0 +1,28 @@
+"""
+Text sanitizer for the ingestion pipeline
+Removes null and control characters that PostgreSQL cannot store (keeping tabs and
+newlines) with one precompiled pattern, then optionally normalizes whitespace.
+Text is sanitized once at extraction time; later stages store it as is.
+"""
+
+import re
+
+# Null, C0 controls except \t \n \r, DEL and C1 controls. A regex rather than a str.translate
+# deletion table: translate has no fast path for non-ASCII text and is ~10x slower on extracted
+# PDFs (see test-container/bench_sanitizer.py)
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]')
+
+
+def sanitize_text(text: str, normalize_whitespace: bool = True) -> str:
+    """
+    Strip control characters and surrounding whitespace.
+    With normalize_whitespace, every run of whitespace becomes a single space.
+    """
+    if not text:
+        return ""
+    if _CONTROL_CHARS.search(text) is not None:
+        text = _CONTROL_CHARS.sub('', text)
+    if normalize_whitespace:
+        # str.split() splits on the same characters as the regex \s
+        return " ".join(text.split())
+    return text.strip()
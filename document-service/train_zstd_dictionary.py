@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Train the zstd dictionary used to compress stored document text
+Extracts text from a folder of sample PDFs (or reads .txt files) and writes the dictionary
+to ZSTD_DICT_PATH, which the service loads at startup in 'compressed' storage mode.
+
+    python train_zstd_dictionary.py test-container/pdfs [--output zstd_legal_it.dict] [--size 112640]
+"""
+
+import argparse
+from pathlib import Path
+
+from pdf_processor import PDFProcessor
+from text_codec import ZSTD_DICT_PATH, TextCodec, train_dictionary
+
+
+def load_samples(sample_dir: Path):
+    processor = PDFProcessor()
+    samples = []
+    for path in sorted(sample_dir.rglob("*")):
+        if path.suffix.lower() == ".pdf":
+            samples.append(processor.extract_text_from_bytes(path.read_bytes()))
+        elif path.suffix.lower() == ".txt":
+            samples.append(path.read_text(encoding="utf-8", errors="ignore"))
+    return [text for text in samples if text.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a zstd dictionary on sample documents")
+    parser.add_argument("sample_dir", type=Path)
+    parser.add_argument("--output", default=ZSTD_DICT_PATH)
+    parser.add_argument("--size", type=int, default=112640, help="Dictionary size in bytes")
+    args = parser.parse_args()
+
+    samples = load_samples(args.sample_dir)
+    if not samples:
+        print(f"❌ No PDF or text samples found in {args.sample_dir}")
+        return
+
+    dictionary = train_dictionary(samples, args.size)
+    with open(args.output, "wb") as f:
+        f.write(dictionary)
+    print(f"✅ Trained dictionary on {len(samples)} documents: {args.output} ({len(dictionary)} bytes)")
+
+    # Report the ratio obtained on the samples with and without the dictionary
+    plain, trained = TextCodec(dict_path=""), TextCodec(dict_path=args.output)
+    text_bytes = sum(len(text.encode("utf-8")) for text in samples)
+    plain_bytes = sum(len(plain.compress(text)) for text in samples)
+    trained_bytes = sum(len(trained.compress(text)) for text in samples)
+    print(f"📊 Text: {text_bytes} bytes, zstd: {plain_bytes} bytes, zstd+dictionary: {trained_bytes} bytes")
+
+
+if __name__ == "__main__":
+    main()
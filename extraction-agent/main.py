@@ -5,7 +5,7 @@ Optimized for CPU usage and reduced memory footprint
 """
 
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel
 import uvicorn
 import requests
@@ -13,6 +13,7 @@ import os
 from contextlib import asynccontextmanager
 import asyncio
 import logging
+import time
 import torch
 import google.generativeai as genai
 
@@ -109,6 +110,16 @@ app = FastAPI(
 
 # Document service URL (will be resolved via API Gateway)
 DOCUMENT_SERVICE_URL = os.getenv("DOCUMENT_SERVICE_URL", "http://document-service:8000")
+# Gemini post-processing is skipped when less than this is left of the caller's time budget
+SUMMARY_MIN_SECONDS = float(os.getenv("SUMMARY_MIN_SECONDS", "5"))
+
+def budget_deadline(budget_ms: Optional[str]) -> Optional[float]:
+    """Monotonic deadline from the orchestrator's X-Time-Budget-Ms header, or None without a valid budget"""
+    try:
+        budget = float(budget_ms) / 1000 if budget_ms else 0.0
+    except ValueError:
+        return None
+    return time.monotonic() + budget if budget > 0 else None
 
 # Pydantic models
 class ExtractionRequest(BaseModel):
@@ -116,6 +127,7 @@ class ExtractionRequest(BaseModel):
     agent_id: str = "extractor-agent"
     execution_id: Optional[str] = None
     query: Optional[str] = None  # NEW: Query for Gemini post-processing
+    document_texts: Optional[Dict[str, str]] = None  # Text already fetched by the orchestrator
 
 class EntityResult(BaseModel):
     label: str
@@ -238,7 +250,9 @@ async def fetch_document_text(document_id: str) -> str:
         response.raise_for_status()
         
         data = response.json()
-        return data.get("text_content", "")
+        if "text_content" in data:
+            return data["text_content"]
+        return "\n\n".join(chunk.get("text", "") for chunk in data.get("chunks", []))
         
     except requests.RequestException as e:
         logger.error(f"Failed to fetch document {document_id}: {str(e)}")
@@ -263,8 +277,12 @@ async def health_check():
 
 # Main extraction endpoint
 @app.post("/api/v1/agents/extract", response_model=ExtractionResponse)
-async def extract_entities(request: ExtractionRequest):
-    """Extract entities from documents using Italian NER model + Gemini post-processing"""
+async def extract_entities(request: ExtractionRequest, x_time_budget_ms: Optional[str] = Header(None)):
+    """
+    Extract entities from documents using Italian NER model + Gemini post-processing.
+    Within the caller's X-Time-Budget-Ms, post-processing is skipped if the NER step used up the budget.
+    """
+    deadline = budget_deadline(x_time_budget_ms)
     
     if not model_loaded:
         raise HTTPException(status_code=503, detail="NER model not ready")
@@ -276,10 +294,13 @@ async def extract_entities(request: ExtractionRequest):
         all_texts = []
         processed_docs = []
         
-        # Fetch text from all documents
+        # Fetch text from all documents (unless the orchestrator already sent it)
+        document_texts = request.document_texts or {}
         for doc_id in request.document_ids:
             try:
-                text = await fetch_document_text(doc_id)
+                text = document_texts.get(doc_id)
+                if text is None:
+                    text = await fetch_document_text(doc_id)
                 if text.strip():  # Only add non-empty texts
                     all_texts.append(text)
                     processed_docs.append(doc_id)
@@ -301,7 +322,9 @@ async def extract_entities(request: ExtractionRequest):
         
         # Post-process with Gemini if query is provided
         structured_summary = None
-        if request.query and concatenated_entities.strip():
+        if deadline is not None and deadline - time.monotonic() < SUMMARY_MIN_SECONDS:
+            logger.warning("Time budget almost exhausted: returning entities without Gemini post-processing")
+        elif request.query and concatenated_entities.strip():
             try:
                 structured_summary = summarize_with_gemini(request.query, concatenated_entities)
             except Exception as e:
@@ -328,7 +351,7 @@ async def extract_entities(request: ExtractionRequest):
 
 # Alternative endpoint for wrapper compatibility
 @app.post("/api/v1/agents/process")
-async def process_agent_task(request: dict):
+async def process_agent_task(request: dict, x_time_budget_ms: Optional[str] = Header(None)):
     """Process agent task (orchestrator compatibility endpoint)"""
     
     agent_id = request.get("agentId")
@@ -344,10 +367,11 @@ async def process_agent_task(request: dict):
         document_ids=document_ids,
         agent_id=agent_id,
         execution_id=execution_id,
-        query=prompt if prompt else None  # Use prompt as query
+        query=prompt if prompt else None,  # Use prompt as query
+        document_texts=request.get("documentTexts")
     )
     
-    result = await extract_entities(extraction_request)
+    result = await extract_entities(extraction_request, x_time_budget_ms)
     
     return {
         "agentId": agent_id,
@@ -299,12 +299,20 @@ export const getProjectDocuments = async (projectId, contextUserId) => {
       `📋 Fetching documents for project: ${projectId} for user: ${userId}`,
     );
 
-    const response = await apiClient.get(
-      `/api/v1/documents/${userId}/${encodeURIComponent(projectId.trim())}`,
-    );
+    // The listing is paginated: follow next_cursor until every page is loaded
+    const documents = [];
+    let cursor = null;
+    do {
+      const response = await apiClient.get(
+        `/api/v1/documents/${userId}/${encodeURIComponent(projectId.trim())}`,
+        { params: cursor ? { limit: 500, cursor } : { limit: 500 } },
+      );
+      documents.push(...(response.data.documents || []));
+      cursor = response.data.next_cursor;
+    } while (cursor);
 
-    console.log('✅ Project documents API response:', response.data);
-    return response.data.documents || [];
+    console.log(`✅ Project documents loaded: ${documents.length}`);
+    return documents;
   } catch (error) {
     console.error('❌ Get project documents error:', error);
 
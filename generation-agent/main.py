@@ -5,7 +5,7 @@ Supports both partial (query-based) and full document generation
 """
 
 from typing import List, Optional, Dict, Any, Union
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel
 import uvicorn
 import requests
@@ -13,6 +13,7 @@ import os
 from contextlib import asynccontextmanager
 import asyncio
 import logging
+import time
 import google.generativeai as genai
 
 # Configure logging
@@ -81,6 +82,15 @@ app = FastAPI(
 
 # Document service URL (will be resolved via API Gateway)
 DOCUMENT_SERVICE_URL = os.getenv("DOCUMENT_SERVICE_URL", "http://document-service:8000")
+DOCUMENT_CHUNK_CHARS = 4000  # Same split as document-service for large documents
+
+def budget_deadline(budget_ms: Optional[str]) -> Optional[float]:
+    """Monotonic deadline from the orchestrator's X-Time-Budget-Ms header, or None without a valid budget"""
+    try:
+        budget = float(budget_ms) / 1000 if budget_ms else 0.0
+    except ValueError:
+        return None
+    return time.monotonic() + budget if budget > 0 else None
 
 # Pydantic models
 class GenerationRequest(BaseModel):
@@ -89,6 +99,7 @@ class GenerationRequest(BaseModel):
     full_doc: bool = False  # True for full doc generation, False for query-based
     agent_id: str = "generation-agent"
     execution_id: Optional[str] = None
+    document_text: Optional[str] = None  # Full text already fetched by the orchestrator
 
 class GenerationResponse(BaseModel):
     success: bool
@@ -154,8 +165,12 @@ Fornisci una risposta concisa e rilevante."""
     
     raise HTTPException(status_code=503, detail="Gemini generation failed")
 
-def generate_chunked_content(query: str, chunks: List[str], full_doc: bool = False) -> str:
-    """Generate content from multiple chunks by processing them iteratively"""
+def generate_chunked_content(query: str, chunks: List[str], full_doc: bool = False,
+                             deadline: Optional[float] = None) -> str:
+    """
+    Generate content from multiple chunks by processing them iteratively.
+    With a deadline, no chunk (or synthesis) is started unless the slowest chunk so far would still fit.
+    """
     if not chunks:
         raise HTTPException(status_code=400, detail="No chunks provided")
     
@@ -164,8 +179,16 @@ def generate_chunked_content(query: str, chunks: List[str], full_doc: bool = Fal
     
     # For multiple chunks, we'll generate from each and then synthesize
     chunk_results = []
+    slowest_chunk = 0.0
+    
+    def out_of_time() -> bool:
+        return deadline is not None and time.monotonic() + slowest_chunk > deadline
     
     for i, chunk in enumerate(chunks):
+        if i > 0 and out_of_time():
+            logger.warning(f"Time budget exhausted: stopping after {i} of {len(chunks)} chunks")
+            break
+        started = time.monotonic()
         try:
             chunk_query = f"{query} (Focus on content from section {i+1} of {len(chunks)})"
             result = generate_with_gemini(chunk_query, chunk, False)  # Process chunks individually
@@ -173,12 +196,18 @@ def generate_chunked_content(query: str, chunks: List[str], full_doc: bool = Fal
         except Exception as e:
             logger.warning(f"Failed to process chunk {i+1}: {e}")
             continue
+        finally:
+            slowest_chunk = max(slowest_chunk, time.monotonic() - started)
     
     if not chunk_results:
         raise HTTPException(status_code=500, detail="Failed to process any chunks")
     
     # Synthesize results if multiple chunks were processed
     if len(chunk_results) > 1:
+        if out_of_time():
+            logger.warning("Time budget exhausted: returning combined results without synthesis")
+            return "\n\n".join(chunk_results)
+        
         synthesis_prompt = f"Sintetizza e combina le seguenti risposte parziali in una risposta coerente e completa per: {query}\n\n"
         synthesis_prompt += "\n\n".join([f"Part {i+1}:\n{result}" for i, result in enumerate(chunk_results)])
         
@@ -239,6 +268,15 @@ async def fetch_document_content(document_id: str, query: Optional[str] = None,
         logger.error(f"Error processing document {document_id}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+def document_text_to_chunks(text: str) -> Dict[str, Any]:
+    """Shape provided document text like a document-service /text response"""
+    if len(text) <= DOCUMENT_CHUNK_CHARS:
+        return {"mode": "provided_text", "chunks": [{"text": text}]}
+    return {
+        "mode": "provided_text",
+        "chunks": [{"text": text[i:i + DOCUMENT_CHUNK_CHARS]} for i in range(0, len(text), DOCUMENT_CHUNK_CHARS)]
+    }
+
 # Health check endpoint
 @app.get("/")
 @app.get("/health")
@@ -252,8 +290,9 @@ async def health_check():
 
 # Main generation endpoint
 @app.post("/api/v1/agents/generate", response_model=GenerationResponse)
-async def generate_content(request: GenerationRequest):
-    """Generate content from document using Gemini"""
+async def generate_content(request: GenerationRequest, x_time_budget_ms: Optional[str] = Header(None)):
+    """Generate content from document using Gemini, within the caller's X-Time-Budget-Ms if given"""
+    deadline = budget_deadline(x_time_budget_ms)
     
     if not service_ready:
         raise HTTPException(status_code=503, detail="Generation service not ready")
@@ -266,7 +305,10 @@ async def generate_content(request: GenerationRequest):
     
     try:
         # Fetch document content based on generation type
-        if request.full_doc:
+        if request.full_doc and request.document_text:
+            # Full document already provided by the orchestrator
+            doc_data = document_text_to_chunks(request.document_text)
+        elif request.full_doc:
             # Full document generation - get all content
             logger.info(f"Fetching full document for generation: {request.document_id}")
             doc_data = await fetch_document_content(request.document_id, None, False)
@@ -278,7 +320,10 @@ async def generate_content(request: GenerationRequest):
             # If query-based search returns no chunks, fallback to full document
             if not doc_data.get("chunks") or len(doc_data["chunks"]) == 0:
                 logger.info(f"No relevant chunks found for query, falling back to full document")
-                doc_data = await fetch_document_content(request.document_id, None, False)
+                if request.document_text:
+                    doc_data = document_text_to_chunks(request.document_text)
+                else:
+                    doc_data = await fetch_document_content(request.document_id, None, False)
         
         if not doc_data.get("chunks"):
             raise HTTPException(
@@ -302,7 +347,7 @@ async def generate_content(request: GenerationRequest):
             generated_content = generate_with_gemini(request.query, text_chunks[0], request.full_doc)
         else:
             # Multiple chunks
-            generated_content = generate_chunked_content(request.query, text_chunks, request.full_doc)
+            generated_content = generate_chunked_content(request.query, text_chunks, request.full_doc, deadline)
         
         return GenerationResponse(
             success=True,
@@ -325,7 +370,7 @@ async def generate_content(request: GenerationRequest):
 
 # Alternative endpoint for orchestrator compatibility
 @app.post("/api/v1/agents/process")
-async def process_agent_task(request: dict):
+async def process_agent_task(request: dict, x_time_budget_ms: Optional[str] = Header(None)):
     """Process agent task (orchestrator compatibility endpoint)"""
     
     agent_id = request.get("agentId")
@@ -348,10 +393,11 @@ async def process_agent_task(request: dict):
         query=prompt,
         full_doc=full_doc,
         agent_id=agent_id,
-        execution_id=execution_id
+        execution_id=execution_id,
+        document_text=(request.get("documentTexts") or {}).get(document_id)
     )
     
-    result = await generate_content(generation_request)
+    result = await generate_content(generation_request, x_time_budget_ms)
     
     return {
         "agentId": agent_id,
@@ -0,0 +1,330 @@
+"""
+In-process caches for the Orchestration Agent
+Cache backends share one small interface (get/put/stats) with TTL and LRU eviction:
+MemoryCacheBackend keeps entries in process, DiskCacheBackend keeps them as JSON files
+so they survive restarts (its blocking file I/O runs on worker threads, off the event loop). PlanCache stores planner output keyed by prompt shape;
+ResponseCache stores whole orchestration responses and coalesces identical in-flight requests.
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+PLAN_CACHE_BACKEND = os.getenv("PLAN_CACHE_BACKEND", "memory").lower()  # memory, disk, none
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "1024"))
+PLAN_CACHE_TTL_SECONDS = float(os.getenv("PLAN_CACHE_TTL_SECONDS", "3600"))
+PLAN_CACHE_DIR = os.getenv("PLAN_CACHE_DIR", "/tmp/orchestration-cache/plans")
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()  # memory, disk, none
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "/tmp/orchestration-cache/responses")
+# A full disk cache is evicted down to this fraction of its entries, so listing it is rare
+DISK_CACHE_EVICT_RATIO = float(os.getenv("DISK_CACHE_EVICT_RATIO", "0.9"))
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a prompt: NFC, case-folded, whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFC", prompt).casefold().split())
+
+
+def cache_key(*parts: str) -> str:
+    """Stable hex key for a tuple of strings"""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """LRU dict with a TTL per entry"""
+
+    blocking = False
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.time():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: str, value: Any, ttl_seconds: float):
+        self._entries[key] = (value, time.time() + ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
+
+
+class DiskCacheBackend:
+    """
+    One JSON file per entry under a directory. File mtime is the LRU clock (touched on every hit);
+    values must be JSON-serializable. Unreadable files are treated as misses and removed.
+    Entries are counted as they are written and removed; the directory is only listed to evict,
+    once the count goes over max_entries, and then down to DISK_CACHE_EVICT_RATIO of it.
+    """
+
+    blocking = True
+
+    def __init__(self, directory: str, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.expirations = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        # Methods run on worker threads: the lock guards the entry count and eviction
+        self._lock = threading.Lock()
+        self._entries = len(self._entry_files())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self.delete(key)
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            self.delete(key)
+            self.expirations += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get("value")
+
+    def put(self, key: str, value: Any, ttl_seconds: float):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": time.time() + ttl_seconds, "value": value}, f, ensure_ascii=False)
+        with self._lock:
+            existed = os.path.exists(path)
+            os.replace(tmp_path, path)  # Atomic: readers never see a partial entry
+            if not existed:
+                self._entries += 1
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            try:
+                os.remove(self._path(key))
+                self._entries -= 1
+            except OSError:
+                pass
+
+    def _entry_files(self) -> List[str]:
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")]
+
+    def _evict(self):
+        """Remove the least recently used entries down to DISK_CACHE_EVICT_RATIO of max_entries (lock held)"""
+        files = self._entry_files()
+        keep = int(self.max_entries * DISK_CACHE_EVICT_RATIO)
+        if len(files) > keep:
+            files.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+            for path in files[:len(files) - keep]:
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except OSError:
+                    pass
+        self._entries = min(len(files), keep)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "disk",
+            "directory": self.directory,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
+
+
+async def backend_call(backend, method: str, *args):
+    """Call a backend method, on a worker thread if the backend does blocking I/O"""
+    if backend.blocking:
+        return await asyncio.to_thread(getattr(backend, method), *args)
+    return getattr(backend, method)(*args)
+
+
+def create_cache_backend(kind: str, max_entries: int, directory: str):
+    """Backend for a cache setting: "memory", "disk" (falls back to memory if unusable) or "none" (None)"""
+    if kind == "none":
+        return None
+    if kind == "disk":
+        try:
+            return DiskCacheBackend(directory, max_entries)
+        except OSError as e:
+            print(f"⚠️ Cannot use disk cache at {directory} ({e}), falling back to memory")
+    return MemoryCacheBackend(max_entries)
+
+
+class PlanCache:
+    """Planned actions keyed by (planner model, normalized prompt, set of document titles)"""
+
+    def __init__(self, backend=None, ttl_seconds: float = PLAN_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, prompt: str, document_titles: List[str]) -> str:
+        titles = sorted({normalize_prompt(title) for title in document_titles})
+        return cache_key(model, normalize_prompt(prompt), *titles)
+
+    async def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        if self.backend is None:
+            return None
+        actions = await backend_call(self.backend, "get", key)
+        if actions is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Callers may annotate actions; never hand out the cached objects themselves
+        return copy.deepcopy(actions)
+
+    async def put(self, key: str, actions: List[Dict[str, Any]]):
+        if self.backend is not None:
+            await backend_call(self.backend, "put", key, copy.deepcopy(actions), self.ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            **(self.backend.stats() if self.backend else {"backend": "none"}),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class _FlightAbandoned(Exception):
+    """The request executing a flight was cancelled before finishing; waiters should retry"""
+
+
+class ResponseCache:
+    """
+    Orchestration responses keyed by (prompt, document ids, document content hashes), with
+    single-flight: concurrent identical requests wait for the one already executing.
+    """
+
+    def __init__(self, backend=None, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def key(prompt: str, document_hashes: Dict[str, str]) -> str:
+        """document_hashes maps each document id to a hash of its current content"""
+        prompt_hash = cache_key(normalize_prompt(prompt))
+        documents = [f"{document_id}:{document_hashes[document_id]}" for document_id in sorted(document_hashes)]
+        return cache_key(prompt_hash, *documents)
+
+    async def get_or_run(self, key: str, run: Callable[[], Awaitable[Tuple[Dict[str, Any], bool]]],
+                         bypass: bool = False) -> Tuple[Dict[str, Any], str]:
+        """
+        Cached value for key, or the result of run() -> (value, cacheable).
+        Returns (value, source) with source "hit", "coalesced", "miss" or "bypass".
+        bypass skips the lookup and the in-flight wait, but still stores a fresh cacheable result.
+        """
+        if bypass:
+            self.bypassed += 1
+            value, cacheable = await run()
+            if cacheable:
+                await self._put(key, value)
+            return value, "bypass"
+
+        while True:
+            if self.backend is not None:
+                value = await backend_call(self.backend, "get", key)
+                if value is not None:
+                    self.hits += 1
+                    return copy.deepcopy(value), "hit"
+
+            flight = self._in_flight.get(key)
+            if flight is None:
+                break
+            try:
+                value = await asyncio.shield(flight)
+                self.coalesced += 1
+                return copy.deepcopy(value), "coalesced"
+            except _FlightAbandoned:
+                continue  # Take over the execution ourselves
+
+        self.misses += 1
+        flight = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = flight
+        try:
+            value, cacheable = await run()
+        except asyncio.CancelledError:
+            flight.set_exception(_FlightAbandoned())
+            raise
+        except BaseException as e:
+            # Waiters share the failure instead of re-running a pipeline that just failed
+            flight.set_exception(e)
+            raise
+        else:
+            # Release the waiters first: they need not wait for the cache write
+            flight.set_result(copy.deepcopy(value))
+            if cacheable:
+                await self._put(key, value)
+            return value, "miss"
+        finally:
+            self._in_flight.pop(key, None)
+            if flight.done() and not flight.cancelled():
+                flight.exception()  # Mark retrieved: there may have been no waiters
+
+    async def _put(self, key: str, value: Dict[str, Any]):
+        if self.backend is not None:
+            await backend_call(self.backend, "put", key, copy.deepcopy(value), self.ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            **(self.backend.stats() if self.backend else {"backend": "none"}),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "in_flight": len(self._in_flight),
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,96 @@
+"""
+Request deadlines for the Orchestration Agent
+Every orchestration request gets a time budget. The Deadline lives in a context variable, so
+planning, actions, document ranking and final reasoning (and the tasks they spawn) all see the
+same budget without passing it through every call. Downstream agents receive what is left of it
+in the X-Time-Budget-Ms header. Steps that no longer fit are skipped or cut short and recorded
+as degradations, so the response is still delivered, just not cached.
+"""
+
+import contextvars
+import os
+import time
+from typing import Dict, List, Optional
+
+ORCHESTRATION_DEADLINE_SECONDS = float(os.getenv("ORCHESTRATION_DEADLINE_SECONDS", "300"))
+# Kept free for the final reasoning call while planning and actions run
+DEADLINE_FINAL_RESERVE_SECONDS = float(os.getenv("DEADLINE_FINAL_RESERVE_SECONDS", "30"))
+# A step with less time than this left is skipped instead of started
+DEADLINE_MIN_STEP_SECONDS = float(os.getenv("DEADLINE_MIN_STEP_SECONDS", "2"))
+# Past the budget plus this grace the request is abandoned with 504
+DEADLINE_GRACE_SECONDS = float(os.getenv("DEADLINE_GRACE_SECONDS", "5"))
+
+TIME_BUDGET_HEADER = "X-Time-Budget-Ms"
+
+
+class Deadline:
+    """Time budget of one request, measured on the monotonic clock"""
+
+    def __init__(self, budget_seconds: float):
+        self.budget_seconds = max(0.0, budget_seconds)
+        self.expires_at = time.monotonic() + self.budget_seconds
+        # Never reserve more than half of a short budget, or planning would get nothing
+        self.final_reserve = min(DEADLINE_FINAL_RESERVE_SECONDS, self.budget_seconds / 2)
+        self.degradations: List[str] = []
+
+    @classmethod
+    def for_request(cls, requested_seconds: Optional[float] = None,
+                    budget_header: Optional[str] = None) -> "Deadline":
+        """
+        Budget for a request: ORCHESTRATION_DEADLINE_SECONDS, shortened by the request's own
+        deadline_seconds and by an upstream X-Time-Budget-Ms header (whichever is smallest)
+        """
+        budget = ORCHESTRATION_DEADLINE_SECONDS
+        if requested_seconds and requested_seconds > 0:
+            budget = min(budget, requested_seconds)
+        if budget_header:
+            try:
+                upstream = float(budget_header) / 1000
+                if upstream > 0:
+                    budget = min(budget, upstream)
+            except ValueError:
+                pass
+        return cls(budget)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def overdue(self, grace_seconds: float = 0.0) -> bool:
+        return time.monotonic() > self.expires_at + grace_seconds
+
+    def timeout(self, cap: Optional[float] = None, before_final: bool = False) -> float:
+        """Time a step may take: what is left (minus the final reserve if before_final), at most cap"""
+        available = self.remaining() - (self.final_reserve if before_final else 0.0)
+        available = max(0.0, available)
+        return available if cap is None else min(cap, available)
+
+    def degrade(self, reason: str):
+        self.degradations.append(reason)
+
+
+current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("current_deadline",
+                                                                                     default=None)
+
+
+def step_timeout(cap: Optional[float] = None, before_final: bool = False) -> Optional[float]:
+    """Timeout for a step of the current request; just cap when no deadline is set"""
+    deadline = current_deadline.get()
+    return cap if deadline is None else deadline.timeout(cap, before_final)
+
+
+def has_time_for_step(timeout: Optional[float]) -> bool:
+    return timeout is None or timeout >= DEADLINE_MIN_STEP_SECONDS
+
+
+def degrade(reason: str):
+    """Record that the current request skipped or cut a step to stay within its deadline"""
+    deadline = current_deadline.get()
+    if deadline is not None:
+        deadline.degrade(reason)
+
+
+def budget_headers(timeout: Optional[float]) -> Dict[str, str]:
+    """X-Time-Budget-Ms header telling a downstream service how long it has"""
+    if timeout is None:
+        return {}
+    return {TIME_BUDGET_HEADER: str(int(timeout * 1000))}
@@ -4,8 +4,9 @@ AI Legal Assistant that coordinates multiple agents using Gemini for document-ba
 Supports complex multi-agent workflows for legal document processing
 """
 
-from typing import List, Optional, Dict, Any, Union
-from fastapi import FastAPI, HTTPException
+from typing import List, Optional, Dict, Any, Union, Callable, Awaitable, AsyncIterator
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 import httpx
@@ -14,11 +15,20 @@ import json
 import re
 from contextlib import asynccontextmanager
 import asyncio
+import hashlib
 import logging
+import threading
+import time
 from google import genai
 from google.genai import types
 from urllib.parse import quote
 
+from cache import (PLAN_CACHE_BACKEND, PLAN_CACHE_DIR, PLAN_CACHE_MAX_ENTRIES, RESPONSE_CACHE_BACKEND,
+                   RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_ENTRIES, PlanCache, ResponseCache,
+                   create_cache_backend, normalize_prompt)
+from deadline import (DEADLINE_GRACE_SECONDS, TIME_BUDGET_HEADER, Deadline, budget_headers, current_deadline,
+                      degrade, has_time_for_step, step_timeout)
+
 httpx_client = None
 
 
@@ -31,31 +41,91 @@ GEMINI_API_KEYS = [
     ""
 ]
 
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# Concurrent in-flight Gemini calls across all requests
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "16"))
+
 # Global variables
 gemini_client = None
 current_gemini_key_index = 0
+gemini_key_lock = threading.RLock()  # Guards gemini_client/current_gemini_key_index
+gemini_semaphore = asyncio.Semaphore(max(1, GEMINI_CONCURRENCY))
 service_ready = False
 
 # Service URLs
 DOCUMENT_SERVICE_URL = os.getenv("DOCUMENT_SERVICE_URL", "http://document-service:8000")
 WRAPPER_URL = os.getenv("WRAPPER_URL", "http://orchestration-wrapper:8010")
 
+# Document fetches fan out per request, bounded and with a timeout per document
+DOC_FETCH_CONCURRENCY = int(os.getenv("DOC_FETCH_CONCURRENCY", "8"))
+DOC_FETCH_TIMEOUT_SECONDS = float(os.getenv("DOC_FETCH_TIMEOUT_SECONDS", "30"))
+# Send the already fetched document text along with extraction/generation calls
+FORWARD_DOCUMENT_TEXT = os.getenv("FORWARD_DOCUMENT_TEXT", "false").lower() == "true"
+# Planned actions run as a dependency graph: independent actions in parallel, each with a deadline
+ACTION_CONCURRENCY = int(os.getenv("ACTION_CONCURRENCY", "4"))
+ACTION_TIMEOUT_SECONDS = float(os.getenv("ACTION_TIMEOUT_SECONDS", "120"))
+# The final reasoning prompt is packed into a token budget (tokens estimated from characters):
+# agent results get a share of it, the rest goes to the document chunks most relevant to the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "30000"))
+CONTEXT_AGENT_RESULTS_SHARE = float(os.getenv("CONTEXT_AGENT_RESULTS_SHARE", "0.3"))
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+CONTEXT_RANK_MAX_CHUNKS = int(os.getenv("CONTEXT_RANK_MAX_CHUNKS", "100"))
+BATCH_QUERY_MAX_DOCUMENTS = 50  # document-service limit per batch query
+# Runs with an execution_id are recorded step by step in document-service and resumed on retry
+EXECUTION_PERSISTENCE = os.getenv("EXECUTION_PERSISTENCE", "true").lower() == "true"
+# How often a non-streaming request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1"))
+# Trivial single-document prompts skip the LLM planner and go straight to extraction
+PLAN_FAST_PATH = os.getenv("PLAN_FAST_PATH", "true").lower() == "true"
+PLAN_FAST_PATH_MAX_WORDS = int(os.getenv("PLAN_FAST_PATH_MAX_WORDS", "12"))
+# Prompts mentioning these need legal research or a generated list, so they always go to the planner
+PLAN_FAST_PATH_EXCLUDED_TERMS = (
+    "giurisprudenz", "normativ", "legge", "sentenz", "precedent", "cassazione", "codice",
+    "art.", "articol", "elenc", "lista", "tabella", "genera", "confront", "analizz", "analisi"
+)
+
+plan_cache = PlanCache(create_cache_backend(PLAN_CACHE_BACKEND, PLAN_CACHE_MAX_ENTRIES, PLAN_CACHE_DIR))
+response_cache = ResponseCache(create_cache_backend(RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_MAX_ENTRIES,
+                                                    RESPONSE_CACHE_DIR))
+
 def configure_gemini():
     """Configure Gemini with current API key"""
     global gemini_client, current_gemini_key_index
-    try:
-        gemini_client = genai.Client(api_key=GEMINI_API_KEYS[current_gemini_key_index])
-        logger.info(f"Configured Gemini with key index {current_gemini_key_index}")
-    except Exception as e:
-        logger.error(f"Failed to configure Gemini: {e}")
-        raise
+    with gemini_key_lock:
+        try:
+            gemini_client = genai.Client(api_key=GEMINI_API_KEYS[current_gemini_key_index])
+            logger.info(f"Configured Gemini with key index {current_gemini_key_index}")
+        except Exception as e:
+            logger.error(f"Failed to configure Gemini: {e}")
+            raise
 
-def try_next_gemini_key():
-    """Switch to next Gemini API key"""
+def try_next_gemini_key(failed_key_index: Optional[int] = None):
+    """
+    Switch to next Gemini API key.
+    With failed_key_index, only rotate if that key is still current: concurrent requests failing
+    on the same key then rotate once instead of skipping over working keys.
+    """
     global current_gemini_key_index
-    current_gemini_key_index = (current_gemini_key_index + 1) % len(GEMINI_API_KEYS)
-    configure_gemini()
-    logger.info(f"Switched to Gemini key index {current_gemini_key_index}")
+    with gemini_key_lock:
+        if failed_key_index is not None and failed_key_index != current_gemini_key_index:
+            return
+        current_gemini_key_index = (current_gemini_key_index + 1) % len(GEMINI_API_KEYS)
+        configure_gemini()
+        logger.info(f"Switched to Gemini key index {current_gemini_key_index}")
+
+def get_gemini_client():
+    """Snapshot of the current client and the key index it was built with"""
+    with gemini_key_lock:
+        return gemini_client, current_gemini_key_index
+
+async def gemini_generate(client, contents: str) -> str:
+    """Run a Gemini generation on the SDK's async API, so the event loop keeps serving other requests"""
+    async with gemini_semaphore:
+        response = await client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=contents
+        )
+    return response.text.strip()
 
 def initialize_service():
     """Initialize the orchestration service"""
@@ -100,12 +170,15 @@ class OrchestrationRequest(BaseModel):
     prompt: str  # The user's legal query
     agent_id: str = "orchestration-agent"
     execution_id: Optional[str] = None
+    bypass_cache: bool = False  # Always run the pipeline (the fresh response still refreshes the cache)
+    deadline_seconds: Optional[float] = None  # Time budget for the whole request (at most ORCHESTRATION_DEADLINE_SECONDS)
 
 class AgentAction(BaseModel):
     action_type: str  # "search", "extract", "generate"
     query: str
     document_titles: Optional[List[str]] = None
     full_doc: Optional[bool] = False
+    depends_on: Optional[List[int]] = None  # Indices of earlier actions that must finish first
 
 class OrchestrationResponse(BaseModel):
     success: bool
@@ -116,6 +189,7 @@ class OrchestrationResponse(BaseModel):
     actions_taken: List[Dict[str, Any]]
     final_response: str
     message: str
+    cache: Optional[str] = None  # hit, coalesced, miss, bypass (None when the response is not cacheable)
 
 PLANNING_SYSTEM_PROMPT = """Sei un assistente legale specializzato nel coordinare diversi agenti per l'analisi di documenti legali. Il tuo ruolo è pianificare la sequenza ottimale di azioni.
 
@@ -128,6 +202,7 @@ REGOLE IMPORTANTI:
 1. DEVI SEMPRE rispondere SOLO con un array JSON di azioni
 2. Anche per domande semplici, usa generatore 
 3. Per analisi legali, inizia sempre con "search" per il contesto normativo
+4. Le azioni vengono eseguite in parallelo; aggiungi "depends_on" (indici, da 0, delle azioni precedenti) SOLO se un'azione deve attendere il completamento di altre
 
 FORMATO RISPOSTA - SOLO JSON una delle due:
 [
@@ -259,127 +334,142 @@ def extract_json_actions(response_text: str) -> Optional[List[Dict[str, Any]]]:
         logger.error(f"Error extracting JSON actions: {e}")
         return None
 
-async def fetch_document_context(document_id: str) -> Dict[str, Any]:
-    """Fetch document title and initial lines for planning context"""
-    global httpx_client
-    try:
-        parts = document_id.split('_')
-        if len(parts) < 3:
-            raise ValueError(f"Invalid document_id format: {document_id}")
-        
-        user_id = parts[0]
-        doc_id = parts[-1]
-        project_id = '_'.join(parts[1:-1])
-        
-        encoded_project_id = quote(project_id, safe='')
-        url = f"{DOCUMENT_SERVICE_URL}/api/v1/documents/{user_id}/{encoded_project_id}/{doc_id}/text"
-        
-        response = await httpx_client.get(url)
-        response.raise_for_status()
-        
-        doc_data = response.json()
-        chunks = doc_data.get("chunks", [])
-        
-        # Extract title and first few lines for planning context
-        if chunks:
-            first_chunk = chunks[0].get("text", "")
-            title = first_chunk.split('\n')[0][:100] if first_chunk else f"Document {doc_id}"
-            first_lines = '\n'.join(first_chunk.split('\n')[:3])[:200]
-        else:
-            title = f"Document {doc_id}"
-            first_lines = "No content available"
-        
-        return {
-            "document_id": document_id,
-            "title": title,
-            "first_lines": first_lines
-        }
-        
-    except Exception as e:
-        logger.error(f"Failed to fetch document context {document_id}: {e}")
-        raise HTTPException(status_code=502, detail=f"Failed to fetch document context: {e}")
+def split_document_id(document_id: str) -> tuple[str, str, str]:
+    """Split userId_projectId_docId (the project id may itself contain underscores)"""
+    parts = document_id.split('_')
+    if len(parts) < 3:
+        raise ValueError(f"Invalid document_id format: {document_id}")
+    return parts[0], '_'.join(parts[1:-1]), parts[-1]
 
-async def fetch_document_full_content(document_id: str) -> Dict[str, Any]:
-    """Fetch complete document content for reasoning agent"""
+def describe_document(document_id: str, doc_data: Dict[str, Any], mode: Optional[str] = None) -> Dict[str, Any]:
+    """Derive title, first lines and full text from a document-service /text response"""
+    doc_id = split_document_id(document_id)[2]
+    chunks = doc_data.get("chunks", [])
+    
+    content_hash = None
+    if chunks:
+        first_chunk = chunks[0].get("text", "")
+        title = first_chunk.split('\n')[0][:100] if first_chunk else f"Document {doc_id}"
+        first_lines = '\n'.join(first_chunk.split('\n')[:3])[:200]
+        # Combine all chunks for full content
+        full_text = "\n\n".join([chunk.get("text", "") for chunk in chunks if chunk.get("text")])
+        content_hash = hashlib.sha256(full_text.encode("utf-8")).hexdigest()
+    else:
+        title = f"Document {doc_id}"
+        first_lines = "No content available"
+        full_text = "No content available"
+    
+    return {
+        "document_id": document_id,
+        "title": title,
+        "first_lines": first_lines,
+        "full_text": full_text,
+        "chunks_count": len(chunks),
+        "mode": mode or doc_data.get("mode", "unknown"),
+        "content_hash": content_hash
+    }
+
+async def fetch_document(document_id: str) -> Dict[str, Any]:
+    """Fetch a document's full chunk list once; everything else is derived from it"""
     global httpx_client
+    user_id, project_id, doc_id = split_document_id(document_id)
+    encoded_project_id = quote(project_id, safe='')
+    url = f"{DOCUMENT_SERVICE_URL}/api/v1/documents/{user_id}/{encoded_project_id}/{doc_id}/text"
+    
     try:
-        parts = document_id.split('_')
-        if len(parts) < 3:
-            raise ValueError(f"Invalid document_id format: {document_id}")
-        
-        user_id = parts[0]
-        doc_id = parts[-1]
-        project_id = '_'.join(parts[1:-1])
-        
-        encoded_project_id = quote(project_id, safe='')
-        
-        # First try to get full chunks (for chunked documents)
-        url = f"{DOCUMENT_SERVICE_URL}/api/v1/documents/{user_id}/{encoded_project_id}/{doc_id}/text"
-        params = {"full_chunks": True}  # Request all chunks for full document processing
-        
-        response = await httpx_client.get(url, params=params)
+        # Request all chunks for full document processing
+        response = await httpx_client.get(url, params={"full_chunks": True})
         response.raise_for_status()
-        
-        doc_data = response.json()
-        chunks = doc_data.get("chunks", [])
-        
-        # Extract title
-        if chunks:
-            first_chunk = chunks[0].get("text", "")
-            title = first_chunk.split('\n')[0][:100] if first_chunk else f"Document {doc_id}"
-            
-            # Combine all chunks for full content
-            full_text = "\n\n".join([chunk.get("text", "") for chunk in chunks if chunk.get("text")])
-        else:
-            title = f"Document {doc_id}"
-            full_text = "No content available"
-        
-        return {
-            "document_id": document_id,
-            "title": title,
-            "full_text": full_text,
-            "chunks_count": len(chunks),
-            "mode": doc_data.get("mode", "unknown")
-        }
-        
+        return describe_document(document_id, response.json())
     except Exception as e:
         logger.error(f"Failed to fetch full document content {document_id}: {e}")
-        
-        # Fallback: try to get regular text if full chunks fail
+    
+    # Fallback: try to get regular text if full chunks fail
+    response = await httpx_client.get(url)
+    response.raise_for_status()
+    return describe_document(document_id, response.json(), mode="fallback")
+
+class DocumentMemo:
+    """
+    Request-scoped document cache: each document is fetched from document-service once
+    (concurrent callers share the fetch) and planning context, full content and the text
+    forwarded to agents are all derived from that single response.
+    """
+    
+    def __init__(self):
+        self._fetches: Dict[str, asyncio.Task] = {}
+    
+    async def get(self, document_id: str) -> Dict[str, Any]:
+        task = self._fetches.get(document_id)
+        if task is None:
+            task = asyncio.create_task(fetch_document(document_id))
+            self._fetches[document_id] = task
+        # Shielded so a caller's timeout does not cancel the fetch other callers share
+        return await asyncio.shield(task)
+    
+    async def context(self, document_id: str) -> Dict[str, Any]:
+        """Document title and initial lines for planning context"""
         try:
-            url = f"{DOCUMENT_SERVICE_URL}/api/v1/documents/{user_id}/{encoded_project_id}/{doc_id}/text"
-            response = await httpx_client.get(url)
-            response.raise_for_status()
-            
-            doc_data = response.json()
-            chunks = doc_data.get("chunks", [])
-            
-            if chunks:
-                first_chunk = chunks[0].get("text", "")
-                title = first_chunk.split('\n')[0][:100] if first_chunk else f"Document {doc_id}"
-                full_text = first_chunk  # At least get the first chunk
-            else:
-                title = f"Document {doc_id}"
-                full_text = "No content available"
-            
-            return {
-                "document_id": document_id,
-                "title": title,
-                "full_text": full_text,
-                "chunks_count": len(chunks),
-                "mode": "fallback"
-            }
-            
-        except Exception as fallback_error:
-            logger.error(f"Fallback also failed for {document_id}: {fallback_error}")
+            doc = await self.get(document_id)
+        except Exception as e:
+            logger.error(f"Failed to fetch document context {document_id}: {e}")
+            raise HTTPException(status_code=502, detail=f"Failed to fetch document context: {e}")
+        return {key: doc[key] for key in ("document_id", "title", "first_lines")}
+    
+    async def full_content(self, document_id: str) -> Dict[str, Any]:
+        """Complete document content for the reasoning step"""
+        try:
+            doc = await self.get(document_id)
+        except Exception as e:
+            logger.error(f"Fallback also failed for {document_id}: {e}")
             return {
                 "document_id": document_id,
-                "title": f"Document {doc_id}",
+                "title": f"Document {document_id.split('_')[-1]}",
                 "full_text": "Content unavailable due to retrieval error",
                 "chunks_count": 0,
                 "mode": "error"
             }
+        return {key: doc[key] for key in ("document_id", "title", "full_text", "chunks_count", "mode")}
+    
+    async def content_hash(self, document_id: str) -> Optional[str]:
+        """Hash of the document's full text, or None if it could not be fetched or is empty"""
+        try:
+            return (await self.get(document_id))["content_hash"]
+        except Exception:
+            return None
     
+    def texts(self, document_ids: List[str]) -> Dict[str, str]:
+        """Full text of the documents already fetched successfully, for forwarding to agents"""
+        texts = {}
+        for document_id in document_ids:
+            task = self._fetches.get(document_id)
+            if task is not None and task.done() and not task.cancelled() and task.exception() is None:
+                texts[document_id] = task.result()["full_text"]
+        return texts
+    
+    def cancel(self):
+        for task in self._fetches.values():
+            if not task.done():
+                task.cancel()
+
+async def fetch_documents_concurrently(
+    fetch: Callable[[str], Awaitable[Dict[str, Any]]], document_ids: List[str]
+) -> Dict[str, Union[Dict[str, Any], BaseException]]:
+    """
+    Run fetch(document_id) for every document, at most DOC_FETCH_CONCURRENCY at a time and
+    each bounded by DOC_FETCH_TIMEOUT_SECONDS. Returns {document_id: result or exception}
+    in input order, so one failing document does not fail the others.
+    The timeout is shortened to whatever is left of the request's deadline.
+    """
+    semaphore = asyncio.Semaphore(DOC_FETCH_CONCURRENCY)
+
+    async def fetch_one(document_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await asyncio.wait_for(fetch(document_id), timeout=step_timeout(DOC_FETCH_TIMEOUT_SECONDS))
+
+    results = await asyncio.gather(*(fetch_one(doc_id) for doc_id in document_ids), return_exceptions=True)
+    return dict(zip(document_ids, results))
+
 def title_to_document_id(title: str, available_docs: List[Dict]) -> Optional[str]:
     """Convert document title back to document ID"""
     for doc in available_docs:
@@ -387,96 +477,118 @@ def title_to_document_id(title: str, available_docs: List[Dict]) -> Optional[str
             return doc["document_id"]
     return None
 
-async def execute_search_action(query: str) -> str:
-    """Execute search agent action"""
+async def post_to_agent(url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    POST an action to an agent (through the wrapper). The call is bounded by the action's share of
+    the request deadline, and the agent is told that budget in the X-Time-Budget-Ms header.
+    """
     global httpx_client
-    try:
-        url = f"{WRAPPER_URL}/api/v1/agents/search"
-        payload = {
-            "query": query,
-            "agent_id": "search-agent"
-        }
-        
-        response = await httpx_client.post(url, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
-        return result.get("results", "No search results found")
-        
-    except Exception as e:
-        logger.error(f"Search action failed: {e}")
-        return f"Search failed: {str(e)}"
+    timeout = step_timeout(ACTION_TIMEOUT_SECONDS, before_final=True)
+    response = await httpx_client.post(url, json=payload, headers=budget_headers(timeout), timeout=timeout)
+    response.raise_for_status()
+    return response.json()
 
-async def execute_extraction_action(query: str, document_titles: List[str], available_docs: List[Dict]) -> str:
-    """Execute extraction agent action"""
-    global httpx_client
-    try:
-        # Convert titles to document IDs
-        document_ids = []
-        for title in document_titles:
-            doc_id = title_to_document_id(title, available_docs)
-            if doc_id:
-                document_ids.append(doc_id)
-        
-        if not document_ids:
-            return "No valid documents found for extraction"
-        
-        url = f"{WRAPPER_URL}/api/v1/agents/process"
-        payload = {
-            "agentId": "extraction-agent",
-            "prompt": query,
-            "documentIds": document_ids
-        }
-        
-        response = await httpx_client.post(url, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
-        return result.get("response", "No extraction results")
-        
-    except Exception as e:
-        logger.error(f"Extraction action failed: {e}")
-        return f"Extraction failed: {str(e)}"
+async def execute_search_action(query: str) -> str:
+    """Execute search agent action (agent and HTTP errors propagate, so the action counts as failed)"""
+    url = f"{WRAPPER_URL}/api/v1/agents/search"
+    payload = {
+        "query": query,
+        "agent_id": "search-agent"
+    }
+    
+    result = await post_to_agent(url, payload)
+    return result.get("results", "No search results found")
 
-async def execute_generation_action(query: str, document_titles: List[str], full_doc: bool, available_docs: List[Dict]) -> str:
-    """Execute generation agent action"""
-    global httpx_client
-    try:
-        # Convert titles to document IDs
-        document_ids = []
-        for title in document_titles:
-            doc_id = title_to_document_id(title, available_docs)
-            if doc_id:
-                document_ids.append(doc_id)
-        
-        if not document_ids:
-            return "No valid documents found for generation"
-        
-        url = f"{WRAPPER_URL}/api/v1/agents/process"
-        payload = {
-            "agentId": "generation-agent",
-            "prompt": query,
-            "documentIds": document_ids,
-            "fullDoc": full_doc
-        }
-        
-        response = await httpx_client.post(url, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
-        return result.get("response", "No generation results")
-        
-    except Exception as e:
-        logger.error(f"Generation action failed: {e}")
-        return f"Generation failed: {str(e)}"
+async def execute_extraction_action(query: str, document_titles: List[str], available_docs: List[Dict],
+                                    memo: Optional[DocumentMemo] = None) -> str:
+    """Execute extraction agent action (agent and HTTP errors propagate, so the action counts as failed)"""
+    # Convert titles to document IDs
+    document_ids = []
+    for title in document_titles:
+        doc_id = title_to_document_id(title, available_docs)
+        if doc_id:
+            document_ids.append(doc_id)
+    
+    if not document_ids:
+        raise ValueError("No valid documents found for extraction")
+    
+    url = f"{WRAPPER_URL}/api/v1/agents/process"
+    payload = {
+        "agentId": "extraction-agent",
+        "prompt": query,
+        "documentIds": document_ids
+    }
+    if FORWARD_DOCUMENT_TEXT and memo:
+        payload["documentTexts"] = memo.texts(document_ids)
+    
+    result = await post_to_agent(url, payload)
+    return result.get("response", "No extraction results")
 
-async def plan_actions(prompt: str, document_contexts: List[Dict]) -> List[Dict[str, Any]]:
-    """Step 1: Plan actions using document titles and initial lines for context"""
-    global gemini_client
+async def execute_generation_action(query: str, document_titles: List[str], full_doc: bool, available_docs: List[Dict],
+                                    memo: Optional[DocumentMemo] = None) -> str:
+    """Execute generation agent action (agent and HTTP errors propagate, so the action counts as failed)"""
+    # Convert titles to document IDs
+    document_ids = []
+    for title in document_titles:
+        doc_id = title_to_document_id(title, available_docs)
+        if doc_id:
+            document_ids.append(doc_id)
+    
+    if not document_ids:
+        raise ValueError("No valid documents found for generation")
+    
+    url = f"{WRAPPER_URL}/api/v1/agents/process"
+    payload = {
+        "agentId": "generation-agent",
+        "prompt": query,
+        "documentIds": document_ids,
+        "fullDoc": full_doc
+    }
+    if FORWARD_DOCUMENT_TEXT and memo:
+        payload["documentTexts"] = memo.texts(document_ids)
+    
+    result = await post_to_agent(url, payload)
+    return result.get("response", "No generation results")
+
+def fast_path_plan(prompt: str, document_contexts: List[Dict]) -> Optional[List[Dict[str, Any]]]:
+    """Rule-based plan for a short question about a single document, or None if the planner is needed"""
+    if not PLAN_FAST_PATH or len(document_contexts) != 1:
+        return None
     
+    normalized = normalize_prompt(prompt)
+    if len(normalized.split()) > PLAN_FAST_PATH_MAX_WORDS:
+        return None
+    if any(term in normalized for term in PLAN_FAST_PATH_EXCLUDED_TERMS):
+        return None
+    
+    return [{
+        "action_type": "extract",
+        "query": prompt,
+        "document_titles": [document_contexts[0]["title"]]
+    }]
+
+async def plan_actions(prompt: str, document_contexts: List[Dict]) -> List[Dict[str, Any]]:
+    """
+    Step 1: Plan actions using document titles and initial lines for context.
+    Trivial single-document prompts use a rule-based plan; planner output is cached per
+    (normalized prompt, document titles). The planner only gets the time the request deadline
+    leaves before the final reasoning reserve: without it the plan is empty and the answer
+    comes from the documents alone.
+    """
     if not gemini_client:
         raise HTTPException(status_code=503, detail="Gemini not available")
     
+    actions = fast_path_plan(prompt, document_contexts)
+    if actions:
+        logger.info("Planned 1 action with the single-document fast path")
+        return actions
+    
+    cache_key = PlanCache.key(GEMINI_MODEL, prompt, [doc['title'] for doc in document_contexts])
+    actions = await plan_cache.get(cache_key)
+    if actions:
+        logger.info(f"Reusing cached plan with {len(actions)} actions")
+        return actions
+    
     # Prepare document context with titles and initial lines
     doc_context = "\n".join([
         f"- {doc['title']}: {doc['first_lines']}" 
@@ -492,14 +604,17 @@ Pianifica la sequenza ottimale di azioni per rispondere a questa domanda legale.
     
     max_retries = 3
     for attempt in range(max_retries):
+        timeout = step_timeout(before_final=True)
+        if not has_time_for_step(timeout):
+            logger.warning(f"Skipping planning: only {timeout:.1f}s left before the final reasoning")
+            degrade("planning skipped")
+            return []
+        
+        client, key_index = get_gemini_client()
         try:
             full_prompt = f"{PLANNING_SYSTEM_PROMPT}\n\n{planning_prompt}"
             
-            response = gemini_client.models.generate_content(
-                model="gemini-1.5-flash",
-                contents=full_prompt
-            )
-            response_text = response.text.strip()
+            response_text = await asyncio.wait_for(gemini_generate(client, full_prompt), timeout=timeout)
             
             logger.info(f"Planning response attempt {attempt + 1}: {response_text[:200]}...")
             
@@ -508,6 +623,7 @@ Pianifica la sequenza ottimale di azioni per rispondere a questa domanda legale.
             
             if actions:
                 logger.info(f"Successfully planned {len(actions)} actions")
+                await plan_cache.put(cache_key, actions)
                 return actions
             else:
                 logger.warning(f"No valid JSON actions in attempt {attempt + 1}")
@@ -522,133 +638,552 @@ Pianifica la sequenza ottimale di azioni per rispondere a questa domanda legale.
                         "document_titles": [doc['title'] for doc in document_contexts[:2]]  # Limit to first 2 docs
                     }]
             
+        except asyncio.TimeoutError:
+            # Not the key's fault: the request ran out of time, so do not rotate or retry
+            logger.error(f"Planning attempt {attempt + 1} timed out after {timeout:.1f}s")
+            degrade("planning timed out")
+            return []
         except Exception as e:
             logger.error(f"Planning attempt {attempt + 1} failed: {e}")
             if attempt < len(GEMINI_API_KEYS) - 1:
-                try_next_gemini_key()
+                try_next_gemini_key(key_index)
             else:
                 raise HTTPException(status_code=503, detail="Action planning failed")
     
     # Should not reach here
     return []
 
-async def execute_planned_actions(actions: List[Dict[str, Any]], document_contexts: List[Dict]) -> List[Dict[str, Any]]:
-    """Step 2: Execute the planned actions"""
-    actions_taken = []
+class ExecutionRecorder:
+    """
+    Persists an orchestration run step by step (plan, each action result, final answer) in
+    document-service's execution_plans/execution_results under its execution_id, and restores
+    the completed steps when the same execution is retried. Persistence failures are logged and
+    never fail the orchestration.
+    """
     
-    for i, action in enumerate(actions):
-        action_type = action.get("action_type")
-        query = action.get("query", "")
+    def __init__(self, execution_id: str, request: OrchestrationRequest):
+        self.execution_id = execution_id
+        self.request = request
+        self.url = f"{DOCUMENT_SERVICE_URL}/api/v1/executions/{quote(execution_id, safe='')}"
+        self.planned_actions: Optional[List[Dict[str, Any]]] = None
+        self.completed_actions: Dict[int, Dict[str, Any]] = {}  # Successful results, reused on resume
+        self.final_result: Optional[str] = None
+        self._results: Dict[int, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()  # Keeps the full-snapshot writes in order
+    
+    async def load(self):
+        """Restore what a previous attempt of this execution completed"""
+        global httpx_client
+        try:
+            response = await httpx_client.get(self.url, timeout=DOC_FETCH_TIMEOUT_SECONDS)
+            if response.status_code == 404:
+                return
+            response.raise_for_status()
+            execution = response.json()
+        except Exception as e:
+            logger.warning(f"Could not load execution {self.execution_id}, starting over: {e}")
+            return
         
-        logger.info(f"Executing action {i+1}/{len(actions)}: {action_type} - {query}")
+        plan = execution.get("plan") or {}
+        result = execution.get("result") or {}
+        if (plan.get("original_prompt") != self.request.prompt
+                or sorted(plan.get("document_ids") or []) != sorted(self.request.document_ids)):
+            logger.warning(f"Execution {self.execution_id} was recorded for a different request, starting over")
+            return
         
         try:
-            if action_type == "search":
-                result = await execute_search_action(query)
-                
-            elif action_type == "extract":
-                document_titles = action.get("document_titles", [doc['title'] for doc in document_contexts])
-                result = await execute_extraction_action(query, document_titles, document_contexts)
-                
-            elif action_type == "generate":
-                document_titles = action.get("document_titles", [doc['title'] for doc in document_contexts])
-                full_doc = action.get("full_doc", False)
-                result = await execute_generation_action(query, document_titles, full_doc, document_contexts)
+            self.planned_actions = json.loads(plan["strategy"]) if plan.get("strategy") else None
+        except (TypeError, ValueError):
+            self.planned_actions = None
+        if not self.planned_actions:
+            return
+        
+        for entry in result.get("agent_results") or []:
+            index = entry.get("index")
+            if isinstance(index, int) and 0 <= index < len(self.planned_actions):
+                self._results[index] = {key: value for key, value in entry.items() if key != "index"}
+        # Only real successes are reused; failed or skipped actions run again
+        self.completed_actions = {i: entry for i, entry in self._results.items() if entry.get("success") is True}
+        if (result.get("status") == "completed"
+                and len(self.completed_actions) == len(self.planned_actions)):
+            # The recorded answer is only final if every action behind it succeeded
+            self.final_result = result.get("final_result")
+        
+        logger.info(f"Resuming execution {self.execution_id}: {len(self.planned_actions)} planned actions, "
+                    f"{len(self.completed_actions)} completed"
+                    f"{', final answer recorded' if self.final_result is not None else ''}")
+    
+    @property
+    def recorded_results(self) -> List[Dict[str, Any]]:
+        return [self._results[i] for i in sorted(self._results)]
+    
+    async def _put(self, path: str, body: Dict[str, Any]):
+        global httpx_client
+        try:
+            response = await httpx_client.put(f"{self.url}/{path}", json=body, timeout=DOC_FETCH_TIMEOUT_SECONDS)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Failed to persist {path} of execution {self.execution_id}: {e}")
+    
+    async def save_plan(self, actions: List[Dict[str, Any]], status: str = "executing"):
+        self.planned_actions = actions
+        user_id, project_id, _ = split_document_id(self.request.document_ids[0])
+        await self._put("plan", {
+            "user_id": user_id,
+            "project_id": project_id,
+            "prompt": self.request.prompt,
+            "document_ids": self.request.document_ids,
+            "strategy": json.dumps(actions, ensure_ascii=False),
+            "status": status
+        })
+    
+    async def _save_results(self, status: str, final_result: Optional[str] = None):
+        await self._put("result", {
+            "agent_results": [dict(entry, index=i) for i, entry in sorted(self._results.items())],
+            "final_result": final_result,
+            "status": status
+        })
+    
+    async def record_action(self, index: int, entry: Dict[str, Any]):
+        async with self._lock:
+            self._results[index] = entry
+            await self._save_results("processing")
+    
+    async def complete(self, actions_taken: List[Dict[str, Any]], final_response: str):
+        async with self._lock:
+            self._results = dict(enumerate(actions_taken))
+            await self._save_results("completed", final_response)
+            await self.save_plan(self.planned_actions or [entry["action"] for entry in actions_taken], "completed")
+        self.final_result = final_response
+    
+    async def fail(self):
+        async with self._lock:
+            await self._save_results("failed")
+            if self.planned_actions is not None:
+                await self.save_plan(self.planned_actions, "failed")
+
+def resolve_action_dependencies(actions: List[Dict[str, Any]]) -> List[List[int]]:
+    """
+    Map each action's optional depends_on to indices of earlier actions.
+    References to the action itself, later actions or unknown indices are dropped, so the graph is acyclic.
+    """
+    dependencies = []
+    for i, action in enumerate(actions):
+        raw = action.get("depends_on") or []
+        if not isinstance(raw, list):
+            raw = [raw]
+        
+        resolved = []
+        for ref in raw:
+            try:
+                j = int(ref)
+            except (TypeError, ValueError):
+                j = -1
+            if 0 <= j < i and j not in resolved:
+                resolved.append(j)
             else:
-                result = f"Unknown action type: {action_type}"
-            
-            actions_taken.append({
-                "action": action,
-                "result": result,
-                "success": True
-            })
+                logger.warning(f"Action {i} has invalid dependency {ref!r}, ignoring it")
+        dependencies.append(resolved)
+    return dependencies
+
+async def execute_action(action: Dict[str, Any], document_contexts: List[Dict],
+                         memo: Optional[DocumentMemo] = None) -> str:
+    """Dispatch a single planned action to its agent; raises if the action fails"""
+    action_type = action.get("action_type")
+    query = action.get("query", "")
+    
+    if action_type == "search":
+        return await execute_search_action(query)
+    
+    elif action_type == "extract":
+        document_titles = action.get("document_titles", [doc['title'] for doc in document_contexts])
+        return await execute_extraction_action(query, document_titles, document_contexts, memo)
+    
+    elif action_type == "generate":
+        document_titles = action.get("document_titles", [doc['title'] for doc in document_contexts])
+        full_doc = action.get("full_doc", False)
+        return await execute_generation_action(query, document_titles, full_doc, document_contexts, memo)
+    
+    raise ValueError(f"Unknown action type: {action_type}")
+
+async def execute_planned_actions(actions: List[Dict[str, Any]], document_contexts: List[Dict],
+                                  memo: Optional[DocumentMemo] = None,
+                                  on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                                  recorder: Optional[ExecutionRecorder] = None) -> List[Dict[str, Any]]:
+    """
+    Step 2: Execute the planned actions as a dependency graph.
+    Actions without depends_on run concurrently (at most ACTION_CONCURRENCY at a time), each bounded
+    by ACTION_TIMEOUT_SECONDS and by the time the request deadline leaves before the final reasoning
+    reserve; an action that would start with less than that is skipped. Results are in plan order.
+    on_event, if given, is called with ("action_started" | "action_completed", payload) as actions progress.
+    With a recorder, each result is persisted as soon as it is known, and actions a previous
+    attempt already completed are not run again.
+    """
+    def notify(event: str, index: int, entry: Optional[Dict[str, Any]] = None):
+        if on_event:
+            payload = {"index": index, "action": actions[index]}
+            if entry:
+                payload.update(result=entry["result"], success=entry["success"], duration_ms=entry["duration_ms"])
+            on_event(event, payload)
+    
+    dependencies = resolve_action_dependencies(actions)
+    semaphore = asyncio.Semaphore(max(1, ACTION_CONCURRENCY))
+    tasks: List[asyncio.Task] = []
+    started = time.perf_counter()
+    
+    async def run(i: int) -> Dict[str, Any]:
+        if recorder and i in recorder.completed_actions:
+            entry = dict(recorder.completed_actions[i], resumed=True)
+            logger.info(f"Reusing recorded result of action {i+1}/{len(actions)}")
+            notify("action_completed", i, entry)
+            return entry
+        
+        entry = await attempt(i)
+        if recorder:
+            await recorder.record_action(i, entry)
+        return entry
+    
+    async def attempt(i: int) -> Dict[str, Any]:
+        action = actions[i]
+        action_type = action.get("action_type")
+        
+        if dependencies[i]:
+            upstream = await asyncio.gather(*(tasks[j] for j in dependencies[i]))
+            failed = [j for j, entry in zip(dependencies[i], upstream) if not entry["success"]]
+            if failed:
+                logger.warning(f"Skipping action {i+1}/{len(actions)}: dependencies {failed} failed")
+                entry = {
+                    "action": action,
+                    "result": f"Action skipped: dependencies {failed} failed",
+                    "success": False,
+                    "duration_ms": 0.0
+                }
+                notify("action_completed", i, entry)
+                return entry
+        
+        async with semaphore:
+            timeout = step_timeout(ACTION_TIMEOUT_SECONDS, before_final=True)
+            if not has_time_for_step(timeout):
+                logger.warning(f"Skipping action {i+1}/{len(actions)}: only {timeout:.1f}s left before the final reasoning")
+                degrade(f"action {i+1} skipped")
+                entry = {
+                    "action": action,
+                    "result": "Action skipped: not enough time left in the request deadline",
+                    "success": False,
+                    "duration_ms": 0.0
+                }
+                notify("action_completed", i, entry)
+                return entry
             
-        except Exception as e:
-            logger.error(f"Action {action_type} failed: {e}")
-            actions_taken.append({
-                "action": action,
-                "result": f"Action failed: {str(e)}",
-                "success": False
-            })
+            logger.info(f"Executing action {i+1}/{len(actions)}: {action_type} - {action.get('query', '')}")
+            notify("action_started", i)
+            action_started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(execute_action(action, document_contexts, memo), timeout=timeout)
+                entry = {"action": action, "result": result, "success": True}
+            except asyncio.TimeoutError:
+                logger.error(f"Action {action_type} timed out after {timeout:.1f}s")
+                entry = {
+                    "action": action,
+                    "result": f"Action failed: timed out after {timeout:.1f}s",
+                    "success": False
+                }
+            except Exception as e:
+                logger.error(f"Action {action_type} failed: {e}")
+                entry = {"action": action, "result": f"Action failed: {str(e)}", "success": False}
+            entry["duration_ms"] = round((time.perf_counter() - action_started) * 1000, 1)
+            notify("action_completed", i, entry)
+            return entry
     
-    return actions_taken
+    # Every task only awaits tasks of earlier actions, which already exist when it first runs
+    for i in range(len(actions)):
+        tasks.append(asyncio.create_task(run(i)))
+    
+    try:
+        actions_taken = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    
+    logger.info(f"Executed {len(actions)} actions in {(time.perf_counter() - started) * 1000:.0f}ms "
+                f"(concurrency {ACTION_CONCURRENCY}, "
+                f"{sum(1 for deps in dependencies if deps)} with dependencies)")
+    return list(actions_taken)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; good enough for budgeting without a tokenizer round trip"""
+    return int(len(text) / CONTEXT_CHARS_PER_TOKEN) + 1
 
-async def generate_final_response(prompt: str, actions_taken: List[Dict[str, Any]], full_documents: List[Dict]) -> str:
-    """Step 3: Generate DEFINITIVE final response with full document content and action results"""
-    global gemini_client
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    max_chars = int(tokens * CONTEXT_CHARS_PER_TOKEN)
+    return text if len(text) <= max_chars else text[:max(0, max_chars - 3)] + "..."
+
+def fair_share(sizes: List[int], budget: int) -> List[int]:
+    """Split a budget across items: small items get everything they need, the rest share what remains equally"""
+    allocation = [0] * len(sizes)
+    remaining = max(0, budget)
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    for position, i in enumerate(order):
+        allocation[i] = min(sizes[i], remaining // (len(sizes) - position))
+        remaining -= allocation[i]
+    return allocation
+
+async def rank_document_chunks(prompt: str, document_ids: List[str],
+                               timeout: float = DOC_FETCH_TIMEOUT_SECONDS) -> List[Dict[str, Any]]:
+    """
+    Chunks of the given documents ranked by relevance to the prompt, using document-service's
+    batch query (one call per user/project). Each document's best chunk comes first, then the
+    best chunks overall; every chunk carries its document_id. Documents that cannot be ranked
+    (not embedded, or the call failed) are simply absent.
+    """
+    global httpx_client
+    groups: Dict[tuple, Dict[str, str]] = {}
+    for document_id in document_ids:
+        user_id, project_id, doc_id = split_document_id(document_id)
+        groups.setdefault((user_id, project_id), {})[doc_id] = document_id
     
-    if not gemini_client:
-        raise HTTPException(status_code=503, detail="Gemini not available")
+    async def rank_batch(user_id: str, project_id: str, doc_ids: List[str]) -> Dict[str, Any]:
+        url = f"{DOCUMENT_SERVICE_URL}/api/v1/documents/{user_id}/{quote(project_id, safe='')}/query"
+        response = await httpx_client.post(url, json={
+            "doc_ids": doc_ids,
+            "query": prompt,
+            "top_k": 1,
+            "global_top_k": max(1, min(CONTEXT_RANK_MAX_CHUNKS, 200))
+        }, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    batches = []
+    for (user_id, project_id), docs in groups.items():
+        doc_ids = list(docs)
+        for i in range(0, len(doc_ids), BATCH_QUERY_MAX_DOCUMENTS):
+            batches.append((user_id, project_id, doc_ids[i:i + BATCH_QUERY_MAX_DOCUMENTS]))
+    results = await asyncio.gather(*(rank_batch(*batch) for batch in batches), return_exceptions=True)
+    
+    best, rest = [], []
+    for (user_id, project_id, _), result in zip(batches, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Chunk ranking failed for {user_id}/{project_id}: {result!r}")
+            continue
+        docs = groups[(user_id, project_id)]
+        for doc_chunks in result.get("documents", {}).values():
+            best.extend(dict(chunk, document_id=docs[chunk["doc_id"]]) for chunk in doc_chunks[:1])
+        rest.extend(dict(chunk, document_id=docs[chunk["doc_id"]]) for chunk in result.get("global_chunks", []))
     
-    # Prepare action results summary
+    ranked, seen = [], set()
+    for chunk in sorted(best, key=lambda c: -c.get("score", 0)) + sorted(rest, key=lambda c: -c.get("score", 0)):
+        key = (chunk["document_id"], chunk.get("chunk_index"))
+        if key not in seen and chunk.get("text"):
+            seen.add(key)
+            ranked.append(chunk)
+    return ranked
+
+async def pack_document_sources(prompt: str, full_documents: List[Dict], budget: int) -> tuple[Dict[str, str], str]:
+    """
+    Text to include for each document within a token budget.
+    Everything fits: full texts. Otherwise the most relevant chunks (in document order) until the
+    budget is spent; documents that could not be ranked share what is left, truncated from the start.
+    Ranking only runs if the request deadline leaves time for it on top of the final reasoning reserve.
+    """
+    if sum(estimate_tokens(doc["full_text"]) for doc in full_documents) <= budget:
+        return {doc["document_id"]: doc["full_text"] for doc in full_documents}, "full"
+    
+    rankable = [doc["document_id"] for doc in full_documents if doc.get("mode") not in ("error", "context_fallback")]
+    rank_timeout = step_timeout(DOC_FETCH_TIMEOUT_SECONDS, before_final=True)
+    if rankable and not has_time_for_step(rank_timeout):
+        logger.warning(f"Skipping chunk ranking: only {rank_timeout:.1f}s left before the final reasoning")
+        degrade("chunk ranking skipped")
+        rankable = []
+    ranked = await rank_document_chunks(prompt, rankable, rank_timeout) if rankable else []
+    
+    remaining = budget
+    selected: Dict[str, List[Dict[str, Any]]] = {}
+    for chunk in ranked:
+        cost = estimate_tokens(chunk["text"])
+        if cost <= remaining:
+            selected.setdefault(chunk["document_id"], []).append(chunk)
+            remaining -= cost
+    
+    texts = {}
+    for document_id, chunks in selected.items():
+        chunks.sort(key=lambda c: c.get("chunk_index", 0))
+        parts = [chunks[0]["text"]]
+        for previous, chunk in zip(chunks, chunks[1:]):
+            # Mark the gaps between non-adjacent excerpts
+            parts.append("[...]" if chunk.get("chunk_index", 0) - previous.get("chunk_index", 0) > 1 else "")
+            parts.append(chunk["text"])
+        texts[document_id] = "\n\n".join(part for part in parts if part)
+    
+    unranked = [doc for doc in full_documents if doc["document_id"] not in texts]
+    allocation = fair_share([estimate_tokens(doc["full_text"]) for doc in unranked], remaining)
+    for doc, tokens in zip(unranked, allocation):
+        texts[doc["document_id"]] = truncate_to_tokens(doc["full_text"], tokens)
+    
+    return texts, "ranked" if selected else "truncated"
+
+async def build_reasoning_prompt(prompt: str, actions_taken: List[Dict[str, Any]], full_documents: List[Dict]) -> str:
+    """
+    Final reasoning prompt: agent results plus document content, packed into CONTEXT_TOKEN_BUDGET.
+    Agent results get up to CONTEXT_AGENT_RESULTS_SHARE of the budget; what they leave unused goes to the sources.
+    """
+    started = time.perf_counter()
+    
+    def assemble(results_text: str, documents_text: str) -> str:
+        reasoning_prompt = f"""DOMANDA ORIGINALE: {prompt}
+
+RISULTATI DEGLI AGENTI:
+{results_text}
+
+CONTENUTO DEI DOCUMENTI:
+{documents_text}
+
+Fornisci ora una risposta DEFINITIVA e completa alla domanda dell'utente. Utilizza sia i risultati degli agenti che il contenuto dei documenti. Se i risultati degli agenti sono insufficienti, analizza direttamente i documenti per rispondere senza dirlo all'utente."""
+        return f"{REASONING_SYSTEM_PROMPT}\n\n{reasoning_prompt}"
+    
+    overhead = estimate_tokens(assemble("", ""))
+    
+    # Prepare action results summary: successful results share the agent budget
+    successful = [a for a in actions_taken if a["success"]]
+    results_budget = int(CONTEXT_TOKEN_BUDGET * CONTEXT_AGENT_RESULTS_SHARE)
+    allocation = iter(fair_share([estimate_tokens(a["result"]) for a in successful], results_budget))
     results_summary = []
     for action_data in actions_taken:
         action = action_data["action"]
         result = action_data["result"]
-        success = action_data["success"]
         
-        if success:
-            # Truncate very long results to avoid context overflow
-            truncated_result = result[:800] + "..." if len(result) > 800 else result
+        if action_data["success"]:
+            truncated_result = truncate_to_tokens(result, next(allocation))
             results_summary.append(f"Azione {action['action_type']}: {action['query']}\nRisultato: {truncated_result}")
         else:
             results_summary.append(f"Azione {action['action_type']} fallita: {result}")
     
     results_text = "\n\n".join(results_summary)
     
-    # Prepare FULL document content
-    documents_content = []
+    # Document headers are fixed cost; the remaining budget goes to the document text itself
+    headers = {}
     for doc in full_documents:
-        doc_info = f"=== DOCUMENTO: {doc['title']} ===\n"
-        doc_info += f"Modalità: {doc.get('mode', 'unknown')}, Chunks: {doc.get('chunks_count', 0)}\n"
-        doc_info += f"Contenuto:\n{doc['full_text']}\n"
-        documents_content.append(doc_info)
+        headers[doc["document_id"]] = (f"=== DOCUMENTO: {doc['title']} ===\n"
+                                       f"Modalità: {doc.get('mode', 'unknown')}, Chunks: {doc.get('chunks_count', 0)}\n"
+                                       f"Contenuto:\n")
+    sources_budget = (CONTEXT_TOKEN_BUDGET - overhead - estimate_tokens(results_text)
+                      - sum(estimate_tokens(header) for header in headers.values()))
+    ranking_started = time.perf_counter()
+    texts, packing = await pack_document_sources(prompt, full_documents, sources_budget)
+    ranking_ms = (time.perf_counter() - ranking_started) * 1000
     
-    full_documents_text = "\n\n".join(documents_content)
+    documents_text = "\n\n".join(f"{headers[doc['document_id']]}{texts[doc['document_id']]}\n" for doc in full_documents)
+    full_prompt = assemble(results_text, documents_text)
     
-    # Create definitive reasoning prompt
-    reasoning_prompt = f"""DOMANDA ORIGINALE: {prompt}
+    logger.info(f"Reasoning prompt: {len(full_prompt)} chars (~{estimate_tokens(full_prompt)} tokens, "
+                f"budget {CONTEXT_TOKEN_BUDGET}); agent results ~{estimate_tokens(results_text)} tokens, "
+                f"sources {packing} (~{estimate_tokens(documents_text)} tokens, packed in {ranking_ms:.0f}ms); "
+                f"built in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return full_prompt
 
-RISULTATI DEGLI AGENTI:
-{results_text}
-
-CONTENUTO COMPLETO DEI DOCUMENTI:
-{full_documents_text}
+def fallback_final_response(actions_taken: List[Dict[str, Any]], full_documents: List[Dict]) -> str:
+    """Enhanced fallback response using documents directly, when the reasoning call fails"""
+    if full_documents:
+        successful_actions = [a for a in actions_taken if a["success"]]
+        doc_titles = [doc['title'] for doc in full_documents]
+        
+        fallback_response = f"Basandomi sull'analisi dei documenti forniti ({', '.join(doc_titles)}), "
+        
+        if successful_actions:
+            fallback_response += f"e sui risultati di {len(successful_actions)} agenti specializzati, "
+        
+        fallback_response += "posso rispondere alla tua domanda utilizzando il contenuto disponibile"
+        
+        if not successful_actions:
+            fallback_response += ", anche se si sono verificati alcuni errori tecnici nell'elaborazione degli agenti"
+        
+        fallback_response += "."
+        
+        return fallback_response
+    else:
+        return "Mi dispiace, non sono riuscito a completare l'analisi richiesta a causa di errori nel recupero dei documenti."
 
-Fornisci ora una risposta DEFINITIVA e completa alla domanda dell'utente. Utilizza sia i risultati degli agenti che il contenuto completo dei documenti. Se i risultati degli agenti sono insufficienti, analizza direttamente i documenti per rispondere senza dirlo all'utente."""
+async def generate_final_response(prompt: str, actions_taken: List[Dict[str, Any]],
+                                  full_documents: List[Dict]) -> tuple[str, bool]:
+    """
+    Step 3: Generate DEFINITIVE final response with full document content and action results.
+    Returns (response, used_fallback), used_fallback being True when the reasoning call was
+    skipped or failed and fallback_final_response answered instead.
+    """
+    if not gemini_client:
+        raise HTTPException(status_code=503, detail="Gemini not available")
     
+    full_prompt = await build_reasoning_prompt(prompt, actions_taken, full_documents)
+    timeout = step_timeout()
+    if not has_time_for_step(timeout):
+        logger.warning(f"Skipping final reasoning: only {timeout:.1f}s left in the request deadline")
+        degrade("final reasoning skipped")
+        return fallback_final_response(actions_taken, full_documents), True
     try:
-        full_prompt = f"{REASONING_SYSTEM_PROMPT}\n\n{reasoning_prompt}"
-        
-        response = gemini_client.models.generate_content(
-            model="gemini-1.5-flash",
-            contents=full_prompt
-        )
+        client, _ = get_gemini_client()
         
-        return response.text.strip()
+        started = time.perf_counter()
+        final_response = await asyncio.wait_for(gemini_generate(client, full_prompt), timeout=timeout)
+        logger.info(f"Final response generated in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return final_response, False
         
+    except asyncio.TimeoutError:
+        logger.error(f"Final response generation timed out after {timeout:.1f}s")
+        degrade("final reasoning timed out")
+        return fallback_final_response(actions_taken, full_documents), True
     except Exception as e:
         logger.error(f"Final response generation failed: {e}")
-        # Enhanced fallback response using documents directly
-        if full_documents:
-            successful_actions = [a for a in actions_taken if a["success"]]
-            doc_titles = [doc['title'] for doc in full_documents]
-            
-            fallback_response = f"Basandomi sull'analisi dei documenti forniti ({', '.join(doc_titles)}), "
-            
-            if successful_actions:
-                fallback_response += f"e sui risultati di {len(successful_actions)} agenti specializzati, "
-            
-            fallback_response += "posso rispondere alla tua domanda utilizzando il contenuto disponibile"
-            
-            if not successful_actions:
-                fallback_response += ", anche se si sono verificati alcuni errori tecnici nell'elaborazione degli agenti"
-            
-            fallback_response += "."
-            
-            return fallback_response
+        return fallback_final_response(actions_taken, full_documents), True
+
+async def stream_final_response(prompt: str, actions_taken: List[Dict[str, Any]],
+                                full_documents: List[Dict]) -> AsyncIterator[tuple[str, bool]]:
+    """
+    Step 3, streamed: yield the final response as (Gemini text delta, used_fallback) pairs,
+    used_fallback being True for a fallback_final_response sent instead of the reasoning.
+    If the request deadline runs out mid-answer, the stream stops there with a "[...]" marker.
+    """
+    if not gemini_client:
+        raise HTTPException(status_code=503, detail="Gemini not available")
+    
+    full_prompt = await build_reasoning_prompt(prompt, actions_taken, full_documents)
+    timeout = step_timeout()
+    if not has_time_for_step(timeout):
+        logger.warning(f"Skipping final reasoning: only {timeout:.1f}s left in the request deadline")
+        degrade("final reasoning skipped")
+        yield fallback_final_response(actions_taken, full_documents), True
+        return
+    
+    streamed = False
+    started = time.perf_counter()
+    try:
+        client, _ = get_gemini_client()
+        async with asyncio.timeout(timeout), gemini_semaphore:
+            stream = await client.aio.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=full_prompt
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    if not streamed:
+                        logger.info(f"First final response delta after {(time.perf_counter() - started) * 1000:.0f}ms")
+                    streamed = True
+                    yield chunk.text, False
+        logger.info(f"Final response streamed in {(time.perf_counter() - started) * 1000:.0f}ms")
+    
+    except asyncio.TimeoutError:
+        logger.error(f"Final response streaming timed out after {timeout:.1f}s")
+        if streamed:
+            degrade("final reasoning cut short")
+            yield "\n\n[...]", False
         else:
-            return "Mi dispiace, non sono riuscito a completare l'analisi richiesta a causa di errori nel recupero dei documenti."
+            degrade("final reasoning timed out")
+            yield fallback_final_response(actions_taken, full_documents), True
+    except Exception as e:
+        logger.error(f"Final response streaming failed: {e}")
+        if streamed:
+            # Part of the answer already reached the client: report the failure instead of patching it
+            raise
+        yield fallback_final_response(actions_taken, full_documents), True
 
 # Health check endpoint
 @app.get("/")
@@ -658,14 +1193,12 @@ async def health_check():
         "status": "healthy", 
         "service": "orchestration-agent",
         "gemini_configured": gemini_client is not None,
-        "service_ready": service_ready
+        "service_ready": service_ready,
+        "plan_cache": plan_cache.stats(),
+        "response_cache": response_cache.stats()
     }
 
-# Main orchestration endpoint
-@app.post("/api/v1/agents/orchestrate", response_model=OrchestrationResponse)
-async def orchestrate_agents(request: OrchestrationRequest):
-    """Orchestrate multiple agents for complex legal document analysis"""
-    
+def validate_orchestration_request(request: OrchestrationRequest):
     if not service_ready:
         raise HTTPException(status_code=503, detail="Orchestration service not ready")
     
@@ -674,55 +1207,174 @@ async def orchestrate_agents(request: OrchestrationRequest):
     
     if not request.document_ids:
         raise HTTPException(status_code=400, detail="At least one document ID is required")
+
+async def run_orchestration(request: OrchestrationRequest,
+                            on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                            deadline: Optional[Deadline] = None) -> OrchestrationResponse:
+    """
+    Plan, execute actions and reason over the documents.
+    With on_event the progress is reported as it happens (plan_ready, action_started/completed)
+    and the final response is streamed as final_response_delta events.
+    Responses are cached per (prompt, documents, document contents); identical concurrent
+    requests share one execution.
+    Every step runs within the request's deadline (see deadline.py).
+    """
+    deadline = deadline or Deadline.for_request(request.deadline_seconds)
+    current_deadline.set(deadline)
+    logger.info(f"Starting SIMPLIFIED orchestration for prompt: {request.prompt[:100]}... "
+                f"(deadline {deadline.budget_seconds:g}s)")
     
+    document_ids = list(dict.fromkeys(request.document_ids))
+
+    # Each document is fetched once, concurrently; context and full content derive from it
+    memo = DocumentMemo()
     try:
-        logger.info(f"Starting SIMPLIFIED orchestration for prompt: {request.prompt[:100]}...")
-        
-        # Step 0: Fetch document contexts (titles + initial lines) for planning
+        # Step 0: Document contexts (titles + initial lines) for planning
         document_contexts = []
-        for doc_id in request.document_ids:
-            try:
-                doc_context = await fetch_document_context(doc_id)
-                document_contexts.append(doc_context)
-            except Exception as e:
-                logger.warning(f"Failed to fetch document context {doc_id}: {e}")
+        for doc_id, context in (await fetch_documents_concurrently(memo.context, document_ids)).items():
+            if isinstance(context, BaseException):
+                logger.warning(f"Failed to fetch document context {doc_id}: {context!r}")
                 continue
+            document_contexts.append(context)
         
         if not document_contexts:
             raise HTTPException(status_code=404, detail="No document contexts could be retrieved")
         
-        # Step 1: Plan actions (using document titles + initial lines)
-        planned_actions = await plan_actions(request.prompt, document_contexts)
-        logger.info(f"Planned {len(planned_actions)} actions based on document contexts")
+        recorder = None
+        if EXECUTION_PERSISTENCE and request.execution_id:
+            recorder = ExecutionRecorder(request.execution_id, request)
+            await recorder.load()
+        
+        async def execute() -> tuple[Dict[str, Any], bool]:
+            result = await execute_orchestration(request, document_ids, document_contexts, memo, on_event, recorder)
+            # Request-specific fields are filled in per caller below
+            cached_fields = result.model_dump(exclude={"agent_id", "execution_id", "prompt", "document_ids", "cache"})
+            return cached_fields, result.cache is None
+        
+        # The key covers document contents, so an edited document never serves a stale answer
+        content_hashes = {doc_id: await memo.content_hash(doc_id) for doc_id in document_ids}
+        if any(content_hash is None for content_hash in content_hashes.values()):
+            # Some document is unavailable: the answer would be partial, never cache it
+            cached, source = (await execute())[0], None
+        else:
+            cache_key = ResponseCache.key(request.prompt, content_hashes)
+            cached, source = await response_cache.get_or_run(cache_key, execute, bypass=request.bypass_cache)
+    finally:
+        memo.cancel()
+    
+    if source in ("hit", "coalesced"):
+        logger.info(f"Serving {source} orchestration response")
+        if recorder and recorder.final_result is None:
+            # Served without running: still leave a complete record under this execution_id
+            await recorder.save_plan([entry["action"] for entry in cached["actions_taken"]])
+            await recorder.complete(cached["actions_taken"], cached["final_response"])
+        if on_event:
+            on_event("cache_hit", {"source": source})
+            on_event("final_response_delta", {"text": cached["final_response"]})
+    
+    return OrchestrationResponse(
+        **cached,
+        agent_id=request.agent_id,
+        execution_id=request.execution_id,
+        prompt=request.prompt,
+        document_ids=request.document_ids,
+        cache=source
+    )
+
+async def execute_orchestration(request: OrchestrationRequest, document_ids: List[str], document_contexts: List[Dict],
+                                memo: DocumentMemo,
+                                on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                                recorder: Optional[ExecutionRecorder] = None) -> OrchestrationResponse:
+    """
+    Steps 1-4 of the pipeline. The returned response has cache=None when it is complete,
+    and cache="degraded" when an action or the final reasoning fell back, or a step was skipped
+    or cut short to meet the deadline (not worth caching).
+    With a recorder, a retried execution resumes after its last completed step.
+    """
+    if recorder and recorder.final_result is not None:
+        # A previous attempt already finished: answer from the record, run nothing
+        logger.info(f"Execution {recorder.execution_id} already completed, returning the recorded answer")
+        actions_taken = recorder.recorded_results
+        if on_event:
+            on_event("final_response_delta", {"text": recorder.final_result})
+        return OrchestrationResponse(
+            success=True,
+            agent_id=request.agent_id,
+            execution_id=request.execution_id,
+            prompt=request.prompt,
+            document_ids=request.document_ids,
+            actions_taken=actions_taken,
+            final_response=recorder.final_result,
+            message=f"Analisi DEFINITIVA completata: {len(actions_taken)} azioni eseguite (risultato registrato)",
+            cache=None if all(action.get("success") for action in actions_taken) else "degraded"
+        )
+    
+    try:
+        # Step 1: Plan actions (using document titles + initial lines), unless a previous attempt did
+        if recorder and recorder.planned_actions:
+            planned_actions = recorder.planned_actions
+            logger.info(f"Reusing recorded plan with {len(planned_actions)} actions")
+        else:
+            planned_actions = await plan_actions(request.prompt, document_contexts)
+            logger.info(f"Planned {len(planned_actions)} actions based on document contexts")
+            if recorder:
+                await recorder.save_plan(planned_actions)
+        if on_event:
+            on_event("plan_ready", {
+                "actions": planned_actions,
+                "documents": [{"document_id": ctx["document_id"], "title": ctx["title"]} for ctx in document_contexts]
+            })
         
         # Step 2: Execute planned actions
-        actions_taken = await execute_planned_actions(planned_actions, document_contexts)
+        actions_taken = await execute_planned_actions(planned_actions, document_contexts, memo, on_event, recorder)
         logger.info(f"Executed {len(actions_taken)} actions")
         
-        # Step 3: Fetch FULL document content for final reasoning
+        # Step 3: FULL document content for final reasoning (already fetched in step 0)
+        full_contents = await fetch_documents_concurrently(memo.full_content, document_ids)
+
         full_documents = []
-        for doc_id in request.document_ids:
-            try:
-                full_doc = await fetch_document_full_content(doc_id)
+        for doc_id, full_doc in full_contents.items():
+            if not isinstance(full_doc, BaseException):
                 full_documents.append(full_doc)
-            except Exception as e:
-                logger.warning(f"Failed to fetch full document content {doc_id}: {e}")
-                # Use context as fallback if full content fails
-                context = next((ctx for ctx in document_contexts if ctx["document_id"] == doc_id), None)
-                if context:
-                    full_documents.append({
-                        "document_id": doc_id,
-                        "title": context["title"],
-                        "full_text": context["first_lines"],
-                        "chunks_count": 0,
-                        "mode": "context_fallback"
-                    })
+                continue
+            logger.warning(f"Failed to fetch full document content {doc_id}: {full_doc!r}")
+            # Use context as fallback if full content fails
+            context = next((ctx for ctx in document_contexts if ctx["document_id"] == doc_id), None)
+            if context:
+                full_documents.append({
+                    "document_id": doc_id,
+                    "title": context["title"],
+                    "full_text": context["first_lines"],
+                    "chunks_count": 0,
+                    "mode": "context_fallback"
+                })
         
         if not full_documents:
             raise HTTPException(status_code=404, detail="No full documents could be retrieved")
         
         # Step 4: Generate DEFINITIVE final response (with full docs + action results)
-        final_response = await generate_final_response(request.prompt, actions_taken, full_documents)
+        if on_event:
+            deltas = []
+            used_fallback = False
+            async for delta, fell_back in stream_final_response(request.prompt, actions_taken, full_documents):
+                deltas.append(delta)
+                used_fallback = used_fallback or fell_back
+                on_event("final_response_delta", {"text": delta})
+            final_response = "".join(deltas).strip()
+        else:
+            final_response, used_fallback = await generate_final_response(request.prompt, actions_taken,
+                                                                          full_documents)
+        
+        if recorder:
+            await recorder.complete(actions_taken, final_response)
+        
+        deadline = current_deadline.get()
+        if deadline and deadline.degradations:
+            logger.warning(f"Degraded to meet the deadline: {', '.join(deadline.degradations)}")
+        
+        complete = (all(action["success"] for action in actions_taken)
+                    and not used_fallback
+                    and not (deadline and deadline.degradations))
         
         return OrchestrationResponse(
             success=True,
@@ -732,8 +1384,53 @@ async def orchestrate_agents(request: OrchestrationRequest):
             document_ids=request.document_ids,
             actions_taken=actions_taken,
             final_response=final_response,
-            message=f"Analisi DEFINITIVA completata: {len(actions_taken)} azioni eseguite su {len(full_documents)} documenti completi"
+            message=f"Analisi DEFINITIVA completata: {len(actions_taken)} azioni eseguite su {len(full_documents)} documenti completi",
+            cache=None if complete else "degraded"
         )
+    except Exception:
+        if recorder:
+            await recorder.fail()
+        raise
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def request_deadline(request: OrchestrationRequest, http_request: Request) -> Deadline:
+    """Deadline from the body's deadline_seconds and an upstream X-Time-Budget-Ms header"""
+    return Deadline.for_request(request.deadline_seconds, http_request.headers.get(TIME_BUDGET_HEADER))
+
+async def run_until_disconnected(http_request: Request, work: Awaitable[OrchestrationResponse],
+                                 deadline: Deadline) -> OrchestrationResponse:
+    """
+    Run work as a task, cancelling it (and every agent call in flight) if the client disconnects
+    or the deadline plus DEADLINE_GRACE_SECONDS passes without an answer.
+    """
+    task = asyncio.create_task(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling orchestration")
+                raise HTTPException(status_code=499, detail="Client closed request")
+            if deadline.overdue(DEADLINE_GRACE_SECONDS):
+                logger.error(f"Orchestration exceeded its {deadline.budget_seconds:g}s deadline, cancelling")
+                raise HTTPException(status_code=504, detail="Orchestration deadline exceeded")
+    finally:
+        if not task.done():
+            task.cancel()
+
+# Main orchestration endpoint
+@app.post("/api/v1/agents/orchestrate", response_model=OrchestrationResponse)
+async def orchestrate_agents(request: OrchestrationRequest, http_request: Request):
+    """Orchestrate multiple agents for complex legal document analysis"""
+    validate_orchestration_request(request)
+    
+    deadline = request_deadline(request, http_request)
+    try:
+        return await run_until_disconnected(http_request, run_orchestration(request, deadline=deadline), deadline)
         
     except HTTPException:
         raise
@@ -741,5 +1438,55 @@ async def orchestrate_agents(request: OrchestrationRequest):
         logger.error(f"Orchestration failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Orchestration failed: {str(e)}")
 
+@app.post("/api/v1/agents/orchestrate/stream")
+async def orchestrate_agents_stream(request: OrchestrationRequest, http_request: Request):
+    """
+    Same pipeline as /api/v1/agents/orchestrate, streamed as server-sent events:
+    plan_ready, action_started, action_completed, final_response_delta (Gemini token deltas),
+    then done with the full OrchestrationResponse, or error.
+    """
+    validate_orchestration_request(request)
+    deadline = request_deadline(request, http_request)
+    
+    async def events() -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        def emit(event: str, data: Dict[str, Any]):
+            queue.put_nowait(sse_event(event, data))
+        
+        async def run():
+            try:
+                response = await asyncio.wait_for(run_orchestration(request, emit, deadline),
+                                                  timeout=deadline.remaining() + DEADLINE_GRACE_SECONDS)
+                emit("done", response.model_dump())
+            except asyncio.TimeoutError:
+                logger.error(f"Streaming orchestration exceeded its {deadline.budget_seconds:g}s deadline")
+                emit("error", {"status_code": 504, "detail": "Orchestration deadline exceeded"})
+            except HTTPException as e:
+                emit("error", {"status_code": e.status_code, "detail": e.detail})
+            except Exception as e:
+                logger.error(f"Streaming orchestration failed: {str(e)}")
+                emit("error", {"status_code": 500, "detail": f"Orchestration failed: {str(e)}"})
+            finally:
+                queue.put_nowait(None)
+        
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            # Client went away (or the stream ended): stop any remaining work
+            if not task.done():
+                task.cancel()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8005)
\ No newline at end of file
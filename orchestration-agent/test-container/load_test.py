@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Load test for the Orchestration Agent (load_test.py)
+Sends orchestration requests at increasing concurrency levels and reports orchestrations/sec,
+while probing /health in the background: with non-blocking Gemini calls throughput should
+scale with concurrency and health checks should stay fast under load.
+
+    python load_test.py <document_id> [<document_id> ...] [--levels 1 2 4 8] [--requests-per-level 16]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+ORCHESTRATION_AGENT_URL = "http://localhost:8005"
+PROMPTS = [
+    "Chi sono le parti del contratto?",
+    "Quali sono le date di scadenza?",
+    "Riassumi gli obblighi principali delle parti.",
+    "Ci sono clausole di recesso?",
+]
+
+
+async def probe_health(client: httpx.AsyncClient, url: str, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            response = await client.get(url, timeout=30.0)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            print(f"⚠️ Health probe failed: {e}")
+        await asyncio.sleep(0.25)
+
+
+async def run_level(base_url: str, document_ids, concurrency: int, total_requests: int):
+    url = f"{base_url}/api/v1/agents/orchestrate"
+    latencies = []
+    health_latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(timeout=300.0,
+                                 limits=httpx.Limits(max_connections=concurrency + 1)) as client:
+        async def one_request(i: int):
+            nonlocal errors
+            payload = {"document_ids": document_ids, "prompt": PROMPTS[i % len(PROMPTS)]}
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json=payload)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    errors += 1
+                    print(f"❌ Request {i} failed: {e}")
+
+        prober = asyncio.create_task(probe_health(client, f"{base_url}/health", stop, health_latencies))
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request(i) for i in range(total_requests)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+
+    throughput = len(latencies) / elapsed if elapsed > 0 else 0.0
+    print(f"\n📊 Concurrency {concurrency}: {total_requests} orchestrations")
+    print(f"   Elapsed:      {elapsed:.2f}s")
+    print(f"   Throughput:   {throughput:.2f} orchestrations/s")
+    print(f"   Errors:       {errors}")
+    if latencies:
+        print(f"   p50 latency:  {statistics.median(latencies):.2f}s")
+        print(f"   max latency:  {max(latencies):.2f}s")
+    if health_latencies:
+        print(f"   /health p50:  {statistics.median(health_latencies) * 1000:.0f} ms "
+              f"(max {max(health_latencies) * 1000:.0f} ms)")
+    return throughput
+
+
+async def run_load_test(base_url: str, document_ids, levels, requests_per_level: int):
+    results = []
+    for concurrency in levels:
+        results.append((concurrency, await run_level(base_url, document_ids, concurrency,
+                                                     max(requests_per_level, concurrency))))
+
+    print("\n📈 Scaling")
+    baseline = results[0][1] or 1e-9
+    for concurrency, throughput in results:
+        print(f"   concurrency {concurrency:>3}: {throughput:6.2f} orch/s  ({throughput / baseline:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the orchestration endpoint")
+    parser.add_argument("document_ids", nargs="+")
+    parser.add_argument("--url", default=ORCHESTRATION_AGENT_URL)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests-per-level", type=int, default=16)
+    args = parser.parse_args()
+
+    asyncio.run(run_load_test(args.url, args.document_ids, args.levels, args.requests_per_level))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ import org.springframework.validation.annotation.Validated;
 import org.springframework.web.bind.annotation.*;
 import org.springframework.web.server.ResponseStatusException;
 import org.springframework.web.reactive.function.client.*;
+import reactor.core.publisher.Mono;
 import reactor.netty.http.client.HttpClient;
 
 import java.time.Duration;
@@ -69,6 +70,7 @@ public class OrchestrationWrapperApplication {
   @org.springframework.stereotype.Service
   public static class DownstreamService {
     private static final Logger log = LoggerFactory.getLogger(DownstreamService.class);
+    public static final String TIME_BUDGET_HEADER = "X-Time-Budget-Ms";
     private final WebClient webClient;
     private final int retryAttempts;
 
@@ -80,22 +82,37 @@ public class OrchestrationWrapperApplication {
     public record HttpResult(int status, String body) {}
 
     public HttpResult postJson(String url, Map<String, Object> body, String executionId) {
-      Supplier<HttpResult> call = () -> webClient.post()
-          .uri(url)
-          .headers(h -> {
-            if (executionId != null && !executionId.isBlank()) h.add("X-Execution-Id", executionId);
-          })
-          .contentType(MediaType.APPLICATION_JSON)
-          .bodyValue(body == null ? Map.of() : body)
-          .exchangeToMono(resp -> resp.bodyToMono(String.class).defaultIfEmpty("")
-              .map(b -> new HttpResult(resp.statusCode().value(), b)))
-          .block();
+      return postJson(url, body, executionId, null);
+    }
+
+    // budgetMs (caller's X-Time-Budget-Ms): each attempt gets what is left of it, and is told so downstream
+    public HttpResult postJson(String url, Map<String, Object> body, String executionId, Long budgetMs) {
+      long deadline = budgetMs == null ? 0 : System.nanoTime() + Duration.ofMillis(budgetMs).toNanos();
 
       Exception last = null;
       for (int i = 1; i <= retryAttempts; i++) {
+        Long remainingMs = budgetMs == null ? null : Duration.ofNanos(deadline - System.nanoTime()).toMillis();
+        if (remainingMs != null && remainingMs <= 0) {
+          log.warn("time budget of {}ms exhausted after {} attempt(s)", budgetMs, i - 1);
+          break;
+        }
+        Supplier<HttpResult> call = () -> {
+          Mono<HttpResult> result = webClient.post()
+              .uri(url)
+              .headers(h -> {
+                if (executionId != null && !executionId.isBlank()) h.add("X-Execution-Id", executionId);
+                if (remainingMs != null) h.add(TIME_BUDGET_HEADER, String.valueOf(remainingMs));
+              })
+              .contentType(MediaType.APPLICATION_JSON)
+              .bodyValue(body == null ? Map.of() : body)
+              .exchangeToMono(resp -> resp.bodyToMono(String.class).defaultIfEmpty("")
+                  .map(b -> new HttpResult(resp.statusCode().value(), b)));
+          return (remainingMs == null ? result : result.timeout(Duration.ofMillis(remainingMs))).block();
+        };
         try { return call.get(); }
         catch (Exception e) { last = e; log.warn("retry {}/{} failed: {}", i, retryAttempts, e.toString()); }
       }
+      if (last == null) throw new ResponseStatusException(HttpStatus.GATEWAY_TIMEOUT, "Time budget exhausted");
       throw new RuntimeException(last);
     }
   }
@@ -112,6 +129,7 @@ public class OrchestrationWrapperApplication {
     private List<String> documentIds = new ArrayList<>();
     private String executionId;
     private Boolean fullDoc;
+    private Map<String, String> documentTexts;
 
     public String getAgentId() { return agentId; }
     public void setAgentId(String agentId) { this.agentId = agentId; }
@@ -123,6 +141,8 @@ public class OrchestrationWrapperApplication {
     public void setExecutionId(String executionId) { this.executionId = executionId; }
     public Boolean getFullDoc() { return fullDoc; }
     public void setFullDoc(Boolean fullDoc) { this.fullDoc = fullDoc; }
+    public Map<String, String> getDocumentTexts() { return documentTexts; }
+    public void setDocumentTexts(Map<String, String> documentTexts) { this.documentTexts = documentTexts; }
   }
 
   @JsonInclude(JsonInclude.Include.NON_NULL)
@@ -158,6 +178,8 @@ public class OrchestrationWrapperApplication {
     @NotBlank private String prompt;
     private String agent_id = "orchestration-agent";
     private String execution_id;
+    private Boolean bypass_cache;
+    private Double deadline_seconds;
 
     public List<String> getDocument_ids() { return document_ids; }
     public void setDocument_ids(List<String> document_ids) { this.document_ids = document_ids; }
@@ -169,6 +191,10 @@ public class OrchestrationWrapperApplication {
     public void setAgent_id(String agent_id) { this.agent_id = agent_id; }
     public String getExecution_id() { return execution_id; }
     public void setExecution_id(String execution_id) { this.execution_id = execution_id; }
+    public Boolean getBypass_cache() { return bypass_cache; }
+    public void setBypass_cache(Boolean bypass_cache) { this.bypass_cache = bypass_cache; }
+    public Double getDeadline_seconds() { return deadline_seconds; }
+    public void setDeadline_seconds(Double deadline_seconds) { this.deadline_seconds = deadline_seconds; }
   }
 
   public static class OrchestrateOut {
@@ -180,6 +206,7 @@ public class OrchestrationWrapperApplication {
     public List<Map<String,Object>> actions_taken;
     public String final_response;
     public String message;
+    public String cache;
   }
 
   // Controller
@@ -197,6 +224,8 @@ public class OrchestrationWrapperApplication {
     @Value("${ORCHESTRATION_AGENT_URL:http://orchestration-agent:8005}") private String ORCHESTRATION_AGENT_URL;
     @Value("${REQUEST_TIMEOUT_SECONDS:60}") private double REQUEST_TIMEOUT_SECONDS;
     @Value("${RETRY_ATTEMPTS:1}")          private int RETRY_ATTEMPTS;
+    // Kept back from REQUEST_TIMEOUT_SECONDS so downstreams answer before the WebClient cuts them off
+    @Value("${TIME_BUDGET_MARGIN_MS:2000}") private long TIME_BUDGET_MARGIN_MS;
 
     public WrapperController(DownstreamService ds) { this.ds = ds; }
 
@@ -212,23 +241,26 @@ public class OrchestrationWrapperApplication {
               "orchestration", ORCHESTRATION_AGENT_URL
           ),
           "timeouts", REQUEST_TIMEOUT_SECONDS,
+          "time_budget_ms", maxBudgetMs(),
           "retries", RETRY_ATTEMPTS
       );
     }
 
     @PostMapping("/api/v1/agents/search")
     public SearchOut search(@Valid @RequestBody SearchIn in,
-                            @RequestHeader(value="X-Execution-Id", required=false) String xExecId) {
+                            @RequestHeader(value="X-Execution-Id", required=false) String xExecId,
+                            @RequestHeader(value=DownstreamService.TIME_BUDGET_HEADER, required=false) String xBudget) {
+      Long budgetMs = budgetMs(xBudget);
       String agentId = (in.agent_id() == null || in.agent_id().isBlank()) ? "search-agent" : in.agent_id();
 
       Map<String,Object> newBody = Map.of("query", in.query(), "agent_id", agentId);
       DownstreamService.HttpResult r1 =
-          ds.postJson(SEARCH_AGENT_URL + "/api/v1/agents/search", newBody, xExecId);
+          ds.postJson(SEARCH_AGENT_URL + "/api/v1/agents/search", newBody, xExecId, budgetMs);
 
       DownstreamService.HttpResult resp = r1;
       if (r1.status == 404) {
         Map<String,Object> oldBody = Map.of("query", in.query(), "max_results", 5, "include_sources", true);
-        resp = ds.postJson(SEARCH_AGENT_URL + "/api/v1/search", oldBody, xExecId);
+        resp = ds.postJson(SEARCH_AGENT_URL + "/api/v1/search", oldBody, xExecId, budgetMs);
       }
       if (resp.status != 200) throw status(resp.status, resp.body);
 
@@ -246,7 +278,8 @@ public class OrchestrationWrapperApplication {
 
     @PostMapping("/api/v1/agents/process")
     public AgentOut process(@Valid @RequestBody ProcessIn in,
-                            @RequestHeader(value="X-Execution-Id", required=false) String xExecId) {
+                            @RequestHeader(value="X-Execution-Id", required=false) String xExecId,
+                            @RequestHeader(value=DownstreamService.TIME_BUDGET_HEADER, required=false) String xBudget) {
       String agentNorm = in.getAgentId();
       String baseUrl;
       if ("extractor-agent".equals(agentNorm) || "extraction-agent".equals(agentNorm)) {
@@ -266,10 +299,14 @@ public class OrchestrationWrapperApplication {
       if ("generation-agent".equals(agentNorm)) {
         body.put("fullDoc", Boolean.TRUE.equals(in.getFullDoc()));
       }
+      // Document text already fetched by the orchestrator, so the agent can skip its own fetch
+      if (in.getDocumentTexts() != null && !in.getDocumentTexts().isEmpty()) {
+        body.put("documentTexts", in.getDocumentTexts());
+      }
 
       String corr = in.getExecutionId() != null ? in.getExecutionId() : xExecId;
       DownstreamService.HttpResult resp =
-          ds.postJson(baseUrl + "/api/v1/agents/process", body, corr);
+          ds.postJson(baseUrl + "/api/v1/agents/process", body, corr, budgetMs(xBudget));
 
       if (resp.status != 200) throw status(resp.status, resp.body);
 
@@ -306,7 +343,8 @@ public class OrchestrationWrapperApplication {
 
     @PostMapping("/api/v1/agents/orchestrate")
     public OrchestrateOut orchestrate(@Valid @RequestBody OrchestrateIn in,
-                                      @RequestHeader(value="X-Execution-Id", required=false) String xExecId) {
+                                      @RequestHeader(value="X-Execution-Id", required=false) String xExecId,
+                                      @RequestHeader(value=DownstreamService.TIME_BUDGET_HEADER, required=false) String xBudget) {
 
       List<String> docIds = (in.getDocument_ids() != null) ? in.getDocument_ids() : in.getDocumentIds();
       if (docIds == null || docIds.isEmpty() || in.getPrompt() == null || in.getPrompt().isBlank()) {
@@ -317,16 +355,19 @@ public class OrchestrationWrapperApplication {
       body.put("document_ids", docIds);
       body.put("prompt", in.getPrompt());
       body.put("agent_id", "orchestration-agent");
-      body.put("execution_id", in.getExecution_id());
-
+      // Execution id from the body or the header: the agent persists and resumes runs under it
       String corr = in.getExecution_id() != null ? in.getExecution_id() : xExecId;
+      body.put("execution_id", corr);
+      body.put("bypass_cache", Boolean.TRUE.equals(in.getBypass_cache()));
+      if (in.getDeadline_seconds() != null) body.put("deadline_seconds", in.getDeadline_seconds());
+
       DownstreamService.HttpResult resp =
-          ds.postJson(ORCHESTRATION_AGENT_URL + "/api/v1/agents/orchestrate", body, corr);
+          ds.postJson(ORCHESTRATION_AGENT_URL + "/api/v1/agents/orchestrate", body, corr, budgetMs(xBudget));
 
       if (resp.status != 200) throw status(resp.status, resp.body);
 
       try {
-        return new ObjectMapper().readValue(resp.body, OrchestrateOut.class);
+        return mapper.readValue(resp.body, OrchestrateOut.class);
       } catch (Exception e) {
         throw status(HttpStatus.BAD_GATEWAY, "Invalid JSON from orchestration-agent");
       }
@@ -334,8 +375,26 @@ public class OrchestrationWrapperApplication {
 
     @PostMapping("/api/v1/orchestrate")
     public OrchestrateOut orchestrateAlias(@Valid @RequestBody OrchestrateIn in,
-                                           @RequestHeader(value="X-Execution-Id", required=false) String xExecId) {
-      return orchestrate(in, xExecId);
+                                           @RequestHeader(value="X-Execution-Id", required=false) String xExecId,
+                                           @RequestHeader(value=DownstreamService.TIME_BUDGET_HEADER, required=false) String xBudget) {
+      return orchestrate(in, xExecId, xBudget);
+    }
+
+    // Time budget for the downstream call: the caller's X-Time-Budget-Ms, at most (and, if absent
+    // or invalid, exactly) what the WebClient allows, so downstreams never plan past our own timeout
+    private Long budgetMs(String header) {
+      long max = maxBudgetMs();
+      if (header == null || header.isBlank()) return max;
+      try {
+        long ms = Long.parseLong(header.trim());
+        return ms > 0 ? Math.min(ms, max) : max;
+      } catch (NumberFormatException e) {
+        return max;
+      }
+    }
+
+    private long maxBudgetMs() {
+      return Math.max(1000L, (long) (REQUEST_TIMEOUT_SECONDS * 1000) - TIME_BUDGET_MARGIN_MS);
     }
 
     private ResponseStatusException status(int code, String body) {